@@ -0,0 +1,104 @@
+"""
+Password hashing service shared by server.py and update_passwords.py.
+
+Hashes are scrypt with a per-password salt, stored as ``scrypt$n$r$p$salt$hash``.
+The KDF costs tens of milliseconds of CPU on purpose, so the server never runs it on the
+event loop: ``hash_password_async`` / ``verify_password_async`` hand it to a bounded process
+pool (processes, because hashlib only releases the GIL for part of the work).
+Legacy unsalted SHA-256 hashes still verify and ``needs_rehash`` tells login to upgrade them.
+"""
+
+import asyncio
+import base64
+import hashlib
+import hmac
+import os
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Sequence
+
+# scrypt cost: N (CPU/memory, power of two), r (block size), p (parallelism). Memory is 128 * N * r bytes
+SCRYPT_N = int(os.environ.get("PASSWORD_SCRYPT_N", "16384"))
+SCRYPT_R = int(os.environ.get("PASSWORD_SCRYPT_R", "8"))
+SCRYPT_P = int(os.environ.get("PASSWORD_SCRYPT_P", "1"))
+SCRYPT_SALT_BYTES = 16
+SCRYPT_KEY_BYTES = 32
+# Worker processes per server process (uvicorn workers each get their own pool)
+PASSWORD_HASH_WORKERS = max(1, int(os.environ.get("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1)))))
+
+LEGACY_SHA256_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+def _b64encode(raw: bytes) -> str:
+    return base64.b64encode(raw).decode("ascii").rstrip("=")
+
+def _b64decode(text: str) -> bytes:
+    return base64.b64decode(text + "=" * (-len(text) % 4))
+
+def _scrypt(password: str, salt: bytes, n: int, r: int, p: int) -> bytes:
+    return hashlib.scrypt(
+        password.encode(), salt=salt, n=n, r=r, p=p,
+        maxmem=256 * n * r + 1024 * 1024, dklen=SCRYPT_KEY_BYTES
+    )
+
+def hash_password(password: str, n: int = SCRYPT_N, r: int = SCRYPT_R, p: int = SCRYPT_P) -> str:
+    """scrypt hash with a fresh salt (blocking: use hash_password_async from request handlers)"""
+    salt = os.urandom(SCRYPT_SALT_BYTES)
+    return f"scrypt${n}${r}${p}${_b64encode(salt)}${_b64encode(_scrypt(password, salt, n, r, p))}"
+
+def is_legacy_hash(hashed: Optional[str]) -> bool:
+    return bool(hashed) and LEGACY_SHA256_PATTERN.match(hashed) is not None
+
+def verify_password(password: str, hashed: Optional[str]) -> bool:
+    """Constant-time check against a scrypt hash or a legacy unsalted SHA-256 hex digest"""
+    if not hashed:
+        return False
+    if is_legacy_hash(hashed):
+        return hmac.compare_digest(hashlib.sha256(password.encode()).hexdigest(), hashed)
+    try:
+        scheme, n, r, p, salt, expected = hashed.split("$")
+        if scheme != "scrypt":
+            return False
+        return hmac.compare_digest(_scrypt(password, _b64decode(salt), int(n), int(r), int(p)), _b64decode(expected))
+    except ValueError:
+        return False
+
+def needs_rehash(hashed: Optional[str]) -> bool:
+    """True for legacy hashes and for scrypt hashes made with a different cost than the configured one"""
+    if not hashed or is_legacy_hash(hashed):
+        return True
+    return not hashed.startswith(f"scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}$")
+
+# Process pool, created on first use so importing this module stays cheap
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+def get_hash_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=PASSWORD_HASH_WORKERS)
+        return _pool
+
+def shutdown_hash_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+async def hash_password_async(password: str) -> str:
+    return await asyncio.get_running_loop().run_in_executor(get_hash_pool(), hash_password, password)
+
+async def verify_password_async(password: str, hashed: Optional[str]) -> bool:
+    # Legacy SHA-256 is microseconds: not worth the round trip to a worker
+    if not hashed or is_legacy_hash(hashed):
+        return verify_password(password, hashed)
+    return await asyncio.get_running_loop().run_in_executor(get_hash_pool(), verify_password, password, hashed)
+
+def hash_passwords(passwords: Sequence[str]) -> List[str]:
+    """Hash many passwords in parallel on the pool, each with its own salt (blocking, order preserved)"""
+    if not passwords:
+        return []
+    chunksize = max(1, len(passwords) // (PASSWORD_HASH_WORKERS * 4))
+    return list(get_hash_pool().map(hash_password, passwords, chunksize=chunksize))
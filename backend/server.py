@@ -1,52 +1,183 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Query, Request, Response
+from fastapi.responses import JSONResponse
+from fastapi.encoders import jsonable_encoder
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.datastructures import Headers, MutableHeaders
 import os
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Literal
 import uuid
 from datetime import datetime, timezone, time, date, timedelta
 import hashlib
+import gzip
+import json
 import jwt
+import asyncio
+import bisect
+import threading
+import re
+import sqlite3
+import shutil
+import smtplib
+import tempfile
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from email.message import EmailMessage
 from enum import Enum
+from time import perf_counter
+import numpy as np
+
+try:
+    import brotli  # optional: pip install brotli
+except ImportError:
+    brotli = None
 
 # SQLAlchemy imports
-from sqlalchemy import create_engine, Column, String, Integer, Boolean, DateTime, Date, Time, Text, ForeignKey, Index, UniqueConstraint, Enum as SQLEnum
-from sqlalchemy.types import DECIMAL
+from sqlalchemy import create_engine, event, func, or_, Column, String, Integer, Boolean, DateTime, Date, Time, Text, LargeBinary, ForeignKey, Index, UniqueConstraint, Enum as SQLEnum
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.engine import Engine
 from sqlalchemy.orm import sessionmaker, Session, relationship
 from sqlalchemy.dialects.mysql import JSON
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
+# Password hashing service (scrypt on a process pool); imported after .env so its cost settings apply
+from passwords import (
+    hash_password, verify_password, needs_rehash, hash_password_async, verify_password_async,
+    hash_passwords, get_hash_pool, shutdown_hash_pool
+)
+
 # Database configuration - SQLite Local Database
-DATABASE_FILE = "/app/planshift.db"
+# The main database holds users and the site registry, and is also the database of the default site
+DATABASE_FILE = os.environ.get("DATABASE_FILE", "/app/planshift.db")
 DATABASE_URL = f"sqlite:///{DATABASE_FILE}"
+# Every other site keeps its resources, time slots, shifts and plans in its own file
+SITES_DIR = os.environ.get("SITES_DIR", str(Path(DATABASE_FILE).parent / "sites"))
+DEFAULT_SITE_ID = "main"
 
 print(f"🔗 Using SQLite local database: {DATABASE_FILE}")
 print(f"✅ SQLite database configured successfully")
 
 # Database Engine Configuration for SQLite
-engine = create_engine(
-    DATABASE_URL, 
-    echo=False,
-    # SQLite-specific configurations
-    connect_args={"check_same_thread": False},  # Allow SQLite to be used across threads
-    pool_pre_ping=False  # Not needed for SQLite
-)
+def create_sqlite_engine(database_file: str):
+    return create_engine(
+        f"sqlite:///{database_file}",
+        echo=False,
+        # SQLite-specific configurations
+        connect_args={"check_same_thread": False},  # Allow SQLite to be used across threads
+        pool_pre_ping=False  # Not needed for SQLite
+    )
+
+@event.listens_for(Engine, "connect")
+def _configure_sqlite_connection(dbapi_connection, connection_record):
+    # WAL lets several worker processes read while one writes; wait for the write lock instead of failing
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA busy_timeout=5000")
+        cursor.close()
+
+engine = create_sqlite_engine(DATABASE_FILE)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
 # Create tables in database
 def create_db_and_tables():
-    """Create all database tables"""
-    Base.metadata.create_all(bind=engine)
+    """Create or upgrade all database tables through the migration runner"""
+    run_migrations(engine)
     print("✅ Database tables created/verified")
 
+# Response Compression
+COMPRESSION_MIN_SIZE = int(os.environ.get("COMPRESSION_MIN_SIZE", "1000"))
+
+def accepts_encoding(accept_encoding: str, coding: str) -> bool:
+    """Whether an Accept-Encoding header allows `coding`: listed (or covered by *) with q > 0"""
+    wildcard = False
+    for item in accept_encoding.split(","):
+        name, _, params = item.partition(";")
+        name = name.strip().lower()
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if name == coding:
+            return quality > 0
+        if name == "*":
+            wildcard = quality > 0
+    return wildcard
+
+def response_encoding(accept_encoding: str) -> Optional[str]:
+    """Content coding CompressionMiddleware uses for a client (bodies above the minimum size): br, gzip or None"""
+    if brotli is not None and accepts_encoding(accept_encoding, "br"):
+        return "br"
+    if accepts_encoding(accept_encoding, "gzip"):
+        return "gzip"
+    return None
+
+def merged_vary(send):
+    """Collapse repeated Vary values (an endpoint and GZipMiddleware may both add Accept-Encoding)"""
+    async def wrapped(message):
+        if message["type"] == "http.response.start":
+            headers = MutableHeaders(raw=message["headers"])
+            if "vary" in headers:
+                headers["Vary"] = ", ".join(dict.fromkeys(value.strip() for value in headers["vary"].split(",")))
+        await send(message)
+    return wrapped
+
+class CompressionMiddleware:
+    """brotli when the optional brotli package is installed and the client accepts it, gzip otherwise"""
+    def __init__(self, app, minimum_size: int = 1000):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip = GZipMiddleware(app, minimum_size=minimum_size, compresslevel=6)
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = response_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding != "br":
+            # GZipMiddleware only looks for the substring "gzip", so a refused gzip;q=0 is handled here
+            await (self.gzip if encoding == "gzip" else self.app)(scope, receive, merged_vary(send))
+            return
+        
+        start_message = {}
+        chunks = []
+        
+        async def send_with_brotli(message):
+            nonlocal start_message
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+            chunks.append(message.get("body", b""))
+            if message.get("more_body", False):
+                return
+            
+            body = b"".join(chunks)
+            headers = MutableHeaders(raw=start_message["headers"])
+            if len(body) >= self.minimum_size and "content-encoding" not in headers:
+                body = brotli.compress(body, quality=5)
+                headers["Content-Encoding"] = "br"
+                headers["Content-Length"] = str(len(body))
+                headers.add_vary_header("Accept-Encoding")
+            await merged_vary(send)(start_message)
+            await send({"type": "http.response.body", "body": body})
+        
+        await self.app(scope, receive, send_with_brotli)
+
 # Create the main app
 app = FastAPI(title="PlanShift API", version="1.0.0")
 api_router = APIRouter(prefix="/api")
@@ -62,6 +193,17 @@ class UserRole(str, Enum):
     ADMIN = "ADMIN"
     EMPLOYEE = "EMPLOYEE"
 
+class UnavailabilityReason(str, Enum):
+    VACATION = "VACATION"
+    SICK = "SICK"
+    OTHER = "OTHER"
+
+UNAVAILABILITY_REASON_LABELS = {
+    UnavailabilityReason.VACATION: "ferie",
+    UnavailabilityReason.SICK: "malattia",
+    UnavailabilityReason.OTHER: "assenza",
+}
+
 # SQLAlchemy Models
 class UserDB(Base):
     __tablename__ = "users"
@@ -74,6 +216,17 @@ class UserDB(Base):
     role = Column(SQLEnum(UserRole), nullable=False, default=UserRole.EMPLOYEE, index=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     is_active = Column(Boolean, default=True)
+    site_id = Column(String(50), nullable=True, index=True)
+
+class SiteDB(Base):
+    """A location with its own schedule database (main database only)"""
+    __tablename__ = "sites"
+    
+    id = Column(String(50), primary_key=True)
+    name = Column(String(100), nullable=False)
+    database_file = Column(String(255), nullable=False)
+    is_active = Column(Boolean, default=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
 
 class ResourceDB(Base):
     __tablename__ = "resources"
@@ -83,6 +236,10 @@ class ResourceDB(Base):
     email = Column(String(100), unique=True, nullable=False, index=True)
     weekly_hour_limit = Column(Integer, default=40)
     min_rest_hours = Column(Integer, default=12)
+    # Rolling-window limits (NULL = not enforced)
+    max_avg_hours_4_weeks = Column(Integer, nullable=True)
+    max_avg_hours_17_weeks = Column(Integer, nullable=True)
+    max_consecutive_days = Column(Integer, nullable=True)
     is_active = Column(Boolean, default=True, index=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     
@@ -111,9 +268,10 @@ class ShiftDB(Base):
     date = Column(Date, nullable=False)
     week_number = Column(Integer, nullable=False)
     year = Column(Integer, nullable=False)
-    hours = Column(DECIMAL(4, 2), nullable=False, default=0.00)
-    overtime_hours = Column(DECIMAL(4, 2), default=0.00)
-    extra_overtime_hours = Column(DECIMAL(4, 2), default=0.00)
+    # Durations are stored as exact integer minutes; the API still speaks hours
+    minutes = Column(Integer, nullable=False, default=0)
+    overtime_minutes = Column(Integer, nullable=False, default=0)
+    extra_overtime_minutes = Column(Integer, nullable=False, default=0)
     created_at = Column(DateTime, default=datetime.utcnow)
     
     # Relationships
@@ -122,12 +280,50 @@ class ShiftDB(Base):
     
     # Indexes and constraints
     __table_args__ = (
-        Index('idx_shifts_resource_date', 'resource_id', 'date'),
+        # Covers the rolling-limit loads (minutes per resource and day) and any per-resource date range
+        Index('idx_shifts_resource_date_minutes', 'resource_id', 'date', 'minutes'),
         Index('idx_shifts_week_year', 'week_number', 'year'),
-        Index('idx_shifts_date', 'date'),
+        # Covers the day x slot x resource matrix reads (and any plain date range)
+        Index('idx_shifts_date_slot_resource', 'date', 'time_slot_id', 'resource_id'),
+        Index('idx_shifts_time_slot_date', 'time_slot_id', 'date'),
+        Index('idx_shifts_resource_week_year', 'resource_id', 'week_number', 'year'),
         UniqueConstraint('resource_id', 'date', name='unique_resource_date'),
     )
 
+class UnavailabilityDB(Base):
+    """Leave, sickness or other absence of a resource over [start_at, end_at)"""
+    __tablename__ = "unavailabilities"
+    
+    id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    resource_id = Column(String(36), ForeignKey("resources.id", ondelete="CASCADE"), nullable=False)
+    start_at = Column(DateTime, nullable=False)
+    end_at = Column(DateTime, nullable=False)
+    reason = Column(SQLEnum(UnavailabilityReason), nullable=False, default=UnavailabilityReason.OTHER)
+    note = Column(String(255), nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        Index('idx_unavailabilities_resource_end', 'resource_id', 'end_at'),
+        Index('idx_unavailabilities_end', 'end_at'),
+    )
+
+class CoverageTargetDB(Base):
+    """People needed in a time slot, per weekday (0 = Monday) or for a single date overriding it"""
+    __tablename__ = "coverage_targets"
+    
+    id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    time_slot_id = Column(String(36), ForeignKey("time_slots.id", ondelete="CASCADE"), nullable=False)
+    weekday = Column(Integer, nullable=True)
+    date = Column(Date, nullable=True)
+    required = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        UniqueConstraint('time_slot_id', 'weekday', name='unique_coverage_slot_weekday'),
+        UniqueConstraint('time_slot_id', 'date', name='unique_coverage_slot_date'),
+        Index('idx_coverage_targets_date', 'date'),
+    )
+
 class WeeklyPlanDB(Base):
     __tablename__ = "weekly_plans"
     
@@ -159,13 +355,696 @@ class PublicationDB(Base):
         Index('idx_publications_published_by', 'published_by'),
     )
 
-# Create tables if they don't exist
-try:
-    Base.metadata.create_all(bind=engine)
-    print("✅ Database tables created/verified successfully")
-except Exception as e:
-    print(f"⚠️ Database setup warning: {e}")
-    # Tables might already exist, continue anyway
+class PublishedSnapshotDB(Base):
+    """Immutable copy of a week frozen at publish time (gzip-compressed JSON array of shifts)"""
+    __tablename__ = "published_snapshots"
+    
+    id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    week_number = Column(Integer, nullable=False)
+    year = Column(Integer, nullable=False)
+    version = Column(Integer, nullable=False, default=1)
+    publication_id = Column(String(36), ForeignKey("publications.id", ondelete="CASCADE"), nullable=True)
+    payload = Column(LargeBinary, nullable=False)
+    content_hash = Column(String(64), nullable=False)
+    shift_count = Column(Integer, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        UniqueConstraint('week_number', 'year', 'version', name='unique_snapshot_week_year_version'),
+        Index('idx_published_snapshots_week_year', 'week_number', 'year'),
+    )
+
+class JobDB(Base):
+    """Background job (main database); progress and result are polled through /api/jobs/{id}"""
+    __tablename__ = "jobs"
+    
+    id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    kind = Column(String(50), nullable=False)
+    status = Column(String(20), nullable=False, default="queued", index=True)
+    site_id = Column(String(50), nullable=True)
+    params = Column(JSON, nullable=True)
+    progress = Column(Integer, default=0)
+    progress_message = Column(String(255), nullable=True)
+    result = Column(JSON, nullable=True)
+    error = Column(Text, nullable=True)
+    cancel_requested = Column(Boolean, default=False)
+    created_by = Column(String(36), nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    # Runner (process) executing a running job and its last sign of life; expired leases get requeued
+    owner = Column(String(64), nullable=True)
+    heartbeat_at = Column(DateTime, nullable=True)
+
+class JournalOperationDB(Base):
+    """One user-level scheduling edit with its shift changes, for undo/redo (id orders operations)"""
+    __tablename__ = "journal_operations"
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(String(36), nullable=True)
+    label = Column(String(255), nullable=True)
+    # Compact change records: ["+" or "-", *SHIFT_JOURNAL_FIELDS values]
+    changes = Column(JSON, nullable=False)
+    change_count = Column(Integer, nullable=False, default=0)
+    undone = Column(Boolean, nullable=False, default=False, index=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class ShiftArchiveDB(Base):
+    """One week moved out of the live shifts table: its shifts as gzip-compressed JSON rows of SHIFT_ARCHIVE_FIELDS"""
+    __tablename__ = "shift_archive"
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    week_number = Column(Integer, nullable=False)
+    year = Column(Integer, nullable=False)
+    first_date = Column(Date, nullable=False)
+    last_date = Column(Date, nullable=False)
+    shift_count = Column(Integer, nullable=False, default=0)
+    total_minutes = Column(Integer, nullable=False, default=0)
+    total_overtime_minutes = Column(Integer, nullable=False, default=0)
+    payload = Column(LargeBinary, nullable=False)
+    archived_at = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        UniqueConstraint('week_number', 'year', name='unique_shift_archive_week_year'),
+        Index('idx_shift_archive_dates', 'first_date', 'last_date'),
+    )
+
+class NotificationEventDB(Base):
+    """Outbox row written in the publish transaction; the dispatcher fans it out into notifications"""
+    __tablename__ = "notification_events"
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    kind = Column(String(50), nullable=False)
+    publication_id = Column(String(36), nullable=True)
+    week_number = Column(Integer, nullable=True)
+    year = Column(Integer, nullable=True)
+    status = Column(String(20), nullable=False, default="pending", index=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class NotificationDB(Base):
+    """One e-mail to one person; pending -> sending -> sent, or dead after NOTIFY_MAX_ATTEMPTS failures"""
+    __tablename__ = "notifications"
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    event_id = Column(Integer, nullable=False, index=True)
+    resource_id = Column(String(36), nullable=True)
+    recipient = Column(String(100), nullable=False)
+    subject = Column(String(255), nullable=False)
+    body = Column(Text, nullable=False)
+    status = Column(String(20), nullable=False, default="pending")
+    attempts = Column(Integer, nullable=False, default=0)
+    # Earliest next delivery attempt; for "sending" rows the end of the dispatcher's lease
+    next_attempt_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    claim = Column(String(36), nullable=True)
+    last_error = Column(Text, nullable=True)
+    sent_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        Index('idx_notifications_status_next_attempt', 'status', 'next_attempt_at'),
+    )
+
+class DataVersionDB(Base):
+    """Counter per data scope, bumped in the same transaction as every write to that scope"""
+    __tablename__ = "data_versions"
+    
+    scope = Column(String(100), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+class WeekVersionDB(Base):
+    """Optimistic-concurrency version of a week's schedule, moved on by every change to its shifts"""
+    __tablename__ = "week_versions"
+    
+    year = Column(Integer, primary_key=True)
+    week_number = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+class SchemaMigrationDB(Base):
+    __tablename__ = "schema_migrations"
+    
+    version = Column(Integer, primary_key=True)
+    name = Column(String(100), nullable=False)
+    applied_at = Column(DateTime, default=datetime.utcnow)
+
+# Schema Migrations
+def column_exists(conn, table: str, column: str) -> bool:
+    return any(row[1] == column for row in conn.exec_driver_sql(f"PRAGMA table_info({table})"))
+
+def migration_001_baseline(conn):
+    """Tables as they existed before versioned migrations"""
+    Base.metadata.create_all(bind=conn, tables=[
+        UserDB.__table__, ResourceDB.__table__, TimeSlotDB.__table__, ShiftDB.__table__,
+        WeeklyPlanDB.__table__, PublicationDB.__table__, PublishedSnapshotDB.__table__
+    ])
+
+def migration_002_hot_query_indexes(conn):
+    """Indexes for time slot lookups and the weekly-limit check"""
+    conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS idx_shifts_time_slot_date ON shifts (time_slot_id, date)")
+    conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS idx_shifts_resource_week_year ON shifts (resource_id, week_number, year)")
+    conn.exec_driver_sql("ANALYZE")
+
+def migration_003_shift_minutes(conn):
+    """DECIMAL hour columns -> integer minute columns (table rebuild, SQLite cannot alter column types)"""
+    if column_exists(conn, "shifts", "minutes"):
+        return
+    conn.exec_driver_sql("ALTER TABLE shifts RENAME TO shifts_decimal")
+    for index in ("idx_shifts_resource_date", "idx_shifts_week_year", "idx_shifts_date",
+                  "idx_shifts_time_slot_date", "idx_shifts_resource_week_year"):
+        conn.exec_driver_sql(f"DROP INDEX IF EXISTS {index}")
+    Base.metadata.create_all(bind=conn, tables=[ShiftDB.__table__])
+    conn.exec_driver_sql("""
+        INSERT INTO shifts (id, resource_id, time_slot_id, date, week_number, year,
+                            minutes, overtime_minutes, extra_overtime_minutes, created_at)
+        SELECT id, resource_id, time_slot_id, date, week_number, year,
+               CAST(ROUND(COALESCE(hours, 0) * 60) AS INTEGER),
+               CAST(ROUND(COALESCE(overtime_hours, 0) * 60) AS INTEGER),
+               CAST(ROUND(COALESCE(extra_overtime_hours, 0) * 60) AS INTEGER),
+               created_at
+        FROM shifts_decimal
+    """)
+    conn.exec_driver_sql("DROP TABLE shifts_decimal")
+
+def migration_004_sites(conn):
+    """Site registry and the site of each user"""
+    Base.metadata.create_all(bind=conn, tables=[SiteDB.__table__])
+    if not column_exists(conn, "users", "site_id"):
+        conn.exec_driver_sql("ALTER TABLE users ADD COLUMN site_id VARCHAR(50)")
+    conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_users_site_id ON users (site_id)")
+
+def migration_005_data_versions(conn):
+    """Per-scope data versions used to invalidate caches across worker processes"""
+    Base.metadata.create_all(bind=conn, tables=[DataVersionDB.__table__])
+
+def migration_006_jobs(conn):
+    """Durable background jobs"""
+    Base.metadata.create_all(bind=conn, tables=[JobDB.__table__])
+
+def migration_007_unavailability(conn):
+    """Resource unavailability intervals"""
+    Base.metadata.create_all(bind=conn, tables=[UnavailabilityDB.__table__])
+
+def migration_008_coverage_targets(conn):
+    """Coverage targets per time slot"""
+    Base.metadata.create_all(bind=conn, tables=[CoverageTargetDB.__table__])
+
+def migration_009_schedule_matrix_index(conn):
+    """Covering date/slot/resource index replacing the plain date index"""
+    conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS idx_shifts_date_slot_resource ON shifts (date, time_slot_id, resource_id)")
+    conn.exec_driver_sql("DROP INDEX IF EXISTS idx_shifts_date")
+    conn.exec_driver_sql("ANALYZE")
+
+def migration_010_journal(conn):
+    """Undo/redo journal of scheduling edits"""
+    Base.metadata.create_all(bind=conn, tables=[JournalOperationDB.__table__])
+
+def migration_011_shift_archive(conn):
+    """Compressed archive of weeks older than the archive horizon"""
+    Base.metadata.create_all(bind=conn, tables=[ShiftArchiveDB.__table__])
+
+# FTS5 search tables shadowing resources and users (rowid = source rowid), kept in sync by triggers.
+# The *_compact column drops apostrophes so "dangelo" finds D'Angelo; "d angelo" matches the plain name.
+SEARCH_COMPACT_SQL = "replace(replace({0}, '''', ''), '’', '')"
+SEARCH_INDEXES = {
+    "resources_search": ("resources", ("name", "email"), "name"),
+    "users_search": ("users", ("username", "full_name", "email"), "full_name"),
+}
+
+def create_search_index(conn, search_table: str):
+    source, columns, compact = SEARCH_INDEXES[search_table]
+    column_list = ", ".join(columns)
+    compact_new = SEARCH_COMPACT_SQL.format(f"new.{compact}")
+    conn.exec_driver_sql(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {search_table} USING fts5({column_list}, {compact}_compact, "
+        f"tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+    )
+    conn.exec_driver_sql(f"""
+        CREATE TRIGGER IF NOT EXISTS {source}_search_insert AFTER INSERT ON {source} BEGIN
+            INSERT INTO {search_table} (rowid, {column_list}, {compact}_compact)
+            VALUES (new.rowid, {", ".join(f"new.{column}" for column in columns)}, {compact_new});
+        END
+    """)
+    conn.exec_driver_sql(f"""
+        CREATE TRIGGER IF NOT EXISTS {source}_search_update AFTER UPDATE OF {column_list} ON {source} BEGIN
+            UPDATE {search_table} SET {", ".join(f"{column} = new.{column}" for column in columns)}, {compact}_compact = {compact_new}
+            WHERE rowid = new.rowid;
+        END
+    """)
+    conn.exec_driver_sql(f"""
+        CREATE TRIGGER IF NOT EXISTS {source}_search_delete AFTER DELETE ON {source} BEGIN
+            DELETE FROM {search_table} WHERE rowid = old.rowid;
+        END
+    """)
+    rebuild_search_index(conn, search_table)
+
+def rebuild_search_index(conn, search_table: str):
+    """Refill a search table from its source (also needed after a VACUUM, which may renumber rowids)"""
+    source, columns, compact = SEARCH_INDEXES[search_table]
+    column_list = ", ".join(columns)
+    conn.exec_driver_sql(f"DELETE FROM {search_table}")
+    conn.exec_driver_sql(
+        f"INSERT INTO {search_table} (rowid, {column_list}, {compact}_compact) "
+        f"SELECT rowid, {column_list}, {SEARCH_COMPACT_SQL.format(compact)} FROM {source}"
+    )
+
+def migration_012_search(conn):
+    """Full-text search over resources and users"""
+    for search_table in SEARCH_INDEXES:
+        create_search_index(conn, search_table)
+
+def migration_013_notifications(conn):
+    """Publish notification outbox and per-recipient delivery queue"""
+    Base.metadata.create_all(bind=conn, tables=[NotificationEventDB.__table__, NotificationDB.__table__])
+
+def migration_014_rolling_limits(conn):
+    """Rolling average-hours and consecutive-day limits per resource"""
+    for column in ("max_avg_hours_4_weeks", "max_avg_hours_17_weeks", "max_consecutive_days"):
+        if not column_exists(conn, "resources", column):
+            conn.exec_driver_sql(f"ALTER TABLE resources ADD COLUMN {column} INTEGER")
+
+def migration_015_week_versions(conn):
+    """Per-week versions for optimistic concurrency between planners"""
+    Base.metadata.create_all(bind=conn, tables=[WeekVersionDB.__table__])
+
+def migration_016_snapshot_backfill(conn):
+    """Snapshots of weeks published before publish froze them, so employee reads never write"""
+    missing = conn.exec_driver_sql(
+        "SELECT week_number, year FROM weekly_plans p WHERE is_published = 1 AND NOT EXISTS ("
+        "  SELECT 1 FROM published_snapshots s WHERE s.week_number = p.week_number AND s.year = p.year"
+        ") ORDER BY year, week_number"
+    ).fetchall()
+    if not missing:
+        return
+    db = Session(bind=conn)
+    try:
+        for week_number, year in missing:
+            build_week_snapshot(db, week_number, year)
+        db.flush()
+    finally:
+        db.close()
+
+def migration_017_job_leases(conn):
+    """Owner and heartbeat of running jobs, so a starting worker only requeues jobs whose runner died"""
+    for column, column_type in (("owner", "VARCHAR(64)"), ("heartbeat_at", "DATETIME")):
+        if not column_exists(conn, "jobs", column):
+            conn.exec_driver_sql(f"ALTER TABLE jobs ADD COLUMN {column} {column_type}")
+
+def migration_018_resource_date_minutes_index(conn):
+    """Covering resource/date/minutes index replacing the plain resource/date index"""
+    conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS idx_shifts_resource_date_minutes ON shifts (resource_id, date, minutes)")
+    conn.exec_driver_sql("DROP INDEX IF EXISTS idx_shifts_resource_date")
+    conn.exec_driver_sql("ANALYZE")
+
+# (version, name, migration) - append only, never renumber
+MIGRATIONS = [
+    (1, "baseline schema", migration_001_baseline),
+    (2, "hot query indexes", migration_002_hot_query_indexes),
+    (3, "integer minute durations", migration_003_shift_minutes),
+    (4, "sites", migration_004_sites),
+    (5, "data versions", migration_005_data_versions),
+    (6, "jobs", migration_006_jobs),
+    (7, "resource unavailability", migration_007_unavailability),
+    (8, "coverage targets", migration_008_coverage_targets),
+    (9, "schedule matrix index", migration_009_schedule_matrix_index),
+    (10, "undo journal", migration_010_journal),
+    (11, "shift archive", migration_011_shift_archive),
+    (12, "full-text search", migration_012_search),
+    (13, "publish notifications", migration_013_notifications),
+    (14, "rolling labour limits", migration_014_rolling_limits),
+    (15, "week versions", migration_015_week_versions),
+    (16, "published snapshot backfill", migration_016_snapshot_backfill),
+    (17, "job leases", migration_017_job_leases),
+    (18, "rolling limit index", migration_018_resource_date_minutes_index),
+]
+
+# Data Versions
+# Scope bumped when a row of the given model is inserted, updated or deleted
+DATA_VERSION_SCOPES = {
+    UserDB: "users",
+    SiteDB: "sites",
+    ResourceDB: "resources",
+    TimeSlotDB: "time_slots",
+    ShiftDB: "shifts",
+    ShiftArchiveDB: "shifts",
+    UnavailabilityDB: "unavailability",
+    CoverageTargetDB: "coverage",
+    WeeklyPlanDB: "plans",
+    PublicationDB: "plans",
+    PublishedSnapshotDB: "plans",
+}
+
+def bump_data_versions(db: Session, scopes) -> None:
+    """Bump scopes inside the current transaction (needed explicitly only for bulk SQL statements)"""
+    conn = db.connection()
+    for scope in sorted(set(scopes)):
+        conn.exec_driver_sql(
+            "INSERT INTO data_versions (scope, version) VALUES (?, 1) "
+            "ON CONFLICT(scope) DO UPDATE SET version = version + 1",
+            (scope,)
+        )
+
+@event.listens_for(Session, "after_flush")
+def _bump_data_versions_after_flush(session, flush_context):
+    scopes = {
+        DATA_VERSION_SCOPES[type(obj)]
+        for obj in list(session.new) + list(session.dirty) + list(session.deleted)
+        if type(obj) in DATA_VERSION_SCOPES
+    }
+    if scopes:
+        bump_data_versions(session, scopes)
+
+# Undo Journal
+JOURNAL_MAX_OPERATIONS = int(os.environ.get("JOURNAL_MAX_OPERATIONS", "200"))
+JOURNAL_MAX_CHANGES = int(os.environ.get("JOURNAL_MAX_CHANGES", "20000"))
+SHIFT_JOURNAL_FIELDS = ("id", "resource_id", "time_slot_id", "date", "week_number", "year",
+                        "minutes", "overtime_minutes", "extra_overtime_minutes")
+
+def begin_journal_operation(db: Session, user_id: Optional[str], label: str) -> None:
+    """Attribute the shift changes of the next commit to a user-level operation"""
+    db.info["journal_operation"] = (user_id, label)
+
+def shift_journal_record(sign: str, shift: ShiftDB) -> list:
+    return [sign] + [shift.date.isoformat() if field == "date" else getattr(shift, field) for field in SHIFT_JOURNAL_FIELDS]
+
+@event.listens_for(Session, "after_flush")
+def _collect_shift_journal_after_flush(session, flush_context):
+    # Shifts are only ever inserted or deleted, never updated in place
+    records = [shift_journal_record("+", obj) for obj in session.new if isinstance(obj, ShiftDB)]
+    records += [shift_journal_record("-", obj) for obj in session.deleted if isinstance(obj, ShiftDB)]
+    if records:
+        session.info.setdefault("journal_records", []).extend(records)
+
+@event.listens_for(Session, "before_commit")
+def _write_journal_before_commit(session):
+    # Pending objects are only flushed after this hook; flush now so their records are collected
+    session.flush()
+    records = session.info.pop("journal_records", None)
+    user_id, label = session.info.pop("journal_operation", (None, None))
+    if not records:
+        return
+    # A shift created and deleted within the same operation leaves nothing to undo
+    signs = {}
+    for record in records:
+        signs[record[1]] = signs.get(record[1], 0) + (1 if record[0] == "+" else -1)
+    records = [record for record in records if signs[record[1]] != 0]
+    if not records:
+        return
+    
+    conn = session.connection()
+    # A new edit discards whatever its author could still redo
+    conn.exec_driver_sql("DELETE FROM journal_operations WHERE undone = 1 AND user_id IS ?", (user_id,))
+    session.add(JournalOperationDB(user_id=user_id, label=label or "Modifica turni", changes=records, change_count=len(records)))
+    session.flush()
+    compact_journal(session)
+
+@event.listens_for(Session, "after_rollback")
+def _discard_journal_after_rollback(session):
+    session.info.pop("journal_records", None)
+    session.info.pop("journal_operation", None)
+
+def compact_journal(db: Session) -> None:
+    """Keep the newest JOURNAL_MAX_OPERATIONS operations holding at most JOURNAL_MAX_CHANGES records"""
+    db.connection().exec_driver_sql(
+        "DELETE FROM journal_operations WHERE id IN ("
+        "  SELECT id FROM ("
+        "    SELECT id, ROW_NUMBER() OVER (ORDER BY id DESC) AS position,"
+        "           SUM(change_count) OVER (ORDER BY id DESC) AS running_changes"
+        "    FROM journal_operations"
+        "  ) WHERE position > ? OR (position > 1 AND running_changes > ?)"
+        ")",
+        (JOURNAL_MAX_OPERATIONS, JOURNAL_MAX_CHANGES)
+    )
+
+def journal_rows(insert_records: list) -> List[dict]:
+    rows = [dict(zip(SHIFT_JOURNAL_FIELDS, record[1:])) for record in insert_records]
+    for row in rows:
+        row["date"] = datetime.strptime(row["date"], "%Y-%m-%d").date()
+    return rows
+
+def check_journal_records(db: Session, insert_records: list, delete_records: list) -> None:
+    """409 unless the shifts can be deleted and put back as create_shift would accept them now.
+    
+    The shifts put back are checked against the state after the deletions: a later edit in the
+    way, an archived week, an absence, missing rest or a rolling limit refuses the operation.
+    """
+    delete_ids = [record[1] for record in delete_records]
+    if delete_ids:
+        existing = db.query(func.count(ShiftDB.id)).filter(ShiftDB.id.in_(delete_ids)).scalar()
+        if existing != len(delete_ids):
+            raise HTTPException(status_code=409, detail="Alcuni turni sono stati modificati successivamente: operazione non annullabile")
+    
+    rows = journal_rows(insert_records)
+    if not rows:
+        return
+    resources = {resource.id: resource for resource in db.query(ResourceDB).filter(ResourceDB.id.in_({row["resource_id"] for row in rows})).all()}
+    time_slots = {slot.id: slot for slot in db.query(TimeSlotDB).all()}
+    if any(row["resource_id"] not in resources or row["time_slot_id"] not in time_slots for row in rows):
+        raise HTTPException(status_code=409, detail="Risorsa o fascia oraria non più esistente: operazione non annullabile")
+    if any(week_is_archived(db, *week) for week in {iso_week(row["date"]) for row in rows}):
+        raise HTTPException(status_code=409, detail="La settimana è archiviata e non può essere modificata")
+    
+    # Shifts of the same people within rest range once the deletions are done, plus the ones put back
+    first, last = min(row["date"] for row in rows), max(row["date"] for row in rows)
+    nearby: Dict[tuple, list] = {}
+    for shift_id, resource_id, time_slot_id, shift_date in db.query(ShiftDB.id, ShiftDB.resource_id, ShiftDB.time_slot_id, ShiftDB.date).filter(
+        ShiftDB.resource_id.in_(list(resources)),
+        ShiftDB.date.between(first - timedelta(days=2), last + timedelta(days=2)),
+        ShiftDB.id.notin_(delete_ids)
+    ).all():
+        nearby.setdefault((resource_id, shift_date), []).append((shift_id, time_slot_id))
+    for row in rows:
+        if nearby.get((row["resource_id"], row["date"])):
+            raise HTTPException(status_code=409, detail="La risorsa ha già un turno assegnato in questa data")
+        nearby.setdefault((row["resource_id"], row["date"]), []).append((row["id"], row["time_slot_id"]))
+    
+    unavailability = UnavailabilityIndex.load(db, datetime.combine(first, time.min), datetime.combine(last + timedelta(days=2), time.min), list(resources))
+    for row in rows:
+        resource, slot = resources[row["resource_id"]], time_slots[row["time_slot_id"]]
+        start, end = shift_window(row["date"], slot.start_time, slot.end_time)
+        absence = unavailability.find(resource.id, start, end)
+        if absence:
+            raise HTTPException(status_code=409, detail=unavailability_message(absence))
+        for offset in (-2, -1, 1, 2):
+            other_date = row["date"] + timedelta(days=offset)
+            for _, other_slot_id in nearby.get((resource.id, other_date), ()):
+                other_slot = time_slots.get(other_slot_id)
+                if not other_slot:
+                    continue
+                hours_between = rest_gap_hours(start, end, *shift_window(other_date, other_slot.start_time, other_slot.end_time))
+                if 0 < hours_between < resource.min_rest_hours:
+                    raise HTTPException(status_code=409, detail=rest_violation_message(resource.min_rest_hours, hours_between))
+    
+    limited = [resource for resource in resources.values() if any(getattr(resource, column) is not None for column in ROLLING_LIMIT_COLUMNS)]
+    if limited:
+        rolling_limits = RollingLimits.load_changed(
+            db, limited, first, last,
+            removed=[(record[2], datetime.strptime(record[4], "%Y-%m-%d").date(), record[7]) for record in delete_records],
+            added=[(row["resource_id"], row["date"], row["minutes"]) for row in rows]
+        )
+        for row in rows:
+            if row["resource_id"] in rolling_limits.rows:
+                # The row is already in the patched days: check the windows through its day as they are
+                violations = rolling_limits.violations(resources[row["resource_id"]], row["date"], 0)
+                if violations:
+                    raise HTTPException(status_code=409, detail=violations[0])
+
+def apply_journal_records(db: Session, insert_records: list, delete_records: list) -> None:
+    """Insert and delete shifts from journal records in bulk (after check_journal_records and the week claims)"""
+    delete_ids = [record[1] for record in delete_records]
+    rows = journal_rows(insert_records)
+    for row in rows:
+        row["created_at"] = datetime.utcnow()
+    if delete_ids:
+        db.execute(ShiftDB.__table__.delete().where(ShiftDB.id.in_(delete_ids)))
+    if rows:
+        db.execute(ShiftDB.__table__.insert(), rows)
+    bump_data_versions(db, ["shifts"])
+
+class DataVersionTracker:
+    """Data versions of one database file, as seen by this process.
+    
+    A dedicated connection polls PRAGMA data_version, which changes whenever another connection
+    (any worker process, or another pooled connection here) commits; only then is the small
+    data_versions table re-read. Writes made by another worker are therefore visible to the
+    next request without any external service.
+    """
+    def __init__(self, database_file: str):
+        self._conn = sqlite3.connect(database_file, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._data_version = None
+        self._versions: Dict[str, int] = {}
+    
+    def snapshot(self, *scopes) -> tuple:
+        with self._lock:
+            data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+            if data_version != self._data_version:
+                self._versions = dict(self._conn.execute("SELECT scope, version FROM data_versions").fetchall())
+                self._data_version = data_version
+            return tuple(self._versions.get(scope, 0) for scope in scopes)
+
+_data_version_trackers: Dict[str, DataVersionTracker] = {}
+_data_version_trackers_lock = threading.Lock()
+
+def get_data_versions(db: Session, *scopes) -> tuple:
+    """Current versions of scopes in the database the session is bound to"""
+    database_file = db.get_bind().url.database
+    tracker = _data_version_trackers.get(database_file)
+    if tracker is None:
+        with _data_version_trackers_lock:
+            tracker = _data_version_trackers.setdefault(database_file, DataVersionTracker(database_file))
+    return tracker.snapshot(*scopes)
+
+class VersionedCache:
+    """In-process LRU cache whose entries are only served while the data versions they were built at are current"""
+    def __init__(self, *scopes, max_entries: int = 256):
+        self.scopes = scopes
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+    
+    def get(self, db: Session, key, loader):
+        # Versions are read before loading, so a concurrent write can only make an entry look older than it is
+        versions = get_data_versions(db, *self.scopes)
+        cache_key = (db.get_bind().url.database, key)
+        entry = self._entries.get(cache_key)
+        if entry is not None and entry[0] == versions:
+            self._entries.move_to_end(cache_key)
+            return entry[1]
+        value = loader()
+        self._entries[cache_key] = (versions, value)
+        self._entries.move_to_end(cache_key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return value
+
+principal_cache = VersionedCache("users", max_entries=4096)
+time_slot_cache = VersionedCache("time_slots", max_entries=64)
+# Each week-keyed entry is a full resource list, so only the weeks being planned stay cached
+resource_cache = VersionedCache("resources", "unavailability", max_entries=32)
+# Rolling-limit state of the limited resources around one week (~14 MB for 1000 people): few weeks
+rolling_limits_cache = VersionedCache("shifts", "resources", max_entries=4)
+
+class ReportCache:
+    """LRU cache of computed reports with a memory cap and single-flight computation.
+    
+    An entry is keyed by database, report name and parameters, and is only served while the
+    shift/resource/time-slot/coverage data versions it was computed at are current. Concurrent
+    identical requests await one shared computation, which runs in a worker thread as
+    compute(session) with a session of its own: the computation outlives the request that
+    started it if that request is cancelled, and its followers still get the result.
+    """
+    SCOPES = ("shifts", "resources", "time_slots", "coverage")
+    
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._inflight: Dict[tuple, asyncio.Future] = {}
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+    
+    def _store(self, key: tuple, versions: tuple, value):
+        size = len(json.dumps(jsonable_encoder(value), separators=(",", ":")))
+        if key in self._entries:
+            self._bytes -= self._entries.pop(key)[2]
+        if size > self.max_bytes:
+            return
+        self._entries[key] = (versions, value, size)
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            _, (_, _, evicted_size) = self._entries.popitem(last=False)
+            self._bytes -= evicted_size
+    
+    async def get(self, db: Session, name: str, params: tuple, compute):
+        versions = get_data_versions(db, *self.SCOPES)
+        key = (db.get_bind().url.database, name, params)
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] == versions:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+        
+        flight_key = key + (versions,)
+        inflight = self._inflight.get(flight_key)
+        if inflight is not None:
+            self.hits += 1
+            return await asyncio.shield(inflight)
+        
+        self.misses += 1
+        task = asyncio.ensure_future(asyncio.to_thread(self._compute, db.get_bind(), compute))
+        self._inflight[flight_key] = task
+        
+        def done(task: asyncio.Future):
+            self._inflight.pop(flight_key, None)
+            # Retrieving the exception here also keeps an unawaited failure from being logged as lost
+            if not task.cancelled() and task.exception() is None:
+                self._store(key, versions, task.result())
+        
+        task.add_done_callback(done)
+        return await asyncio.shield(task)
+    
+    @staticmethod
+    def _compute(bind, compute):
+        db = Session(bind=bind, autoflush=False)
+        try:
+            return compute(db)
+        finally:
+            db.close()
+
+report_cache = ReportCache(int(os.environ.get("REPORT_CACHE_MAX_BYTES", str(32 * 1024 * 1024))))
+
+def run_migrations(bind_engine=None) -> list:
+    """Apply pending migrations once, recording each applied version"""
+    bind_engine = bind_engine or engine
+    applied_now = []
+    with bind_engine.connect() as conn:
+        # Take the write lock up front so concurrent workers starting together apply each migration once
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+        Base.metadata.create_all(bind=conn, tables=[SchemaMigrationDB.__table__])
+        applied = {row[0] for row in conn.exec_driver_sql("SELECT version FROM schema_migrations")}
+        for version, name, migrate in MIGRATIONS:
+            if version in applied:
+                continue
+            migrate(conn)
+            conn.execute(SchemaMigrationDB.__table__.insert().values(version=version, name=name, applied_at=datetime.utcnow()))
+            applied_now.append(version)
+            print(f"✅ Migration {version:03d} applied: {name}")
+        conn.commit()
+    return applied_now
+
+# Hot queries checked with EXPLAIN QUERY PLAN (name -> SQL with sample parameters)
+HOT_QUERIES = {
+    "login_user": ("SELECT * FROM users WHERE username = ?", ("admin",)),
+    "week_shifts": ("SELECT * FROM shifts WHERE week_number = ? AND year = ?", (38, 2024)),
+    "shift_conflict": ("SELECT id FROM shifts WHERE resource_id = ? AND date = ?", ("r", "2024-09-16")),
+    "rest_window": ("SELECT * FROM shifts WHERE resource_id = ? AND date >= ? AND date <= ? AND date != ?", ("r", "2024-09-14", "2024-09-18", "2024-09-16")),
+    "weekly_limit": ("SELECT SUM(minutes) FROM shifts WHERE resource_id = ? AND week_number = ? AND year = ?", ("r", 38, 2024)),
+    "week_version": ("SELECT version FROM week_versions WHERE year = ? AND week_number = ?", (2024, 38)),
+    "rolling_limits": ("SELECT resource_id, group_concat(date), group_concat(minutes) FROM shifts WHERE resource_id IN (SELECT value FROM json_each(?)) AND date >= ? AND date <= ? GROUP BY resource_id", ('["r"]', "2024-05-26", "2025-01-10")),
+    "time_slot_in_use": ("SELECT id FROM shifts WHERE time_slot_id = ? LIMIT 1", ("ts-001",)),
+    "time_slot_usage": ("SELECT time_slot_id, COUNT(*), SUM(minutes) FROM shifts WHERE date >= ? GROUP BY time_slot_id", ("2024-09-01",)),
+    "resource_month": ("SELECT resource_id, COUNT(*), SUM(minutes), SUM(overtime_minutes) FROM shifts WHERE date >= ? GROUP BY resource_id", ("2024-09-01",)),
+    "daily_distribution": ("SELECT date, COUNT(*), SUM(minutes), SUM(overtime_minutes) FROM shifts WHERE date >= ? AND date <= ? GROUP BY date", ("2024-09-16", "2024-09-22")),
+    "unavailability_window": ("SELECT resource_id, start_at, end_at, reason FROM unavailabilities WHERE end_at > ? AND start_at < ?", ("2024-09-16 00:00:00", "2024-09-23 00:00:00")),
+    "resource_unavailability": ("SELECT start_at, end_at, reason FROM unavailabilities WHERE resource_id = ? AND end_at > ? AND start_at < ?", ("r", "2024-09-16 08:00:00", "2024-09-16 16:00:00")),
+    "archive_candidates": ("SELECT year, week_number FROM shifts WHERE date < ? GROUP BY year, week_number", ("2023-09-18",)),
+    "archived_range": ("SELECT payload FROM shift_archive WHERE first_date <= ? AND last_date >= ?", ("2023-12-31", "2023-01-01")),
+    "archived_week": ("SELECT id FROM shift_archive WHERE week_number = ? AND year = ?", (38, 2023)),
+    "schedule_matrix": ("SELECT date, time_slot_id, group_concat(resource_id) FROM shifts WHERE date >= ? AND date <= ? GROUP BY date, time_slot_id", ("2024-01-01", "2024-12-31")),
+    "search_resources": ("SELECT r.id FROM resources_search s JOIN resources r ON r.rowid = s.rowid WHERE resources_search MATCH ? ORDER BY s.rank LIMIT 20", ('"ros"*',)),
+    "pending_notifications": ("SELECT id FROM notifications WHERE status IN ('pending', 'sending') AND next_attempt_at <= ? ORDER BY id LIMIT 100", ("2024-09-16 08:00:00",)),
+    "published_plans": ("SELECT week_number, year FROM weekly_plans WHERE is_published = 1", ()),
+    "week_snapshot": ("SELECT id, version FROM published_snapshots WHERE week_number = ? AND year = ?", (38, 2024)),
+}
+
+def explain_hot_queries(bind_engine=None) -> list:
+    """EXPLAIN QUERY PLAN of every hot query, flagging full table scans"""
+    bind_engine = bind_engine or engine
+    report = []
+    with bind_engine.connect() as conn:
+        for name, (sql, params) in HOT_QUERIES.items():
+            plan = [row[3] for row in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}", params)]
+            full_scan = any(step.startswith("SCAN") and "INDEX" not in step for step in plan)
+            report.append({"query": name, "plan": plan, "full_scan": full_scan})
+    return report
 
 # Pydantic Models (same as before)
 class UserCreate(BaseModel):
@@ -174,6 +1053,7 @@ class UserCreate(BaseModel):
     password: str
     role: UserRole = UserRole.EMPLOYEE
     full_name: str
+    site_id: Optional[str] = None
 
 class UserLogin(BaseModel):
     username: str
@@ -187,6 +1067,7 @@ class User(BaseModel):
     role: UserRole
     created_at: datetime
     is_active: bool
+    site_id: Optional[str] = None
 
 class TimeSlot(BaseModel):
     id: str
@@ -208,14 +1089,26 @@ class Resource(BaseModel):
     email: str
     weekly_hour_limit: int = 40
     min_rest_hours: int = 12
+    max_avg_hours_4_weeks: Optional[int] = None
+    max_avg_hours_17_weeks: Optional[int] = None
+    max_consecutive_days: Optional[int] = None
     is_active: bool = True
     created_at: datetime
+    # Per day of the requested week: "available", "partial" or "unavailable"
+    availability: Optional[List[str]] = None
 
 class ResourceCreate(BaseModel):
     name: str
     email: str
     weekly_hour_limit: int = 40
     min_rest_hours: int = 12
+    max_avg_hours_4_weeks: Optional[int] = Field(None, ge=1, le=168)
+    max_avg_hours_17_weeks: Optional[int] = Field(None, ge=1, le=168)
+    max_consecutive_days: Optional[int] = Field(None, ge=1)
+
+class ResourceStatusUpdate(BaseModel):
+    resource_ids: List[str]
+    is_active: bool
 
 class Shift(BaseModel):
     id: str
@@ -237,6 +1130,55 @@ class ShiftCreate(BaseModel):
     year: int
     extra_overtime_hours: float = 0.0
 
+class Unavailability(BaseModel):
+    id: str
+    resource_id: str
+    start_date: str
+    end_date: str
+    start_time: Optional[str] = None
+    end_time: Optional[str] = None
+    reason: UnavailabilityReason
+    note: Optional[str] = None
+    created_at: datetime
+
+class UnavailabilityCreate(BaseModel):
+    resource_id: str
+    start_date: str
+    end_date: str
+    # Without times the absence covers whole days, from start_date to end_date included
+    start_time: Optional[str] = None
+    end_time: Optional[str] = None
+    reason: UnavailabilityReason = UnavailabilityReason.OTHER
+    note: Optional[str] = None
+
+class CoverageTarget(BaseModel):
+    id: str
+    time_slot_id: str
+    weekday: Optional[int] = None
+    date: Optional[str] = None
+    required: int
+    created_at: datetime
+
+class CoverageTargetCreate(BaseModel):
+    time_slot_id: str
+    # Either a weekday (0 = Monday ... 6 = Sunday) or a date overriding the weekday target
+    weekday: Optional[int] = None
+    date: Optional[str] = None
+    required: int
+
+class ScheduleChange(BaseModel):
+    action: Literal["add", "remove", "move"]
+    # remove/move: the shift to change
+    shift_id: Optional[str] = None
+    # add: the new shift; move: only the fields that change
+    resource_id: Optional[str] = None
+    time_slot_id: Optional[str] = None
+    date: Optional[str] = None
+    extra_overtime_hours: float = 0.0
+
+class ScheduleSimulationRequest(BaseModel):
+    changes: List[ScheduleChange]
+
 class WeeklyPlan(BaseModel):
     id: str
     week_number: int
@@ -252,28 +1194,378 @@ class Publication(BaseModel):
     year: int
     published_by: str
     published_at: datetime
-    changes_log: List[str] = []
+    changes_log: List[Any] = []
+
+class Site(BaseModel):
+    id: str
+    name: str
+    is_active: bool = True
+    created_at: datetime
+
+class SiteCreate(BaseModel):
+    id: str
+    name: str
+
+# Site Routing
+_site_sessions: Dict[str, sessionmaker] = {DEFAULT_SITE_ID: SessionLocal}
+_site_sessions_lock = threading.Lock()
+
+def get_site_sessionmaker(site_id: str) -> sessionmaker:
+    """Session factory bound to the database of a site, opening (and migrating) it on first use"""
+    factory = _site_sessions.get(site_id)
+    if factory:
+        return factory
+    
+    with _site_sessions_lock:
+        if site_id in _site_sessions:
+            return _site_sessions[site_id]
+        main_db = SessionLocal()
+        try:
+            site = main_db.query(SiteDB).filter(SiteDB.id == site_id, SiteDB.is_active == True).first()
+        finally:
+            main_db.close()
+        if not site:
+            raise HTTPException(status_code=404, detail=f"Site not found: {site_id}")
+        
+        site_engine = create_sqlite_engine(site.database_file)
+        run_migrations(site_engine)
+        _site_sessions[site_id] = sessionmaker(autocommit=False, autoflush=False, bind=site_engine)
+        return _site_sessions[site_id]
+
+def resolve_site_id(request: Request) -> str:
+    """Site of the authenticated user; admins may address another site with the X-Site header"""
+    authorization = request.headers.get("authorization", "")
+    if not authorization.lower().startswith("bearer "):
+        return DEFAULT_SITE_ID
+    try:
+        payload = jwt.decode(authorization[7:], JWT_SECRET, algorithms=[JWT_ALGORITHM])
+    except jwt.InvalidTokenError:
+        # get_current_user rejects the token with a proper 401
+        return DEFAULT_SITE_ID
+    
+    if payload.get("role") == UserRole.ADMIN.value and request.headers.get("x-site"):
+        return request.headers["x-site"]
+    return payload.get("site") or DEFAULT_SITE_ID
 
-# Database dependency
-def get_db():
+# Database dependencies
+def get_main_db():
+    """Main database: users and the site registry"""
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
 
-# Helper Functions
-def hash_password(password: str) -> str:
-    return hashlib.sha256(password.encode()).hexdigest()
+def get_db(request: Request):
+    """Schedule database of the site the request is routed to"""
+    db = get_site_sessionmaker(resolve_site_id(request))()
+    try:
+        yield db
+    finally:
+        db.close()
+
+def list_site_ids(main_db: Session) -> List[str]:
+    site_ids = [site_id for (site_id,) in main_db.query(SiteDB.id).filter(SiteDB.is_active == True).order_by(SiteDB.id).all()]
+    return [DEFAULT_SITE_ID] + [site_id for site_id in site_ids if site_id != DEFAULT_SITE_ID]
+
+async def fan_out_sites(site_ids: List[str], work) -> Dict[str, Any]:
+    """Run work(db) against every site database concurrently, one thread and session per site"""
+    def run(site_id: str):
+        db = get_site_sessionmaker(site_id)()
+        try:
+            return work(db)
+        finally:
+            db.close()
+    
+    results = await asyncio.gather(*[asyncio.to_thread(run, site_id) for site_id in site_ids])
+    return dict(zip(site_ids, results))
+
+# Background Jobs
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "2"))
+# A running job whose runner has not renewed it for this long is requeued by any other runner
+JOB_LEASE_SECONDS = int(os.environ.get("JOB_LEASE_SECONDS", "60"))
+JOB_HEARTBEAT_SECONDS = max(1, JOB_LEASE_SECONDS // 3)
+# Attempts at recording a job's outcome; after that the lease runs out and the job is run again
+JOB_FINISH_ATTEMPTS = 5
+# Per-kind limit on jobs running at the same time in one process
+JOB_CONCURRENCY = {"range_report": 1, "reset_all_passwords": 1, "init_default_data": 1, "archive_weeks": 1, "backup": 1}
+# kind -> handler(JobContext) returning a JSON-serialisable result; filled next to each handler
+JOB_HANDLERS: Dict[str, Any] = {}
+
+class JobCancelled(Exception):
+    pass
+
+class JobContext:
+    """Sessions and progress/cancellation hooks handed to a running job"""
+    def __init__(self, job_id: str, site_id: Optional[str], params: dict):
+        self.job_id = job_id
+        self.site_id = site_id or DEFAULT_SITE_ID
+        self.params = params or {}
+        self.main_db = SessionLocal()
+        self.db = get_site_sessionmaker(self.site_id)()
+        self._last_progress = 0.0
+    
+    def _update(self, **values):
+        session = SessionLocal()
+        try:
+            session.query(JobDB).filter(JobDB.id == self.job_id).update(values)
+            session.commit()
+        finally:
+            session.close()
+    
+    def progress(self, done: int, total: int, message: Optional[str] = None):
+        """Record progress (throttled) and stop here if cancellation was requested"""
+        now = datetime.utcnow().timestamp()
+        if done < total and now - self._last_progress < 0.5:
+            return
+        self._last_progress = now
+        self._update(progress=int(done * 100 / total) if total else 100, progress_message=message)
+        self.check_cancelled()
+    
+    def check_cancelled(self):
+        session = SessionLocal()
+        try:
+            cancel_requested = session.query(JobDB.cancel_requested).filter(JobDB.id == self.job_id).scalar()
+        finally:
+            session.close()
+        if cancel_requested:
+            raise JobCancelled()
+    
+    def close(self):
+        self.db.close()
+        self.main_db.close()
+
+class JobRunner:
+    """In-process worker pool over the durable jobs table.
+    
+    A claimed job records this runner as its owner, and a heartbeat thread renews the lease of
+    every job running here. Any runner requeues running jobs whose lease expired (their process
+    died), and only those: jobs still running in another live worker are left alone.
+    
+    A job whose kind is at its JOB_CONCURRENCY limit does not wait on a pool thread: it stays
+    queued, parked here, and is submitted again when a job of its kind ends, so other kinds
+    keep the threads.
+    """
+    def __init__(self, max_workers: int):
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:12]}"
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="planshift-job")
+        self._active: Dict[str, int] = {}
+        self._parked: Dict[str, deque] = {}
+        self._running = set()
+        self._lock = threading.Lock()
+        self._heartbeat_thread = None
+    
+    def enqueue(self, kind: str, params: Optional[dict] = None, site_id: Optional[str] = None, created_by: Optional[str] = None) -> JobDB:
+        session = SessionLocal()
+        try:
+            job = JobDB(kind=kind, params=params or {}, site_id=site_id, created_by=created_by)
+            session.add(job)
+            session.commit()
+            session.refresh(job)
+            session.expunge(job)
+        finally:
+            session.close()
+        self._executor.submit(self._run, job.id)
+        return job
+    
+    def enqueue_unique(self, kind: str, succeeded_since: Optional[datetime] = None) -> Optional[str]:
+        """Queue a job unless one of its kind is queued, running or (optionally) succeeded after `succeeded_since`.
+        
+        Check and insert are one statement, so several worker processes asking at once queue it once.
+        """
+        session = SessionLocal()
+        try:
+            row = session.connection().exec_driver_sql(
+                "INSERT INTO jobs (id, kind, status, params, progress, cancel_requested, created_at) "
+                "SELECT ?, ?, 'queued', '{}', 0, 0, ? WHERE NOT EXISTS ("
+                "  SELECT 1 FROM jobs WHERE kind = ? AND (status IN ('queued', 'running') OR (status = 'succeeded' AND finished_at > ?))"
+                ") RETURNING id",
+                (str(uuid.uuid4()), kind, datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S.%f"), kind,
+                 succeeded_since.strftime("%Y-%m-%d %H:%M:%S.%f") if succeeded_since else "9999")
+            ).fetchone()
+            session.commit()
+        finally:
+            session.close()
+        if row is None:
+            return None
+        self._executor.submit(self._run, row[0])
+        return row[0]
+    
+    def recover(self):
+        """Requeue jobs of runners that died and pick up jobs queued by other processes"""
+        self._start_heartbeat()
+        self._requeue_expired()
+        session = SessionLocal()
+        try:
+            job_ids = [job_id for (job_id,) in session.query(JobDB.id).filter(JobDB.status == "queued").order_by(JobDB.created_at).all()]
+        finally:
+            session.close()
+        for job_id in job_ids:
+            self._executor.submit(self._run, job_id)
+    
+    def _requeue_expired(self):
+        expired_before = datetime.utcnow() - timedelta(seconds=JOB_LEASE_SECONDS)
+        session = SessionLocal()
+        try:
+            job_ids = [row[0] for row in session.connection().exec_driver_sql(
+                "UPDATE jobs SET status = 'queued', started_at = NULL, owner = NULL, heartbeat_at = NULL "
+                "WHERE status = 'running' AND (heartbeat_at IS NULL OR heartbeat_at < ?) RETURNING id",
+                (expired_before.strftime("%Y-%m-%d %H:%M:%S.%f"),)
+            ).fetchall()]
+            session.commit()
+        finally:
+            session.close()
+        for job_id in job_ids:
+            logging.getLogger(__name__).warning("Job %s lost its runner, requeued", job_id)
+            self._executor.submit(self._run, job_id)
+    
+    def _start_heartbeat(self):
+        with self._lock:
+            if self._heartbeat_thread is None:
+                self._heartbeat_thread = threading.Thread(target=self._heartbeat_loop, name="planshift-job-heartbeat", daemon=True)
+                self._heartbeat_thread.start()
+    
+    def _heartbeat_loop(self):
+        while True:
+            threading.Event().wait(JOB_HEARTBEAT_SECONDS)
+            try:
+                with self._lock:
+                    job_ids = list(self._running)
+                if job_ids:
+                    session = SessionLocal()
+                    try:
+                        session.query(JobDB).filter(JobDB.id.in_(job_ids), JobDB.owner == self.owner).update(
+                            {"heartbeat_at": datetime.utcnow()}, synchronize_session=False
+                        )
+                        session.commit()
+                    finally:
+                        session.close()
+                self._requeue_expired()
+            except Exception:
+                logging.getLogger(__name__).exception("Job heartbeat failed")
+    
+    def _finish(self, job_id: str, **values):
+        """Record the outcome, retrying with backoff; if it still cannot be written the lease expires and the job reruns"""
+        values = {"finished_at": datetime.utcnow(), **values}
+        for attempt in range(JOB_FINISH_ATTEMPTS):
+            session = SessionLocal()
+            try:
+                session.query(JobDB).filter(JobDB.id == job_id, JobDB.owner == self.owner).update(values, synchronize_session=False)
+                session.commit()
+                return
+            except Exception:
+                logging.getLogger(__name__).exception("Could not record the outcome of job %s (attempt %d)", job_id, attempt + 1)
+            finally:
+                session.close()
+            threading.Event().wait(2 ** attempt)
+    
+    def _take_slot(self, kind: str, job_id: str) -> bool:
+        """Count the job against its kind's limit, or park it (still queued) until a slot frees"""
+        with self._lock:
+            if self._active.get(kind, 0) >= JOB_CONCURRENCY.get(kind, float("inf")):
+                self._parked.setdefault(kind, deque()).append(job_id)
+                return False
+            self._active[kind] = self._active.get(kind, 0) + 1
+            return True
+    
+    def _release_slot(self, kind: str):
+        """Free the slot and resubmit the parked jobs of the kind: those cancelled meanwhile drop out, the rest park again"""
+        with self._lock:
+            self._active[kind] -= 1
+            parked = self._parked.pop(kind, ())
+        for job_id in parked:
+            self._executor.submit(self._run, job_id)
+    
+    def _run(self, job_id: str):
+        session = SessionLocal()
+        try:
+            job = session.query(JobDB).filter(JobDB.id == job_id).first()
+            if not job or job.status != "queued":
+                return
+            kind, site_id, params = job.kind, job.site_id, job.params
+        finally:
+            session.close()
+        
+        if not self._take_slot(kind, job_id):
+            return
+        try:
+            # Atomic claim: with several worker processes only one of them runs the job
+            self._start_heartbeat()
+            session = SessionLocal()
+            try:
+                now = datetime.utcnow()
+                claimed = session.query(JobDB).filter(JobDB.id == job_id, JobDB.status == "queued").update(
+                    {"status": "running", "started_at": now, "owner": self.owner, "heartbeat_at": now}
+                )
+                session.commit()
+            finally:
+                session.close()
+            if not claimed:
+                return
+            with self._lock:
+                self._running.add(job_id)
+            
+            context = None
+            try:
+                try:
+                    handler = JOB_HANDLERS.get(kind)
+                    if handler is None:
+                        raise ValueError(f"Unknown job kind: {kind}")
+                    context = JobContext(job_id, site_id, params)
+                    outcome = {"status": "succeeded", "progress": 100, "result": jsonable_encoder(handler(context))}
+                except JobCancelled:
+                    outcome = {"status": "cancelled"}
+                except Exception as e:
+                    logging.getLogger(__name__).exception("Job %s (%s) failed", job_id, kind)
+                    outcome = {"status": "failed", "error": str(e)}
+                finally:
+                    # Roll back whatever the handler left open first: its write lock would block the status update
+                    if context:
+                        try:
+                            context.close()
+                        except Exception:
+                            logging.getLogger(__name__).exception("Job %s (%s): closing its sessions failed", job_id, kind)
+                self._finish(job_id, **outcome)
+            finally:
+                with self._lock:
+                    self._running.discard(job_id)
+        finally:
+            self._release_slot(kind)
+
+job_runner = JobRunner(JOB_WORKERS)
+
+def job_to_dict(job: JobDB) -> dict:
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "site_id": job.site_id,
+        "params": job.params,
+        "progress": job.progress,
+        "progress_message": job.progress_message,
+        "result": job.result,
+        "error": job.error,
+        "cancel_requested": job.cancel_requested,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at
+    }
 
-def verify_password(password: str, hashed: str) -> bool:
-    return hash_password(password) == hashed
+def job_accepted(job: JobDB) -> JSONResponse:
+    """202 Accepted pointing at the job status endpoint"""
+    return JSONResponse(
+        status_code=202,
+        content=jsonable_encoder(job_to_dict(job)),
+        headers={"Location": f"/api/jobs/{job.id}"}
+    )
 
+# Helper Functions
 def create_jwt_token(user_data: dict) -> str:
     payload = {
         "user_id": user_data["id"],
         "username": user_data["username"],
         "role": user_data["role"],
+        "site": user_data.get("site_id") or DEFAULT_SITE_ID,
         "exp": datetime.now(timezone.utc) + timedelta(days=7)
     }
     return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
@@ -287,21 +1579,29 @@ def decode_jwt_token(token: str) -> dict:
     except jwt.InvalidTokenError:
         raise HTTPException(status_code=401, detail="Invalid token")
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security), db: Session = Depends(get_db)):
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security), db: Session = Depends(get_main_db)):
     token = credentials.credentials
     payload = decode_jwt_token(token)
-    user = db.query(UserDB).filter(UserDB.id == payload["user_id"]).first()
+    
+    def load_principal():
+        user = db.query(UserDB).filter(UserDB.id == payload["user_id"]).first()
+        if not user:
+            return None
+        return User(
+            id=user.id,
+            username=user.username,
+            email=user.email,
+            full_name=user.full_name,
+            role=user.role,
+            created_at=user.created_at,
+            is_active=user.is_active,
+            site_id=user.site_id
+        )
+    
+    user = principal_cache.get(db, payload["user_id"], load_principal)
     if not user:
         raise HTTPException(status_code=401, detail="User not found")
-    return User(
-        id=user.id,
-        username=user.username,
-        email=user.email,
-        full_name=user.full_name,
-        role=user.role,
-        created_at=user.created_at,
-        is_active=user.is_active
-    )
+    return user
 
 async def get_admin_user(current_user: User = Depends(get_current_user)):
     if current_user.role != UserRole.ADMIN:
@@ -314,8 +1614,8 @@ def calculate_week_number(date_str: str) -> tuple:
     iso_year, iso_week, _ = date_obj.isocalendar()
     return iso_week, iso_year
 
-def calculate_shift_hours(start_time: str, end_time: str) -> float:
-    """Calculate hours between start and end time"""
+def calculate_shift_minutes(start_time: str, end_time: str) -> int:
+    """Calculate minutes between start and end time"""
     start = datetime.strptime(start_time, "%H:%M").time()
     end = datetime.strptime(end_time, "%H:%M").time()
     
@@ -326,8 +1626,25 @@ def calculate_shift_hours(start_time: str, end_time: str) -> float:
     if end_minutes <= start_minutes:
         end_minutes += 24 * 60
     
-    duration_minutes = end_minutes - start_minutes
-    return duration_minutes / 60.0
+    return end_minutes - start_minutes
+
+def calculate_shift_hours(start_time: str, end_time: str) -> float:
+    """Calculate hours between start and end time"""
+    return calculate_shift_minutes(start_time, end_time) / 60.0
+
+def minutes_to_hours(minutes: Optional[int]) -> float:
+    """Integer minutes (possibly a NULL SUM) as API hours"""
+    return round((minutes or 0) / 60, 2)
+
+def hours_to_minutes(hours: Optional[float]) -> int:
+    return int(round((hours or 0.0) * 60))
+
+def rest_gap_hours(start: datetime, end: datetime, other_start: datetime, other_end: datetime) -> float:
+    """Hours between two shifts as measured by the minimum rest check"""
+    return min(abs((start - other_end).total_seconds()), abs((other_start - end).total_seconds())) / 3600
+
+def rest_violation_message(min_rest_hours: int, hours_between: float) -> str:
+    return f"Violazione ore di riposo minime: sono necessarie almeno {min_rest_hours}h tra i turni (trovate solo {hours_between:.1f}h)"
 
 async def check_minimum_rest_hours(shift_data: ShiftCreate, resource: dict, time_slot: dict, db: Session) -> Optional[str]:
     """Check if minimum rest hours are respected between shifts"""
@@ -370,32 +1687,751 @@ async def check_minimum_rest_hours(shift_data: ShiftCreate, resource: dict, time
             existing_end += timedelta(days=1)
         
         # Calculate time between shifts
-        time_between_1 = abs((shift_start - existing_end).total_seconds() / 3600)
-        time_between_2 = abs((existing_start - shift_end).total_seconds() / 3600)
-        min_time_between = min(time_between_1, time_between_2)
+        min_time_between = rest_gap_hours(shift_start, shift_end, existing_start, existing_end)
         
         if 0 < min_time_between < min_rest_hours:
-            return f"Violazione ore di riposo minime: sono necessarie almeno {min_rest_hours}h tra i turni (trovate solo {min_time_between:.1f}h)"
-    
+            return rest_violation_message(min_rest_hours, min_time_between)
+
     return None
 
-# Authentication Endpoints
-@api_router.post("/auth/register")
-async def register(user_data: UserCreate, db: Session = Depends(get_db)):
-    # Check if user exists
-    existing_user = db.query(UserDB).filter(
-        (UserDB.username == user_data.username) | (UserDB.email == user_data.email)
-    ).first()
-    if existing_user:
-        raise HTTPException(status_code=400, detail="User already exists")
+# Rolling Labour Limits
+# Caps on average weekly hours over rolling windows: (resource column, window length in weeks)
+ROLLING_HOUR_LIMITS = (("max_avg_hours_4_weeks", 4), ("max_avg_hours_17_weeks", 17))
+ROLLING_LIMIT_COLUMNS = tuple(column for column, _ in ROLLING_HOUR_LIMITS) + ("max_consecutive_days",)
+# Days on each side of a checked day that its rolling windows can reach
+ROLLING_LIMIT_MARGIN_DAYS = max(weeks for _, weeks in ROLLING_HOUR_LIMITS) * 7 - 1
+
+def window_sums(daily: "np.ndarray", width: int) -> "np.ndarray":
+    """Sum of every `width`-day window of each row, from one prefix-sum pass (rows x days - width + 1)"""
+    prefix = np.zeros((daily.shape[0], daily.shape[1] + 1), dtype=np.int64)
+    np.cumsum(daily, axis=1, out=prefix[:, 1:])
+    return prefix[:, width:] - prefix[:, :-width]
+
+def sliding_max(values: "np.ndarray", width: int) -> "np.ndarray":
+    """Maximum of every `width`-wide window of each row in O(n): with blocks as wide as the window,
+    each window is the tail of one block plus the head of the next (van Herk / Gil-Werman)"""
+    rows, columns = values.shape
+    blocks = -(-columns // width)
+    padded = np.full((rows, blocks * width), np.iinfo(np.int64).min, dtype=np.int64)
+    padded[:, :columns] = values
+    blocked = padded.reshape(rows, blocks, width)
+    heads = np.maximum.accumulate(blocked, axis=2).reshape(rows, -1)
+    tails = np.maximum.accumulate(blocked[:, :, ::-1], axis=2)[:, :, ::-1].reshape(rows, -1)
+    count = columns - width + 1
+    return np.maximum(tails[:, :count], heads[:, width - 1:width - 1 + count])
+
+def runs_ending(worked: "np.ndarray") -> "np.ndarray":
+    """Length of the run of True ending at each column of each row (0 where False)"""
+    index = np.broadcast_to(np.arange(worked.shape[1]), worked.shape)
+    return index - np.maximum.accumulate(np.where(worked, -1, index), axis=1)
+
+def rolling_hours_message(weeks: int, limit: int, minutes: int) -> str:
+    return f"Violazione media ore su {weeks} settimane: massimo {limit}h a settimana (sarebbero {minutes / 60 / weeks:.1f}h)"
+
+def consecutive_days_message(limit: int, days: int) -> str:
+    return f"Violazione giorni lavorativi consecutivi: massimo {limit} (sarebbero {days})"
+
+class RollingLimits:
+    """Daily minutes of some resources over a date span, prepared for the rolling-window limits.
+    
+    The build is O(days) per resource: one prefix sum gives every 4- and 17-week window sum, a
+    sliding maximum gives the heaviest window containing each day, and run lengths give the
+    worked days just before and after each day. Adding a shift on a free day is then checked in
+    O(1). Load with a margin of ROLLING_LIMIT_MARGIN_DAYS around the days to check.
+    """
+    def __init__(self, resources: list, start: date, daily: "np.ndarray"):
+        self.resources = resources
+        self.rows = {resource.id: row for row, resource in enumerate(resources)}
+        self.start = start
+        self.daily = daily
+        self.sums = {}
+        self.heaviest = {}
+        for column, weeks in ROLLING_HOUR_LIMITS:
+            width = weeks * 7
+            sums = window_sums(daily, width)
+            # Pad with "no window" on both sides so column d of the maximum covers windows d-width+1 .. d
+            edge = np.full((len(resources), width - 1), np.iinfo(np.int64).min, dtype=np.int64)
+            self.sums[column] = sums
+            self.heaviest[column] = sliding_max(np.concatenate([edge, sums, edge], axis=1), width)
+        worked = daily > 0
+        no_day = np.zeros((len(resources), 1), dtype=np.int64)
+        self.run_before = np.concatenate([no_day, runs_ending(worked)[:, :-1]], axis=1)
+        self.run_after = np.concatenate([runs_ending(worked[:, ::-1])[:, ::-1][:, 1:], no_day], axis=1)
+    
+    @classmethod
+    def load(cls, db: Session, resources: list, first: date, last: date) -> "RollingLimits":
+        """Shifts of `resources` (live and archived) over [first, last] plus the margin.
+        
+        One query returns a row per resource with its day offsets and minutes concatenated, so a
+        year of a 1000-person site is 1000 short rows instead of ~350k.
+        """
+        start = first - timedelta(days=ROLLING_LIMIT_MARGIN_DAYS)
+        end = last + timedelta(days=ROLLING_LIMIT_MARGIN_DAYS)
+        rows = {resource.id: row for row, resource in enumerate(resources)}
+        daily = np.zeros((len(resources), (end - start).days + 1), dtype=np.int64)
+        for resource_id, days, minutes in db.connection().exec_driver_sql(
+            "SELECT resource_id, group_concat(CAST(julianday(date) - julianday(?) AS INTEGER)), group_concat(minutes) FROM shifts "
+            "WHERE resource_id IN (SELECT value FROM json_each(?)) AND date >= ? AND date <= ? GROUP BY resource_id",
+            (start.isoformat(), json.dumps(list(rows)), start.isoformat(), end.isoformat())
+        ):
+            daily[rows[resource_id], np.array(days.split(","), dtype=np.int64)] = np.array(minutes.split(","), dtype=np.int64)
+        for shift in load_archived_shifts(db, start=start, end=end):
+            if shift["resource_id"] in rows:
+                daily[rows[shift["resource_id"]], (date.fromisoformat(shift["date"]) - start).days] = shift["minutes"]
+        return cls(resources, start, daily)
+    
+    @classmethod
+    def load_changed(cls, db: Session, resources: list, first: date, last: date, removed: list, added: list) -> "RollingLimits":
+        """load(), then with the (resource_id, date, minutes) shifts of `removed` taken out and those of `added` put in"""
+        loaded = cls.load(db, resources, first, last)
+        daily = loaded.daily
+        for sign, shifts in ((-1, removed), (1, added)):
+            for resource_id, shift_date, minutes in shifts:
+                column = (shift_date - loaded.start).days
+                if resource_id in loaded.rows and 0 <= column < daily.shape[1]:
+                    daily[loaded.rows[resource_id], column] += sign * minutes
+        return cls(resources, loaded.start, daily)
+    
+    def violations(self, resource, day: date, minutes: int) -> List[str]:
+        """Rolling limits that one more shift of `minutes` on a free `day` would break"""
+        row, column_index = self.rows[resource.id], (day - self.start).days
+        messages = []
+        for column, weeks in ROLLING_HOUR_LIMITS:
+            limit = getattr(resource, column)
+            if limit is None:
+                continue
+            heaviest = int(self.heaviest[column][row, column_index]) + minutes
+            if heaviest > limit * 60 * weeks:
+                messages.append(rolling_hours_message(weeks, limit, heaviest))
+        if resource.max_consecutive_days is not None:
+            days = int(self.run_before[row, column_index] + 1 + self.run_after[row, column_index])
+            if days > resource.max_consecutive_days:
+                messages.append(consecutive_days_message(resource.max_consecutive_days, days))
+        return messages
+    
+    def scan(self, first: date, last: date) -> List[dict]:
+        """Every limit broken by the shifts already planned, for windows and runs touching [first, last]"""
+        first_index, last_index = (first - self.start).days, (last - self.start).days
+        found = []
+        for column, weeks in ROLLING_HOUR_LIMITS:
+            width = weeks * 7
+            caps = np.array([np.inf if getattr(resource, column) is None else getattr(resource, column) * 60 * weeks
+                             for resource in self.resources])
+            # Windows that contain at least one day of the range
+            lo = max(0, first_index - width + 1)
+            sums = self.sums[column][:, lo:last_index + 1]
+            over = sums > caps[:, None]
+            for row in np.flatnonzero(over.any(axis=1)):
+                worst = int(np.argmax(sums[row]))
+                window_start = self.start + timedelta(days=lo + worst)
+                found.append({
+                    "resource_id": self.resources[row].id,
+                    "rule": column,
+                    "limit": getattr(self.resources[row], column),
+                    "value": round(int(sums[row, worst]) / 60 / weeks, 1),
+                    "from_date": window_start.strftime("%Y-%m-%d"),
+                    "to_date": (window_start + timedelta(days=width - 1)).strftime("%Y-%m-%d"),
+                    "windows": int(over[row].sum())
+                })
+        caps = np.array([np.inf if resource.max_consecutive_days is None else resource.max_consecutive_days
+                         for resource in self.resources])
+        worked = self.daily[:, first_index:last_index + 1] > 0
+        runs = np.where(worked, self.run_before[:, first_index:last_index + 1] + 1 + self.run_after[:, first_index:last_index + 1], 0)
+        for row in np.flatnonzero((runs > caps[:, None]).any(axis=1)):
+            longest = int(np.argmax(runs[row]))
+            run_start = first_index + longest - int(self.run_before[row, first_index + longest])
+            found.append({
+                "resource_id": self.resources[row].id,
+                "rule": "max_consecutive_days",
+                "limit": self.resources[row].max_consecutive_days,
+                "value": int(runs[row, longest]),
+                "from_date": (self.start + timedelta(days=run_start)).strftime("%Y-%m-%d"),
+                "to_date": (self.start + timedelta(days=run_start + int(runs[row, longest]) - 1)).strftime("%Y-%m-%d"),
+                "windows": None
+            })
+        return found
+
+# Resource Unavailability
+def shift_window(shift_date: date, start_time: time, end_time: time) -> tuple:
+    """[start, end) datetimes of a shift, overnight slots ending the next day"""
+    start = datetime.combine(shift_date, start_time)
+    end = datetime.combine(shift_date, end_time)
+    if end <= start:
+        end += timedelta(days=1)
+    return start, end
+
+class UnavailabilityIndex:
+    """Unavailability intervals of a time window, merged and sorted per resource.
+
+    Built from a single query; lookups are a binary search over disjoint intervals, so
+    bulk paths can check thousands of assignments without going back to the database.
+    """
+    def __init__(self, rows):
+        by_resource: Dict[str, list] = {}
+        for resource_id, start_at, end_at, reason in sorted(rows, key=lambda row: (row[0], row[1])):
+            intervals = by_resource.setdefault(resource_id, [])
+            if intervals and start_at <= intervals[-1][1]:
+                last = intervals[-1]
+                intervals[-1] = (last[0], max(last[1], end_at), last[2] | {reason})
+            else:
+                intervals.append((start_at, end_at, {reason}))
+        self._intervals = by_resource
+        self._starts = {resource_id: [interval[0] for interval in intervals] for resource_id, intervals in by_resource.items()}
+
+    @classmethod
+    def load(cls, db: Session, start: datetime, end: datetime, resource_ids: Optional[List[str]] = None) -> "UnavailabilityIndex":
+        query = db.query(UnavailabilityDB.resource_id, UnavailabilityDB.start_at, UnavailabilityDB.end_at, UnavailabilityDB.reason).filter(
+            UnavailabilityDB.end_at > start,
+            UnavailabilityDB.start_at < end
+        )
+        if resource_ids is not None:
+            query = query.filter(UnavailabilityDB.resource_id.in_(resource_ids))
+        return cls(query.all())
+
+    def find(self, resource_id: str, start: datetime, end: datetime) -> Optional[tuple]:
+        """The merged (start, end, reasons) interval overlapping [start, end), if any"""
+        starts = self._starts.get(resource_id)
+        if not starts:
+            return None
+        # Intervals are disjoint: only the last one starting before `end` can reach past `start`
+        position = bisect.bisect_left(starts, end) - 1
+        if position >= 0 and self._intervals[resource_id][position][1] > start:
+            return self._intervals[resource_id][position]
+        return None
+
+    def day_mask(self, resource_id: str, days: List[date]) -> List[str]:
+        mask = []
+        for day in days:
+            day_start = datetime.combine(day, time.min)
+            day_end = day_start + timedelta(days=1)
+            interval = self.find(resource_id, day_start, day_end)
+            if interval is None:
+                mask.append("available")
+            elif interval[0] <= day_start and interval[1] >= day_end:
+                mask.append("unavailable")
+            else:
+                mask.append("partial")
+        return mask
+
+def unavailability_message(interval: tuple) -> str:
+    reasons = "/".join(sorted(UNAVAILABILITY_REASON_LABELS[reason] for reason in interval[2]))
+    return f"La risorsa non è disponibile in questo turno ({reasons} dal {interval[0].strftime('%d/%m/%Y %H:%M')} al {interval[1].strftime('%d/%m/%Y %H:%M')})"
+
+def unavailability_to_model(entry: UnavailabilityDB) -> Unavailability:
+    # Whole-day absences are stored up to midnight after the last day
+    whole_days = entry.start_at.time() == time.min and entry.end_at.time() == time.min
+    last_day = entry.end_at.date() - timedelta(days=1) if whole_days else entry.end_at.date()
+    return Unavailability(
+        id=entry.id,
+        resource_id=entry.resource_id,
+        start_date=entry.start_at.strftime("%Y-%m-%d"),
+        end_date=last_day.strftime("%Y-%m-%d"),
+        start_time=None if whole_days else entry.start_at.strftime("%H:%M"),
+        end_time=None if whole_days else entry.end_at.strftime("%H:%M"),
+        reason=entry.reason,
+        note=entry.note,
+        created_at=entry.created_at
+    )
+
+# Shift Archive
+# Weeks ending before the Monday this many weeks ago leave the live shifts table
+ARCHIVE_HORIZON_WEEKS = int(os.environ.get("ARCHIVE_HORIZON_WEEKS", "52"))
+SHIFT_ARCHIVE_FIELDS = SHIFT_JOURNAL_FIELDS + ("created_at",)
+
+def archive_cutoff(horizon_weeks: int) -> date:
+    """Monday `horizon_weeks` weeks before the current week; shifts dated earlier get archived"""
+    today = date.today()
+    return today - timedelta(days=today.weekday(), weeks=horizon_weeks)
+
+def week_is_archived(db: Session, week_number: int, year: int) -> bool:
+    return db.query(ShiftArchiveDB.id).filter(
+        ShiftArchiveDB.week_number == week_number,
+        ShiftArchiveDB.year == year
+    ).first() is not None
+
+def load_archived_shifts(db: Session, week: Optional[tuple] = None, start: Optional[date] = None, end: Optional[date] = None) -> List[dict]:
+    """Archived shifts of one (week_number, year) or dated within [start, end], as dicts of SHIFT_ARCHIVE_FIELDS"""
+    query = db.query(ShiftArchiveDB.payload)
+    if week:
+        query = query.filter(ShiftArchiveDB.week_number == week[0], ShiftArchiveDB.year == week[1])
+    else:
+        query = query.filter(ShiftArchiveDB.first_date <= end, ShiftArchiveDB.last_date >= start)
+    
+    shifts = []
+    for (payload,) in query.all():
+        for values in json.loads(gzip.decompress(payload)):
+            shift = dict(zip(SHIFT_ARCHIVE_FIELDS, values))
+            if week or start.isoformat() <= shift["date"] <= end.isoformat():
+                shifts.append(shift)
+    return shifts
+
+def archive_week(db: Session, week_number: int, year: int) -> int:
+    """Move the live shifts of one week into its archive row in a single short write transaction (committed)"""
+    conn = db.connection()
+    # Take the write lock before reading so nothing changes the week between the copy and the delete
+    conn.exec_driver_sql("BEGIN IMMEDIATE")
+    try:
+        columns = ", ".join(SHIFT_ARCHIVE_FIELDS)
+        rows = conn.exec_driver_sql(
+            f"SELECT {columns} FROM shifts WHERE week_number = ? AND year = ? ORDER BY date",
+            (week_number, year)
+        ).fetchall()
+        if not rows:
+            db.rollback()
+            return 0
+        
+        shifts = [list(row) for row in rows]
+        archive = db.query(ShiftArchiveDB).filter(
+            ShiftArchiveDB.week_number == week_number,
+            ShiftArchiveDB.year == year
+        ).first()
+        if archive:
+            # Shifts added to the week after an earlier run (e.g. an undo) join the existing archive
+            shifts = json.loads(gzip.decompress(archive.payload)) + shifts
+        else:
+            archive = ShiftArchiveDB(week_number=week_number, year=year)
+            db.add(archive)
+        
+        date_index = SHIFT_ARCHIVE_FIELDS.index("date")
+        minutes_index = SHIFT_ARCHIVE_FIELDS.index("minutes")
+        overtime_index = SHIFT_ARCHIVE_FIELDS.index("overtime_minutes")
+        archive.first_date = datetime.strptime(min(shift[date_index] for shift in shifts)[:10], "%Y-%m-%d").date()
+        archive.last_date = datetime.strptime(max(shift[date_index] for shift in shifts)[:10], "%Y-%m-%d").date()
+        archive.shift_count = len(shifts)
+        archive.total_minutes = sum(shift[minutes_index] or 0 for shift in shifts)
+        archive.total_overtime_minutes = sum(shift[overtime_index] or 0 for shift in shifts)
+        archive.payload = gzip.compress(
+            json.dumps(shifts, separators=(",", ":"), ensure_ascii=False, default=str).encode("utf-8"), mtime=0
+        )
+        archive.archived_at = datetime.utcnow()
+        
+        conn.exec_driver_sql("DELETE FROM shifts WHERE week_number = ? AND year = ?", (week_number, year))
+        bump_data_versions(db, ["shifts"])
+        bump_week_versions(db, [(week_number, year)])
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return len(rows)
+
+def archive_old_weeks(db: Session, horizon_weeks: int = ARCHIVE_HORIZON_WEEKS, context: Optional[JobContext] = None) -> dict:
+    """Archive every week with shifts before the horizon, one week per transaction.
+    
+    The write lock is held only while one week is copied and deleted, so requests keep
+    writing between batches. Freed pages are reused by new shifts, which keeps the file
+    from growing; archived weeks stay readable through load_archived_shifts.
+    """
+    cutoff = archive_cutoff(horizon_weeks)
+    weeks = db.connection().exec_driver_sql(
+        "SELECT year, week_number FROM shifts WHERE date < ? GROUP BY year, week_number ORDER BY year, week_number",
+        (cutoff.isoformat(),)
+    ).fetchall()
+    db.rollback()
+    
+    archived_weeks, archived_shifts = [], 0
+    started = perf_counter()
+    for index, (year, week_number) in enumerate(weeks):
+        if context:
+            context.progress(index, len(weeks), f"Settimana {week_number}/{year}")
+        count = archive_week(db, week_number, year)
+        if count:
+            archived_weeks.append({"week_number": week_number, "year": year, "shifts": count})
+            archived_shifts += count
+    
+    return {
+        "horizon_weeks": horizon_weeks,
+        "cutoff": cutoff.strftime("%Y-%m-%d"),
+        "archived_weeks": archived_weeks,
+        "archived_shifts": archived_shifts,
+        "elapsed_ms": round((perf_counter() - started) * 1000, 1)
+    }
+
+JOB_HANDLERS["archive_weeks"] = lambda context: archive_old_weeks(
+    context.db, context.params.get("horizon_weeks", ARCHIVE_HORIZON_WEEKS), context
+)
+
+# Schedule Matrices
+def load_schedule_matrix(db: Session, start: date, end: date) -> dict:
+    """Shifts of [start, end] as parallel NumPy index arrays (day, slot, resource).
+    
+    One query over the covering date/slot/resource index returns a row per day and slot with
+    its resources concatenated, so a year of a 1000-person site is ~2k rows instead of ~250k.
+    Slots are ordered by start time; resources are the active ones plus anyone with a shift
+    in the range. Archived weeks in the range are merged in. Dense views (day x slot x resource, resource x day) are built from these.
+    """
+    time_slot_ids = [row[0] for row in db.query(TimeSlotDB.id).order_by(TimeSlotDB.start_time).all()]
+    resource_ids = [row[0] for row in db.query(ResourceDB.id).filter(ResourceDB.is_active == True).order_by(ResourceDB.name).all()]
+    
+    rows = db.connection().exec_driver_sql(
+        "SELECT date, time_slot_id, group_concat(resource_id) FROM shifts "
+        "WHERE date >= ? AND date <= ? GROUP BY date, time_slot_id",
+        (start.isoformat(), end.isoformat())
+    ).fetchall()
+    
+    archived_cells: Dict[tuple, list] = {}
+    for shift in load_archived_shifts(db, start=start, end=end):
+        archived_cells.setdefault((shift["date"], shift["time_slot_id"]), []).append(shift["resource_id"])
+    rows += [(day, slot_id, ",".join(members)) for (day, slot_id), members in archived_cells.items()]
+    
+    slot_index = {slot_id: index for index, slot_id in enumerate(time_slot_ids)}
+    resource_index = {resource_id: index for index, resource_id in enumerate(resource_ids)}
+    cell_slots, cell_sizes, cell_resources = [], [], []
+    for _, slot_id, members in rows:
+        if slot_id not in slot_index:
+            slot_index[slot_id] = len(time_slot_ids)
+            time_slot_ids.append(slot_id)
+        members = members.split(",")
+        for resource_id in members:
+            if resource_id not in resource_index:
+                resource_index[resource_id] = len(resource_ids)
+                resource_ids.append(resource_id)
+        cell_slots.append(slot_index[slot_id])
+        cell_sizes.append(len(members))
+        cell_resources.append(np.fromiter(map(resource_index.__getitem__, members), dtype=np.int32, count=len(members)))
+    
+    cell_days = (np.array([row[0] for row in rows], dtype="datetime64[D]") - np.datetime64(start)).astype(np.int32)
+    return {
+        "start": start,
+        "days": (end - start).days + 1,
+        "time_slot_ids": time_slot_ids,
+        "resource_ids": resource_ids,
+        "day": np.repeat(cell_days, cell_sizes),
+        "slot": np.repeat(np.array(cell_slots, dtype=np.int32), cell_sizes),
+        "resource": np.concatenate(cell_resources) if cell_resources else np.zeros(0, dtype=np.int32),
+    }
+
+def slot_code_matrix(matrix: dict) -> "np.ndarray":
+    """resource x day array of slot indexes, -1 where the resource does not work (one shift per day)"""
+    codes = np.full((len(matrix["resource_ids"]), matrix["days"]), -1, dtype=np.int16)
+    codes[matrix["resource"], matrix["day"]] = matrix["slot"]
+    return codes
+
+def longest_runs(worked: "np.ndarray") -> "np.ndarray":
+    """Longest run of True per row of a boolean matrix"""
+    rows, columns = worked.shape
+    # A False column after every row keeps runs from spilling into the next row
+    padded = np.concatenate([worked, np.zeros((rows, 1), dtype=bool)], axis=1).ravel()
+    breaks = np.flatnonzero(~padded)
+    run_lengths = np.diff(np.concatenate([[-1], breaks])) - 1
+    longest = np.zeros(rows, dtype=np.int32)
+    np.maximum.at(longest, breaks // (columns + 1), run_lengths)
+    return longest
+
+def gini_coefficient(values: "np.ndarray") -> float:
+    """0 when everybody has the same amount, towards 1 when one person has everything"""
+    values = np.sort(np.asarray(values, dtype=np.float64))
+    total = values.sum()
+    if len(values) == 0 or total == 0:
+        return 0.0
+    ranks = np.arange(1, len(values) + 1)
+    return float(round((2 * (ranks * values).sum()) / (len(values) * total) - (len(values) + 1) / len(values), 4))
+
+def is_night_slot(start_time: time, end_time: time) -> bool:
+    """Slots crossing midnight or starting from 22:00"""
+    return end_time <= start_time or start_time >= time(22, 0)
+
+def coverage_target_matrix(db: Session, matrix: dict) -> "np.ndarray":
+    """Required people as a day x slot array: weekday targets, then date overrides (-1 = no target)"""
+    start, days, time_slot_ids = matrix["start"], matrix["days"], matrix["time_slot_ids"]
+    slot_index = {slot_id: index for index, slot_id in enumerate(time_slot_ids)}
+    end = start + timedelta(days=days - 1)
+    
+    weekly = np.full((7, len(time_slot_ids)), -1, dtype=np.int32)
+    overrides = []
+    for slot_id, weekday, override_date, required in db.query(
+        CoverageTargetDB.time_slot_id, CoverageTargetDB.weekday, CoverageTargetDB.date, CoverageTargetDB.required
+    ).filter((CoverageTargetDB.date == None) | ((CoverageTargetDB.date >= start) & (CoverageTargetDB.date <= end))).all():
+        if slot_id not in slot_index:
+            continue
+        if override_date is None:
+            weekly[weekday, slot_index[slot_id]] = required
+        else:
+            overrides.append(((override_date - start).days, slot_index[slot_id], required))
+    
+    targets = weekly[(start.weekday() + np.arange(days)) % 7]
+    for day, slot, required in overrides:
+        targets[day, slot] = required
+    return targets
+
+# Published Snapshots
+def serialize_shift(shift: ShiftDB, resource: Optional[ResourceDB], time_slot: Optional[TimeSlotDB]) -> dict:
+    """Shift dictionary as returned by the shift list endpoints"""
+    return {
+        "id": shift.id,
+        "resource_id": shift.resource_id,
+        "time_slot_id": shift.time_slot_id,
+        "date": shift.date.strftime("%Y-%m-%d"),
+        "week_number": shift.week_number,
+        "year": shift.year,
+        "hours": minutes_to_hours(shift.minutes),
+        "overtime_hours": minutes_to_hours(shift.overtime_minutes),
+        "extra_overtime_hours": minutes_to_hours(shift.extra_overtime_minutes),
+        "created_at": shift.created_at,
+        "resource": {
+            "id": resource.id,
+            "name": resource.name,
+            "email": resource.email
+        } if resource else None,
+        "time_slot": {
+            "id": time_slot.id,
+            "name": time_slot.name,
+            "start_time": time_slot.start_time.strftime("%H:%M"),
+            "end_time": time_slot.end_time.strftime("%H:%M")
+        } if time_slot else None
+    }
+
+def load_week_shifts(db: Session, week_number: int, year: int) -> list:
+    """Serialized live shifts of a week, fetched with a single joined query"""
+    rows = db.query(ShiftDB, ResourceDB, TimeSlotDB).outerjoin(
+        ResourceDB, ResourceDB.id == ShiftDB.resource_id
+    ).outerjoin(
+        TimeSlotDB, TimeSlotDB.id == ShiftDB.time_slot_id
+    ).filter(
+        ShiftDB.week_number == week_number,
+        ShiftDB.year == year
+    ).order_by(ShiftDB.date, ShiftDB.resource_id).all()
+    
+    return jsonable_encoder([serialize_shift(shift, resource, time_slot) for shift, resource, time_slot in rows])
+
+def build_week_snapshot(db: Session, week_number: int, year: int, shifts: Optional[list] = None, publication_id: Optional[str] = None) -> PublishedSnapshotDB:
+    """Freeze the shifts of a week into a new snapshot version (not committed).
+    
+    The version is max + 1, so call it inside a write transaction (BEGIN IMMEDIATE) that also
+    covers the read: two publishes of the same week then get consecutive versions.
+    """
+    if shifts is None:
+        shifts = load_week_shifts(db, week_number, year)
+    raw = json.dumps(shifts, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    
+    last_version = db.query(PublishedSnapshotDB.version).filter(
+        PublishedSnapshotDB.week_number == week_number,
+        PublishedSnapshotDB.year == year
+    ).order_by(PublishedSnapshotDB.version.desc()).first()
+    
+    snapshot = PublishedSnapshotDB(
+        week_number=week_number,
+        year=year,
+        version=(last_version[0] + 1) if last_version else 1,
+        publication_id=publication_id,
+        payload=gzip.compress(raw, mtime=0),
+        content_hash=hashlib.sha256(raw).hexdigest(),
+        shift_count=len(shifts)
+    )
+    db.add(snapshot)
+    return snapshot
+
+def get_snapshot(db: Session, week_number: int, year: int, version: Optional[int] = None) -> Optional[PublishedSnapshotDB]:
+    """A given snapshot version of a week, or the latest one"""
+    query = db.query(PublishedSnapshotDB).filter(
+        PublishedSnapshotDB.week_number == week_number,
+        PublishedSnapshotDB.year == year
+    )
+    if version is not None:
+        return query.filter(PublishedSnapshotDB.version == version).first()
+    return query.order_by(PublishedSnapshotDB.version.desc()).first()
+
+def snapshot_shifts(snapshot: Optional[PublishedSnapshotDB]) -> list:
+    return json.loads(gzip.decompress(snapshot.payload)) if snapshot else []
+
+def get_published_snapshot_heads(db: Session, week_number: Optional[int] = None, year: Optional[int] = None) -> list:
+    """(id, week_number, year, content_hash) of the latest snapshot of every published week, payload not loaded.
+    
+    Read-only: weeks published before snapshots existed were frozen by migration 016.
+    """
+    plans = db.query(WeeklyPlanDB.week_number, WeeklyPlanDB.year).filter(WeeklyPlanDB.is_published == True)
+    if week_number is not None and year is not None:
+        plans = plans.filter(WeeklyPlanDB.week_number == week_number, WeeklyPlanDB.year == year)
+    published_weeks = set(plans.all())
+
+    heads = {}
+    snapshots = db.query(
+        PublishedSnapshotDB.id,
+        PublishedSnapshotDB.week_number,
+        PublishedSnapshotDB.year,
+        PublishedSnapshotDB.version,
+        PublishedSnapshotDB.content_hash
+    )
+    if week_number is not None and year is not None:
+        snapshots = snapshots.filter(PublishedSnapshotDB.week_number == week_number, PublishedSnapshotDB.year == year)
+    for snapshot in snapshots.all():
+        key = (snapshot.week_number, snapshot.year)
+        if key in published_weeks and (key not in heads or snapshot.version > heads[key].version):
+            heads[key] = snapshot
+    return [(heads[key].id, key[0], key[1], heads[key].content_hash) for key in sorted(heads, key=lambda k: (k[1], k[0]))]
+
+def etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    return if_none_match.strip() == "*" or etag in [tag.strip() for tag in if_none_match.split(",")]
+
+class NotModified(Exception):
+    def __init__(self, etag: str):
+        self.etag = etag
+
+def etag_headers(etag: str) -> dict:
+    """Validator headers of a versioned_etag response; the ETag depends on the negotiated encoding"""
+    return {"ETag": etag, "Cache-Control": "private, no-cache", "Vary": "Accept-Encoding"}
+
+def versioned_etag(*scopes):
+    """Dependency answering If-None-Match with 304 before the endpoint queries anything.
+    
+    The strong ETag is derived from the data versions of the scopes the response depends on
+    (plus database, URL and API version), so it costs one PRAGMA instead of hashing the body.
+    br and gzip bodies are representations of their own: their ETags get a -br / -gzip suffix.
+    """
+    def dependency(request: Request, response: Response, db: Session = Depends(get_db)) -> str:
+        versions = get_data_versions(db, *scopes)
+        fingerprint = f"{app.version}|{db.get_bind().url.database}|{request.url.path}?{request.url.query}|{versions}"
+        encoding = response_encoding(request.headers.get("accept-encoding", ""))
+        etag = f'"{hashlib.sha1(fingerprint.encode()).hexdigest()}{"-" + encoding if encoding else ""}"'
+        if etag_matches(request, etag):
+            raise NotModified(etag)
+        response.headers.update(etag_headers(etag))
+        return etag
+    return dependency
+
+# Week Versions
+# Optimistic concurrency for planners editing the same week: every change to a week's shifts
+# moves its version on, and a write based on an older version gets 409 instead of waiting.
+class WeekConflict(Exception):
+    def __init__(self, week_number: int, year: int, version: int):
+        self.week_number = week_number
+        self.year = year
+        self.version = version
+
+def week_version(db: Session, week_number: int, year: int) -> int:
+    return db.connection().exec_driver_sql(
+        "SELECT version FROM week_versions WHERE year = ? AND week_number = ?", (year, week_number)
+    ).scalar() or 0
+
+def if_match_version(request: Request) -> Optional[int]:
+    """Week version sent as If-Match ("7", 7 or W/"7"); None when absent or *"""
+    value = (request.headers.get("if-match") or "").strip()
+    if not value or value == "*":
+        return None
+    try:
+        return int(value.removeprefix("W/").strip('"'))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid If-Match header")
+
+def expected_week_version(request: Request, db: Session, week_number: int, year: int) -> int:
+    """Version a write to the week is based on: the client's If-Match, checked right away, else the current one"""
+    current = week_version(db, week_number, year)
+    expected = if_match_version(request)
+    if expected is not None and expected != current:
+        raise WeekConflict(week_number, year, current)
+    return current
+
+def claim_week(db: Session, week_number: int, year: int, expected: int) -> int:
+    """Compare-and-set the week from `expected` to the next version; returns the new version.
+    
+    Must be the first write of the transaction: if another planner committed a change to the week
+    since `expected` was read nothing matches, the transaction is rolled back and WeekConflict raised.
+    """
+    conn = db.connection()
+    if expected == 0:
+        claimed = conn.exec_driver_sql(
+            "INSERT INTO week_versions (year, week_number, version) VALUES (?, ?, 1) ON CONFLICT(year, week_number) DO NOTHING",
+            (year, week_number)
+        ).rowcount
+    else:
+        claimed = conn.exec_driver_sql(
+            "UPDATE week_versions SET version = version + 1 WHERE year = ? AND week_number = ? AND version = ?",
+            (year, week_number, expected)
+        ).rowcount
+    if not claimed:
+        db.rollback()
+        raise WeekConflict(week_number, year, week_version(db, week_number, year))
+    return expected + 1
+
+def bump_week_versions(db: Session, weeks) -> None:
+    """Unconditional bump of (week_number, year) pairs, for bulk changes spanning several weeks (one statement)"""
+    weeks = sorted(set(weeks), key=lambda week: (week[1], week[0]))
+    if not weeks:
+        return
+    # WHERE true: an upsert fed by a SELECT needs it to parse the ON CONFLICT clause
+    db.connection().exec_driver_sql(
+        "INSERT INTO week_versions (year, week_number, version) "
+        "SELECT json_extract(value, '$[1]'), json_extract(value, '$[0]'), 1 FROM json_each(?) WHERE true "
+        "ON CONFLICT(year, week_number) DO UPDATE SET version = version + 1",
+        (json.dumps(weeks),)
+    )
+
+# Publication Diffs
+def shift_signature(shift: dict) -> tuple:
+    return (shift["time_slot_id"], shift["hours"], shift["overtime_hours"], shift["extra_overtime_hours"])
+
+def diff_week_shifts(old_shifts: list, new_shifts: list) -> dict:
+    """Compact per-resource diff between two versions of a week, keyed by (resource, date) in O(n)"""
+    old_by_key = {(shift["resource_id"], shift["date"]): shift for shift in old_shifts}
+    new_by_key = {(shift["resource_id"], shift["date"]): shift for shift in new_shifts}
+    
+    resources = {}
+    def entry(resource_id):
+        return resources.setdefault(resource_id, {"added": [], "removed": [], "moved": []})
+    
+    for key, shift in new_by_key.items():
+        old = old_by_key.get(key)
+        if old is None:
+            entry(key[0])["added"].append(shift["id"])
+        elif shift_signature(old) != shift_signature(shift):
+            entry(key[0])["moved"].append([old["id"], shift["id"]])
+    for key, shift in old_by_key.items():
+        if key not in new_by_key:
+            entry(key[0])["removed"].append(shift["id"])
+    
+    # Drop empty lists to keep changes_log small
+    return {
+        resource_id: {kind: ids for kind, ids in changes.items() if ids}
+        for resource_id, changes in resources.items()
+    }
+
+def diff_counts(diff: dict) -> dict:
+    counts = {"added": 0, "removed": 0, "moved": 0}
+    for changes in diff.values():
+        for kind, ids in changes.items():
+            counts[kind] += len(ids)
+    return counts
+
+def expand_week_diff(diff: dict, old_shifts: list, new_shifts: list) -> dict:
+    """Resolve the shift ids of a compact diff into records clients can apply directly"""
+    old_by_id = {shift["id"]: shift for shift in old_shifts}
+    new_by_id = {shift["id"]: shift for shift in new_shifts}
+    
+    added, removed, moved = [], [], []
+    for changes in diff.values():
+        added.extend(new_by_id[shift_id] for shift_id in changes.get("added", []))
+        removed.extend(old_by_id[shift_id] for shift_id in changes.get("removed", []))
+        moved.extend({"previous_id": old_id, "shift": new_by_id[new_id]} for old_id, new_id in changes.get("moved", []))
+    
+    return {"added": added, "removed": removed, "moved": moved}
+
+# Authentication Endpoints
+@api_router.post("/auth/register")
+async def register(user_data: UserCreate, db: Session = Depends(get_main_db)):
+    # Hash before touching the database so no connection is held while the KDF runs
+    password_hash = await hash_password_async(user_data.password)
+    
+    # Check if user exists
+    existing_user = db.query(UserDB).filter(
+        (UserDB.username == user_data.username) | (UserDB.email == user_data.email)
+    ).first()
+    if existing_user:
+        raise HTTPException(status_code=400, detail="User already exists")
+    
+    if user_data.site_id and user_data.site_id != DEFAULT_SITE_ID:
+        if not db.query(SiteDB).filter(SiteDB.id == user_data.site_id).first():
+            raise HTTPException(status_code=400, detail="Site not found")
     
     # Create user
     user = UserDB(
         username=user_data.username,
         email=user_data.email,
-        password=hash_password(user_data.password),
+        password=password_hash,
         full_name=user_data.full_name,
-        role=user_data.role
+        role=user_data.role,
+        site_id=user_data.site_id
     )
     
     db.add(user)
@@ -406,7 +2442,8 @@ async def register(user_data: UserCreate, db: Session = Depends(get_db)):
     token = create_jwt_token({
         "id": user.id,
         "username": user.username,
-        "role": user.role.value
+        "role": user.role.value,
+        "site_id": user.site_id
     })
     
     return {"token": token, "user": User(
@@ -416,22 +2453,37 @@ async def register(user_data: UserCreate, db: Session = Depends(get_db)):
         full_name=user.full_name,
         role=user.role,
         created_at=user.created_at,
-        is_active=user.is_active
+        is_active=user.is_active,
+        site_id=user.site_id
     )}
 
 @api_router.post("/auth/login")
-async def login(login_data: UserLogin, db: Session = Depends(get_db)):
+async def login(login_data: UserLogin, db: Session = Depends(get_main_db)):
     user = db.query(UserDB).filter(UserDB.username == login_data.username).first()
-    if not user or not verify_password(login_data.password, user.password):
+    # Detach the user and give the connection back to the pool while the KDF runs on the hashing workers
+    if user:
+        db.expunge(user)
+    db.rollback()
+    if not user or not await verify_password_async(login_data.password, user.password):
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
     if not user.is_active:
         raise HTTPException(status_code=401, detail="Account deactivated")
     
+    # Upgrade legacy SHA-256 (or outdated cost) hashes now that we know the plain password
+    if needs_rehash(user.password):
+        new_hash = await hash_password_async(login_data.password)
+        db.query(UserDB).filter(UserDB.id == user.id, UserDB.password == user.password).update(
+            {UserDB.password: new_hash}, synchronize_session=False
+        )
+        bump_data_versions(db, ["users"])
+        db.commit()
+    
     token = create_jwt_token({
         "id": user.id,
         "username": user.username,
-        "role": user.role.value
+        "role": user.role.value,
+        "site_id": user.site_id
     })
     
     return {"token": token, "user": User(
@@ -441,25 +2493,53 @@ async def login(login_data: UserLogin, db: Session = Depends(get_db)):
         full_name=user.full_name,
         role=user.role,
         created_at=user.created_at,
-        is_active=user.is_active
+        is_active=user.is_active,
+        site_id=user.site_id
     )}
 
 @api_router.get("/auth/me")
 async def get_me(current_user: User = Depends(get_current_user)):
     return current_user
 
+# Sites Endpoints
+@api_router.get("/sites", response_model=List[Site])
+async def get_sites(admin_user: User = Depends(get_admin_user), main_db: Session = Depends(get_main_db)):
+    sites = main_db.query(SiteDB).filter(SiteDB.is_active == True).order_by(SiteDB.id).all()
+    return [Site(id=site.id, name=site.name, is_active=site.is_active, created_at=site.created_at) for site in sites]
+
+@api_router.post("/sites", response_model=Site)
+async def create_site(site_data: SiteCreate, admin_user: User = Depends(get_admin_user), main_db: Session = Depends(get_main_db)):
+    if not re.fullmatch(r"[a-z0-9][a-z0-9_-]{0,49}", site_data.id) or site_data.id == DEFAULT_SITE_ID:
+        raise HTTPException(status_code=400, detail="Invalid site id. Use lowercase letters, digits, '-' and '_'")
+    if main_db.query(SiteDB).filter(SiteDB.id == site_data.id).first():
+        raise HTTPException(status_code=400, detail="Site already exists")
+    
+    Path(SITES_DIR).mkdir(parents=True, exist_ok=True)
+    site = SiteDB(
+        id=site_data.id,
+        name=site_data.name,
+        database_file=str(Path(SITES_DIR) / f"{site_data.id}.db")
+    )
+    main_db.add(site)
+    main_db.commit()
+    main_db.refresh(site)
+    
+    # Create the site database right away
+    get_site_sessionmaker(site.id)
+    
+    return Site(id=site.id, name=site.name, is_active=site.is_active, created_at=site.created_at)
+
 # Time Slots Endpoints
 @api_router.get("/timeslots", response_model=List[TimeSlot])
-async def get_time_slots(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    slots = db.query(TimeSlotDB).all()
-    return [TimeSlot(
+async def get_time_slots(current_user: User = Depends(get_current_user), db: Session = Depends(get_db), etag: str = Depends(versioned_etag("time_slots"))):
+    return time_slot_cache.get(db, "all", lambda: [TimeSlot(
         id=slot.id,
         name=slot.name,
         start_time=slot.start_time.strftime("%H:%M"),
         end_time=slot.end_time.strftime("%H:%M"),
         is_custom=slot.is_custom,
         created_at=slot.created_at
-    ) for slot in slots]
+    ) for slot in db.query(TimeSlotDB).all()])
 
 @api_router.post("/timeslots", response_model=TimeSlot)
 async def create_time_slot(slot_data: TimeSlotCreate, admin_user: User = Depends(get_admin_user), db: Session = Depends(get_db)):
@@ -537,6 +2617,8 @@ async def delete_time_slot(slot_id: str, admin_user: User = Depends(get_admin_us
     if not slot:
         raise HTTPException(status_code=404, detail="Time slot not found")
     
+    for target in db.query(CoverageTargetDB).filter(CoverageTargetDB.time_slot_id == slot_id).all():
+        db.delete(target)
     db.delete(slot)
     db.commit()
     
@@ -544,17 +2626,42 @@ async def delete_time_slot(slot_id: str, admin_user: User = Depends(get_admin_us
 
 # Resources Endpoints
 @api_router.get("/resources", response_model=List[Resource])
-async def get_resources(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    resources = db.query(ResourceDB).filter(ResourceDB.is_active == True).all()
-    return [Resource(
+async def get_resources(week: Optional[int] = None, year: Optional[int] = None, current_user: User = Depends(get_current_user), db: Session = Depends(get_db), etag: str = Depends(versioned_etag("resources", "unavailability"))):
+    """Active resources; with week and year each one carries its availability mask for that week"""
+    if week and year:
+        try:
+            days = [date.fromisocalendar(year, week, weekday) for weekday in range(1, 8)]
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid week")
+        return resource_cache.get(db, ("active", year, week), lambda: load_resources_with_availability(db, days))
+    return resource_cache.get(db, "active", lambda: [Resource(
         id=resource.id,
         name=resource.name,
         email=resource.email,
         weekly_hour_limit=resource.weekly_hour_limit,
         min_rest_hours=resource.min_rest_hours,
+        max_avg_hours_4_weeks=resource.max_avg_hours_4_weeks,
+        max_avg_hours_17_weeks=resource.max_avg_hours_17_weeks,
+        max_consecutive_days=resource.max_consecutive_days,
         is_active=resource.is_active,
         created_at=resource.created_at
-    ) for resource in resources]
+    ) for resource in db.query(ResourceDB).filter(ResourceDB.is_active == True).all()])
+
+def load_resources_with_availability(db: Session, days: List[date]) -> List[Resource]:
+    index = UnavailabilityIndex.load(db, datetime.combine(days[0], time.min), datetime.combine(days[-1] + timedelta(days=1), time.min))
+    return [Resource(
+        id=resource.id,
+        name=resource.name,
+        email=resource.email,
+        weekly_hour_limit=resource.weekly_hour_limit,
+        min_rest_hours=resource.min_rest_hours,
+        max_avg_hours_4_weeks=resource.max_avg_hours_4_weeks,
+        max_avg_hours_17_weeks=resource.max_avg_hours_17_weeks,
+        max_consecutive_days=resource.max_consecutive_days,
+        is_active=resource.is_active,
+        created_at=resource.created_at,
+        availability=index.day_mask(resource.id, days)
+    ) for resource in db.query(ResourceDB).filter(ResourceDB.is_active == True).all()]
 
 @api_router.post("/resources", response_model=Resource)
 async def create_resource(resource_data: ResourceCreate, admin_user: User = Depends(get_admin_user), db: Session = Depends(get_db)):
@@ -567,7 +2674,10 @@ async def create_resource(resource_data: ResourceCreate, admin_user: User = Depe
         name=resource_data.name,
         email=resource_data.email,
         weekly_hour_limit=resource_data.weekly_hour_limit,
-        min_rest_hours=resource_data.min_rest_hours
+        min_rest_hours=resource_data.min_rest_hours,
+        max_avg_hours_4_weeks=resource_data.max_avg_hours_4_weeks,
+        max_avg_hours_17_weeks=resource_data.max_avg_hours_17_weeks,
+        max_consecutive_days=resource_data.max_consecutive_days
     )
     
     db.add(resource)
@@ -580,6 +2690,9 @@ async def create_resource(resource_data: ResourceCreate, admin_user: User = Depe
         email=resource.email,
         weekly_hour_limit=resource.weekly_hour_limit,
         min_rest_hours=resource.min_rest_hours,
+        max_avg_hours_4_weeks=resource.max_avg_hours_4_weeks,
+        max_avg_hours_17_weeks=resource.max_avg_hours_17_weeks,
+        max_consecutive_days=resource.max_consecutive_days,
         is_active=resource.is_active,
         created_at=resource.created_at
     )
@@ -594,6 +2707,9 @@ async def update_resource(resource_id: str, resource_data: ResourceCreate, admin
     resource.email = resource_data.email
     resource.weekly_hour_limit = resource_data.weekly_hour_limit
     resource.min_rest_hours = resource_data.min_rest_hours
+    resource.max_avg_hours_4_weeks = resource_data.max_avg_hours_4_weeks
+    resource.max_avg_hours_17_weeks = resource_data.max_avg_hours_17_weeks
+    resource.max_consecutive_days = resource_data.max_consecutive_days
     
     db.commit()
     db.refresh(resource)
@@ -604,10 +2720,28 @@ async def update_resource(resource_id: str, resource_data: ResourceCreate, admin
         email=resource.email,
         weekly_hour_limit=resource.weekly_hour_limit,
         min_rest_hours=resource.min_rest_hours,
+        max_avg_hours_4_weeks=resource.max_avg_hours_4_weeks,
+        max_avg_hours_17_weeks=resource.max_avg_hours_17_weeks,
+        max_consecutive_days=resource.max_consecutive_days,
         is_active=resource.is_active,
         created_at=resource.created_at
     )
 
+@api_router.post("/resources/status")
+async def update_resources_status(update: ResourceStatusUpdate, admin_user: User = Depends(get_admin_user), db: Session = Depends(get_db)):
+    """Deactivate or reactivate many resources with a single UPDATE"""
+    if not update.resource_ids:
+        raise HTTPException(status_code=400, detail="No resources given")
+    # The ids travel as one JSON parameter, so there is no bound-variable limit
+    updated = db.connection().exec_driver_sql(
+        "UPDATE resources SET is_active = ? WHERE id IN (SELECT value FROM json_each(?)) AND is_active != ?",
+        (update.is_active, json.dumps(update.resource_ids), update.is_active)
+    ).rowcount
+    if updated:
+        bump_data_versions(db, ["resources"])
+    db.commit()
+    return {"is_active": update.is_active, "updated": updated, "requested": len(set(update.resource_ids))}
+
 @api_router.delete("/resources/{resource_id}")
 async def delete_resource(resource_id: str, admin_user: User = Depends(get_admin_user), db: Session = Depends(get_db)):
     """Delete a resource and all associated shifts (cascade delete)"""
@@ -615,13 +2749,14 @@ async def delete_resource(resource_id: str, admin_user: User = Depends(get_admin
     if not resource:
         raise HTTPException(status_code=404, detail="Resource not found")
     
-    # Get all associated shifts for counting and manual deletion
-    associated_shifts = db.query(ShiftDB).filter(ShiftDB.resource_id == resource_id).all()
-    shift_count = len(associated_shifts)
-    
-    # Manually delete all associated shifts first (SQLite CASCADE workaround)
-    for shift in associated_shifts:
-        db.delete(shift)
+    # Manually delete associated rows (SQLite CASCADE workaround), one statement per table.
+    # Core deletes bypass the undo journal: the resource itself could not be restored by an undo anyway.
+    conn = db.connection()
+    deleted_days = conn.exec_driver_sql("DELETE FROM shifts WHERE resource_id = ? RETURNING date", (resource_id,)).fetchall()
+    shift_count = len(deleted_days)
+    conn.exec_driver_sql("DELETE FROM unavailabilities WHERE resource_id = ?", (resource_id,))
+    bump_data_versions(db, ["shifts", "unavailability"])
+    bump_week_versions(db, {iso_week(date.fromisoformat(day)) for (day,) in deleted_days})
     
     # Now delete the resource
     db.delete(resource)
@@ -632,6 +2767,106 @@ async def delete_resource(resource_id: str, admin_user: User = Depends(get_admin
         "deleted_shifts_count": shift_count
     }
 
+# Search Endpoints
+SEARCH_MAX_RESULTS = 50
+
+def fts_prefix_query(text: str) -> Optional[str]:
+    """FTS5 expression matching rows that contain every word of text as a prefix.
+    
+    Apostrophes are dropped first ("D'Ang" -> "dang"*, found through the compact name column);
+    accents are folded by the unicode61 tokenizer on both sides.
+    """
+    words = re.findall(r"\w+", text.replace("'", "").replace("’", ""))
+    if not words:
+        return None
+    return " ".join(f'"{word}"*' for word in words[:8])
+
+def search_resources(db: Session, match: str, limit: int) -> List[dict]:
+    """Resources matching an fts_prefix_query expression, best matches first"""
+    return [{"id": resource_id, "name": name, "email": email, "is_active": bool(is_active)}
+            for resource_id, name, email, is_active in db.connection().exec_driver_sql(
+        "SELECT r.id, r.name, r.email, r.is_active FROM resources_search s "
+        "JOIN resources r ON r.rowid = s.rowid "
+        "WHERE resources_search MATCH ? ORDER BY s.rank LIMIT ?",
+        (match, limit)
+    )]
+
+@api_router.get("/search")
+async def search(q: str, request: Request, limit: int = 20, admin_user: User = Depends(get_admin_user),
+                 db: Session = Depends(get_db), main_db: Session = Depends(get_main_db)):
+    """Prefix, accent-insensitive search over the site's resources and users, best matches first"""
+    started = perf_counter()
+    match = fts_prefix_query(q)
+    limit = max(1, min(limit, SEARCH_MAX_RESULTS))
+    resources, users = [], []
+    if match:
+        resources = search_resources(db, match, limit)
+        users = main_db.connection().exec_driver_sql(
+            "SELECT u.id, u.username, u.full_name, u.email, u.role FROM users_search s "
+            "JOIN users u ON u.rowid = s.rowid "
+            "WHERE users_search MATCH ? AND COALESCE(u.site_id, ?) = ? ORDER BY s.rank LIMIT ?",
+            (match, DEFAULT_SITE_ID, resolve_site_id(request), limit)
+        ).fetchall()
+    
+    return {
+        "query": q,
+        "resources": resources,
+        "users": [{"id": user_id, "username": username, "full_name": full_name, "email": email, "role": role} for user_id, username, full_name, email, role in users],
+        "elapsed_ms": round((perf_counter() - started) * 1000, 3)
+    }
+
+# Unavailability Endpoints
+@api_router.get("/unavailability", response_model=List[Unavailability])
+async def get_unavailability(resource_id: Optional[str] = None, from_date: Optional[str] = None, to_date: Optional[str] = None, admin_user: User = Depends(get_admin_user), db: Session = Depends(get_db)):
+    query = db.query(UnavailabilityDB)
+    if resource_id:
+        query = query.filter(UnavailabilityDB.resource_id == resource_id)
+    if from_date:
+        query = query.filter(UnavailabilityDB.end_at > datetime.strptime(from_date, "%Y-%m-%d"))
+    if to_date:
+        query = query.filter(UnavailabilityDB.start_at < datetime.strptime(to_date, "%Y-%m-%d") + timedelta(days=1))
+    return [unavailability_to_model(entry) for entry in query.order_by(UnavailabilityDB.start_at).all()]
+
+@api_router.post("/unavailability", response_model=Unavailability)
+async def create_unavailability(data: UnavailabilityCreate, admin_user: User = Depends(get_admin_user), db: Session = Depends(get_db)):
+    if not db.query(ResourceDB.id).filter(ResourceDB.id == data.resource_id).first():
+        raise HTTPException(status_code=404, detail="Resource not found")
+    
+    try:
+        start_at = datetime.strptime(f"{data.start_date} {data.start_time or '00:00'}", "%Y-%m-%d %H:%M")
+        if data.end_time:
+            end_at = datetime.strptime(f"{data.end_date} {data.end_time}", "%Y-%m-%d %H:%M")
+        else:
+            end_at = datetime.strptime(data.end_date, "%Y-%m-%d") + timedelta(days=1)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date or time format")
+    if end_at <= start_at:
+        raise HTTPException(status_code=400, detail="L'indisponibilità deve terminare dopo l'inizio")
+    
+    entry = UnavailabilityDB(
+        resource_id=data.resource_id,
+        start_at=start_at,
+        end_at=end_at,
+        reason=data.reason,
+        note=data.note
+    )
+    db.add(entry)
+    db.commit()
+    db.refresh(entry)
+    
+    return unavailability_to_model(entry)
+
+@api_router.delete("/unavailability/{unavailability_id}")
+async def delete_unavailability(unavailability_id: str, admin_user: User = Depends(get_admin_user), db: Session = Depends(get_db)):
+    entry = db.query(UnavailabilityDB).filter(UnavailabilityDB.id == unavailability_id).first()
+    if not entry:
+        raise HTTPException(status_code=404, detail="Unavailability not found")
+    
+    db.delete(entry)
+    db.commit()
+    
+    return {"message": "Unavailability deleted successfully"}
+
 # Password Management Models
 class ChangePasswordRequest(BaseModel):
     current_password: str
@@ -644,7 +2879,7 @@ class AdminChangePasswordRequest(BaseModel):
     confirm_password: str
 
 @api_router.post("/auth/change-password")
-async def change_password(request: ChangePasswordRequest, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+async def change_password(request: ChangePasswordRequest, current_user: User = Depends(get_current_user), db: Session = Depends(get_main_db)):
     """Allow user to change their own password"""
     
     # Validate passwords match
@@ -660,18 +2895,20 @@ async def change_password(request: ChangePasswordRequest, current_user: User = D
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
-    # Verify current password
-    if not verify_password(request.current_password, user.password):
+    # Verify current password (connection back to the pool while hashing)
+    stored_hash = user.password
+    db.rollback()
+    if not await verify_password_async(request.current_password, stored_hash):
         raise HTTPException(status_code=400, detail="Current password is incorrect")
     
     # Update password
-    user.password = hash_password(request.new_password)
+    user.password = await hash_password_async(request.new_password)
     db.commit()
     
     return {"message": "Password changed successfully"}
 
 @api_router.post("/admin/change-user-password")
-async def admin_change_user_password(request: AdminChangePasswordRequest, admin_user: User = Depends(get_admin_user), db: Session = Depends(get_db)):
+async def admin_change_user_password(request: AdminChangePasswordRequest, admin_user: User = Depends(get_admin_user), db: Session = Depends(get_main_db)):
     """Allow admin to change any user's password"""
     
     # Validate passwords match
@@ -682,13 +2919,16 @@ async def admin_change_user_password(request: AdminChangePasswordRequest, admin_
     if len(request.new_password) < 6:
         raise HTTPException(status_code=400, detail="Password must be at least 6 characters long")
     
+    # Hash before touching the database so no connection is held while the KDF runs
+    password_hash = await hash_password_async(request.new_password)
+    
     # Get target user from database
     user = db.query(UserDB).filter(UserDB.id == request.user_id).first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
     # Update password
-    user.password = hash_password(request.new_password)
+    user.password = password_hash
     db.commit()
     
     return {
@@ -698,48 +2938,336 @@ async def admin_change_user_password(request: AdminChangePasswordRequest, admin_
 
 # Shifts Endpoints
 @api_router.get("/shifts")
-async def get_shifts(week: Optional[int] = None, year: Optional[int] = None, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    query = db.query(ShiftDB)
+async def get_shifts(response: Response, week: Optional[int] = None, year: Optional[int] = None, current_user: User = Depends(get_current_user), db: Session = Depends(get_db), etag: str = Depends(versioned_etag("shifts", "resources", "time_slots"))):
+    # Enrich with resource and time slot data in the same query
+    query = db.query(ShiftDB, ResourceDB, TimeSlotDB).outerjoin(
+        ResourceDB, ResourceDB.id == ShiftDB.resource_id
+    ).outerjoin(
+        TimeSlotDB, TimeSlotDB.id == ShiftDB.time_slot_id
+    )
     if week and year:
         query = query.filter(ShiftDB.week_number == week, ShiftDB.year == year)
+        # Version to send back as If-Match when editing this week
+        response.headers["X-Week-Version"] = str(week_version(db, week, year))
     
-    shifts = query.all()
+    return [serialize_shift(shift, resource, time_slot) for shift, resource, time_slot in query.all()]
+
+# Longest span served by the schedule range grid (a quarter)
+MAX_SCHEDULE_RANGE_DAYS = 92
+
+@api_router.get("/schedule/range")
+async def get_schedule_range(from_date: str = Query(..., alias="from"), to_date: str = Query(..., alias="to"),
+                             current_user: User = Depends(get_current_user), db: Session = Depends(get_db),
+                             etag: str = Depends(versioned_etag("shifts", "resources"))):
+    """Resource x day grid of a span of up to a quarter, with totals per day"""
+    start, end = parse_matrix_range(from_date, to_date, MAX_SCHEDULE_RANGE_DAYS)
+    return JSONResponse(compute_schedule_range(db, start, end), headers=etag_headers(etag))
+
+def compute_schedule_range(db: Session, start: date, end: date) -> dict:
+    """Grid and day totals from one joined query: every active resource with its shifts in range.
+    
+    The per-day totals are summed in the same pass over the joined rows, which is cheaper
+    than a separate GROUP BY over the same shifts.
+    """
+    days = (end - start).days + 1
+    day_list = [(start + timedelta(days=offset)).isoformat() for offset in range(days)]
+    day_index = {day: offset for offset, day in enumerate(day_list)}
+    rows = db.connection().exec_driver_sql(
+        "SELECT r.id, r.name, r.email, r.weekly_hour_limit, r.is_active, "
+        "s.id, s.time_slot_id, s.date, s.minutes, s.overtime_minutes "
+        "FROM resources r LEFT JOIN shifts s ON s.resource_id = r.id AND s.date >= ? AND s.date <= ? "
+        "WHERE r.is_active = 1 OR s.id IS NOT NULL",
+        (start.isoformat(), end.isoformat())
+    ).fetchall()
+    
+    # Few distinct durations: convert each once
+    hours: Dict[Optional[int], float] = {}
+    def to_hours(minutes: Optional[int]) -> float:
+        if minutes not in hours:
+            hours[minutes] = minutes_to_hours(minutes)
+        return hours[minutes]
+    
+    daily_shifts, daily_minutes, daily_overtime = [0] * days, [0] * days, [0] * days
+    resources: Dict[str, dict] = {}
+    def place(entry: Optional[dict], shift_id: str, time_slot_id: str, shift_date: str, minutes: int, overtime: int):
+        offset = day_index[shift_date]
+        daily_shifts[offset] += 1
+        daily_minutes[offset] += minutes or 0
+        daily_overtime[offset] += overtime or 0
+        if entry is not None:
+            entry["cells"][offset] = {
+                "id": shift_id,
+                "time_slot_id": time_slot_id,
+                "hours": to_hours(minutes),
+                "overtime_hours": to_hours(overtime)
+            }
+            entry["shifts"] += 1
+            entry["minutes"] += minutes or 0
     
-    # Enrich with resource and time slot data
-    result = []
-    for shift in shifts:
-        resource = db.query(ResourceDB).filter(ResourceDB.id == shift.resource_id).first()
-        time_slot = db.query(TimeSlotDB).filter(TimeSlotDB.id == shift.time_slot_id).first()
+    for resource_id, name, email, limit, is_active, shift_id, time_slot_id, shift_date, minutes, overtime in rows:
+        entry = resources.get(resource_id)
+        if entry is None:
+            entry = resources[resource_id] = {
+                "id": resource_id, "name": name, "email": email, "weekly_hour_limit": limit,
+                "is_active": bool(is_active), "shifts": 0, "minutes": 0, "cells": [None] * days
+            }
+        if shift_id is not None:
+            place(entry, shift_id, time_slot_id, shift_date, minutes, overtime)
+    
+    # Weeks past the archive horizon
+    for shift in load_archived_shifts(db, start=start, end=end):
+        place(resources.get(shift["resource_id"]), shift["id"], shift["time_slot_id"], shift["date"], shift["minutes"], shift["overtime_minutes"])
+    
+    for entry in resources.values():
+        entry["hours"] = minutes_to_hours(entry.pop("minutes"))
+    return {
+        "from": start.isoformat(),
+        "to": end.isoformat(),
+        "days": day_list,
+        "resources": sorted(resources.values(), key=lambda entry: (entry["name"], entry["id"])),
+        "daily_totals": [{
+            "date": day,
+            "shifts": daily_shifts[offset],
+            "hours": minutes_to_hours(daily_minutes[offset]),
+            "overtime": minutes_to_hours(daily_overtime[offset])
+        } for offset, day in enumerate(day_list)],
+        "total_shifts": sum(daily_shifts),
+        "total_hours": minutes_to_hours(sum(daily_minutes)),
+        "total_overtime": minutes_to_hours(sum(daily_overtime))
+    }
+
+# Field order of the per-cell shift arrays in the grid bundle
+GRID_SHIFT_FIELDS = ("id", "hours", "overtime_hours", "extra_overtime_hours")
+
+# Data the grid bundle is read from; reads are retried while one of them changes underneath
+GRID_BUNDLE_SCOPES = ("shifts", "resources", "time_slots", "unavailability")
+GRID_BUNDLE_READ_ATTEMPTS = 3
+
+@api_router.get("/grid/{year}/{week}")
+async def get_grid_bundle(year: int, week: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_db),
+                          etag: str = Depends(versioned_etag(*GRID_BUNDLE_SCOPES))):
+    """Resources, time slots and the resource x day slot matrix of a week in one payload"""
+    try:
+        monday = date.fromisocalendar(year, week, 1)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid week")
+    bundle = build_grid_bundle(db, week, year, monday)
+    return JSONResponse(bundle, headers={**etag_headers(etag), "X-Week-Version": str(bundle["version"])})
+
+def build_grid_bundle(db: Session, week_number: int, year: int, monday: date) -> dict:
+    """Slots, resources and shifts of a week, mutually consistent.
+    
+    The reads run in the session's transaction, where the driver opens no snapshot for plain
+    SELECTs: they are repeated when the data versions of GRID_BUNDLE_SCOPES moved on while they
+    ran (a commit in between), up to GRID_BUNDLE_READ_ATTEMPTS times.
+    
+    matrix[r][d] is the index into time_slots of resource r's shift on day d (-1 when off) and
+    shifts[r][d] the matching [id, hours, overtime_hours, extra_overtime_hours] (GRID_SHIFT_FIELDS).
+    """
+    days = [monday + timedelta(days=offset) for offset in range(7)]
+    day_index = {day.isoformat(): offset for offset, day in enumerate(days)}
+    conn = db.connection()
+    for _ in range(GRID_BUNDLE_READ_ATTEMPTS):
+        versions = get_data_versions(db, *GRID_BUNDLE_SCOPES)
+        time_slots = conn.exec_driver_sql(
+            "SELECT id, name, start_time, end_time, is_custom FROM time_slots ORDER BY start_time"
+        ).fetchall()
+        shifts = conn.exec_driver_sql(
+            "SELECT id, resource_id, time_slot_id, date, minutes, overtime_minutes, extra_overtime_minutes "
+            "FROM shifts WHERE week_number = ? AND year = ?",
+            (week_number, year)
+        ).fetchall()
+        archived = load_archived_shifts(db, week=(week_number, year))
+        # Inactive people are listed when they work that week, in live or archived shifts
+        resources = conn.exec_driver_sql(
+            "SELECT id, name, email, weekly_hour_limit, min_rest_hours, is_active FROM resources "
+            "WHERE is_active = 1 OR id IN (SELECT resource_id FROM shifts WHERE week_number = ? AND year = ?) "
+            "OR id IN (SELECT value FROM json_each(?)) "
+            "ORDER BY name",
+            (week_number, year, json.dumps(sorted({shift["resource_id"] for shift in archived})))
+        ).fetchall()
+        absences = UnavailabilityIndex.load(db, datetime.combine(days[0], time.min), datetime.combine(days[-1] + timedelta(days=1), time.min))
+        version = week_version(db, week_number, year)
+        if get_data_versions(db, *GRID_BUNDLE_SCOPES) == versions:
+            break
+    
+    slot_index = {row[0]: index for index, row in enumerate(time_slots)}
+    resource_index = {row[0]: index for index, row in enumerate(resources)}
+    matrix = [[-1] * 7 for _ in resources]
+    cells = [[None] * 7 for _ in resources]
+    totals = [[0, 0, 0] for _ in resources]
+    
+    shifts = [tuple(row) for row in shifts] + [(
+        shift["id"], shift["resource_id"], shift["time_slot_id"], shift["date"],
+        shift["minutes"], shift["overtime_minutes"], shift["extra_overtime_minutes"]
+    ) for shift in archived]
+    for shift_id, resource_id, time_slot_id, shift_date, minutes, overtime, extra_overtime in shifts:
+        row, day = resource_index.get(resource_id), day_index.get(shift_date)
+        if row is None or day is None:
+            continue
+        matrix[row][day] = slot_index.get(time_slot_id, -1)
+        cells[row][day] = [shift_id, minutes_to_hours(minutes), minutes_to_hours(overtime), minutes_to_hours(extra_overtime)]
+        totals[row][0] += 1
+        totals[row][1] += minutes or 0
+        totals[row][2] += overtime or 0
+    
+    return {
+        "week_number": week_number,
+        "year": year,
+        "version": version,
+        "days": [day.isoformat() for day in days],
+        "time_slots": [{
+            "id": slot_id,
+            "name": name,
+            "start_time": start_time[:5],
+            "end_time": end_time[:5],
+            "is_custom": bool(is_custom)
+        } for slot_id, name, start_time, end_time, is_custom in time_slots],
+        "resources": [{
+            "id": resource_id,
+            "name": name,
+            "email": email,
+            "weekly_hour_limit": limit,
+            "min_rest_hours": min_rest_hours,
+            "is_active": bool(is_active),
+            "availability": absences.day_mask(resource_id, days),
+            "shifts": totals[index][0],
+            "hours": minutes_to_hours(totals[index][1]),
+            "overtime_hours": minutes_to_hours(totals[index][2])
+        } for index, (resource_id, name, email, limit, min_rest_hours, is_active) in enumerate(resources)],
+        "shift_fields": list(GRID_SHIFT_FIELDS),
+        "matrix": matrix,
+        "shifts": cells
+    }
+
+# Days of history counted as a resource's recent load when ranking candidates
+CANDIDATE_RECENT_DAYS = 14
+
+@api_router.get("/shifts/candidates")
+async def get_shift_candidates(date: str, time_slot_id: str, admin_user: User = Depends(get_admin_user), db: Session = Depends(get_db)):
+    """Active resources who could take a shift, best first"""
+    try:
+        shift_date = datetime.strptime(date, "%Y-%m-%d").date()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date format")
+    time_slot = db.query(TimeSlotDB).filter(TimeSlotDB.id == time_slot_id).first()
+    if not time_slot:
+        raise HTTPException(status_code=404, detail="Time slot not found")
+    if week_is_archived(db, *iso_week(shift_date)):
+        raise HTTPException(status_code=400, detail="La settimana è archiviata e non può essere modificata")
+    # Plain JSON types only: skip jsonable_encoder, which dominates the response time for large sites
+    return JSONResponse(find_shift_candidates(db, shift_date, time_slot))
+
+def find_shift_candidates(db: Session, shift_date: date, time_slot: TimeSlotDB) -> dict:
+    """Evaluate every active resource for one shift from a single preload.
+    
+    Eligible means create_shift would accept it (free that day, not absent, minimum rest and
+    rolling limits respected); the caller rejects archived weeks. Candidates are ranked by remaining weekly hours, then rest margin, then by
+    how many shifts they worked in the last CANDIDATE_RECENT_DAYS days. The rolling-limit state is
+    built once per week and reused until shifts or resources change.
+    """
+    started = perf_counter()
+    conn = db.connection()
+    week_number, year = iso_week(shift_date)
+    start, end = shift_window(shift_date, time_slot.start_time, time_slot.end_time)
+    minutes = calculate_shift_minutes(time_slot.start_time.strftime("%H:%M"), time_slot.end_time.strftime("%H:%M"))
+    
+    resources = conn.exec_driver_sql(
+        f"SELECT id, name, weekly_hour_limit, min_rest_hours, {', '.join(ROLLING_LIMIT_COLUMNS)} FROM resources WHERE is_active = 1"
+    ).fetchall()
+    # Rolling windows only for the people who have a limit set, in one load shared by every day of the week
+    limited = [resource for resource in resources if any(getattr(resource, column) is not None for column in ROLLING_LIMIT_COLUMNS)]
+    monday = shift_date - timedelta(days=shift_date.weekday())
+    rolling_limits = rolling_limits_cache.get(
+        db, ("candidates", monday), lambda: RollingLimits.load(db, limited, monday, monday + timedelta(days=6))
+    ) if limited else None
+    week_minutes = dict(conn.exec_driver_sql(
+        "SELECT resource_id, SUM(minutes) FROM shifts WHERE week_number = ? AND year = ? GROUP BY resource_id",
+        (week_number, year)
+    ).fetchall())
+    recent_shifts = dict(conn.exec_driver_sql(
+        "SELECT resource_id, COUNT(*) FROM shifts WHERE date >= ? AND date < ? GROUP BY resource_id",
+        ((shift_date - timedelta(days=CANDIDATE_RECENT_DAYS)).isoformat(), shift_date.isoformat())
+    ).fetchall())
+    neighbours: Dict[str, list] = {}
+    for resource_id, neighbour_date, neighbour_slot_id in conn.exec_driver_sql(
+        "SELECT resource_id, date, time_slot_id FROM shifts WHERE date >= ? AND date <= ?",
+        ((shift_date - timedelta(days=2)).isoformat(), (shift_date + timedelta(days=2)).isoformat())
+    ).fetchall():
+        neighbours.setdefault(resource_id, []).append((neighbour_date, neighbour_slot_id))
+    slot_times = {slot_id: (start_time, end_time) for slot_id, start_time, end_time in db.query(TimeSlotDB.id, TimeSlotDB.start_time, TimeSlotDB.end_time).all()}
+    # Neighbours only span five days: work out each (day, slot) window once
+    neighbour_windows = {}
+    unavailability = UnavailabilityIndex.load(db, start, end)
+    
+    candidates = []
+    excluded = {"already_assigned": 0, "unavailable": 0, "rest": 0, "rolling_limits": 0}
+    shift_day = shift_date.isoformat()
+    for resource in resources:
+        resource_id, name, weekly_hour_limit, min_rest_hours = resource[:4]
+        rest_margin = None
+        reason = None
+        for neighbour_date, neighbour_slot_id in neighbours.get(resource_id, ()):
+            if neighbour_date == shift_day:
+                reason = "already_assigned"
+                break
+            if neighbour_slot_id not in slot_times:
+                continue
+            window = neighbour_windows.get((neighbour_date, neighbour_slot_id))
+            if window is None:
+                window = neighbour_windows[(neighbour_date, neighbour_slot_id)] = shift_window(
+                    datetime.strptime(neighbour_date, "%Y-%m-%d").date(), *slot_times[neighbour_slot_id]
+                )
+            neighbour_start, neighbour_end = window
+            hours_between = rest_gap_hours(start, end, neighbour_start, neighbour_end)
+            if 0 < hours_between < min_rest_hours:
+                reason = "rest"
+            elif hours_between > 0:
+                rest_margin = hours_between - min_rest_hours if rest_margin is None else min(rest_margin, hours_between - min_rest_hours)
+        if reason is None and unavailability.find(resource_id, start, end):
+            reason = "unavailable"
+        if reason is None and rolling_limits and resource_id in rolling_limits.rows and rolling_limits.violations(resource, shift_date, minutes):
+            reason = "rolling_limits"
+        if reason:
+            excluded[reason] += 1
+            continue
         
-        shift_dict = {
-            "id": shift.id,
-            "resource_id": shift.resource_id,
-            "time_slot_id": shift.time_slot_id,
-            "date": shift.date.strftime("%Y-%m-%d"),
-            "week_number": shift.week_number,
-            "year": shift.year,
-            "hours": float(shift.hours),
-            "overtime_hours": float(shift.overtime_hours),
-            "extra_overtime_hours": float(shift.extra_overtime_hours),
-            "created_at": shift.created_at,
-            "resource": {
-                "id": resource.id,
-                "name": resource.name,
-                "email": resource.email
-            } if resource else None,
-            "time_slot": {
-                "id": time_slot.id,
-                "name": time_slot.name,
-                "start_time": time_slot.start_time.strftime("%H:%M"),
-                "end_time": time_slot.end_time.strftime("%H:%M")
-            } if time_slot else None
-        }
-        result.append(shift_dict)
+        remaining = weekly_hour_limit * 60 - (week_minutes.get(resource_id) or 0)
+        candidates.append({
+            "resource_id": resource_id,
+            "name": name,
+            "remaining_weekly_hours": minutes_to_hours(remaining),
+            "projected_overtime_hours": minutes_to_hours(max(0, minutes - max(remaining, 0))),
+            "rest_margin_hours": round(rest_margin, 1) if rest_margin is not None else None,
+            "recent_shifts": recent_shifts.get(resource_id, 0)
+        })
     
-    return result
+    candidates.sort(key=lambda candidate: (
+        -candidate["remaining_weekly_hours"],
+        -(candidate["rest_margin_hours"] if candidate["rest_margin_hours"] is not None else float("inf")),
+        candidate["recent_shifts"]
+    ))
+    return {
+        "date": shift_day,
+        "time_slot_id": time_slot.id,
+        "shift_hours": minutes_to_hours(minutes),
+        "candidates": candidates,
+        "excluded": excluded,
+        "elapsed_ms": round((perf_counter() - started) * 1000, 2)
+    }
 
 @api_router.post("/shifts", response_model=Shift)
-async def create_shift(shift_data: ShiftCreate, admin_user: User = Depends(get_admin_user), db: Session = Depends(get_db)):
+async def create_shift(shift_data: ShiftCreate, request: Request, response: Response, admin_user: User = Depends(get_admin_user), db: Session = Depends(get_db)):
+    # Version of the week every check below is based on (If-Match, or the current one): compared again when writing
+    try:
+        shift_week = iso_week(datetime.strptime(shift_data.date, "%Y-%m-%d").date())
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date format")
+    # The week is the ISO week of the date: the claimed version and the weekly totals must agree on it
+    if (shift_data.week_number, shift_data.year) != shift_week:
+        raise HTTPException(status_code=400, detail=f"La data {shift_data.date} non appartiene alla settimana {shift_data.week_number}/{shift_data.year}")
+    base_version = expected_week_version(request, db, *shift_week)
+    
     # Validate resource exists
     resource = db.query(ResourceDB).filter(ResourceDB.id == shift_data.resource_id).first()
     if not resource:
@@ -750,6 +3278,10 @@ async def create_shift(shift_data: ShiftCreate, admin_user: User = Depends(get_a
     if not time_slot:
         raise HTTPException(status_code=404, detail="Time slot not found")
     
+    # Archived weeks are read-only: their shifts are no longer in the live table to check against
+    if week_is_archived(db, *shift_week):
+        raise HTTPException(status_code=400, detail="La settimana è archiviata e non può essere modificata")
+    
     # Check for conflicts (same resource, same date)
     conflict = db.query(ShiftDB).filter(
         ShiftDB.resource_id == shift_data.resource_id,
@@ -758,6 +3290,12 @@ async def create_shift(shift_data: ShiftCreate, admin_user: User = Depends(get_a
     if conflict:
         raise HTTPException(status_code=400, detail="La risorsa ha già un turno assegnato in questa data")
     
+    # Check leave and other absences
+    shift_start, shift_end = shift_window(datetime.strptime(shift_data.date, "%Y-%m-%d").date(), time_slot.start_time, time_slot.end_time)
+    absence = UnavailabilityIndex.load(db, shift_start, shift_end, [resource.id]).find(resource.id, shift_start, shift_end)
+    if absence:
+        raise HTTPException(status_code=400, detail=unavailability_message(absence))
+    
     # Check minimum rest hours
     rest_violation = await check_minimum_rest_hours(shift_data, {
         "min_rest_hours": resource.min_rest_hours
@@ -768,44 +3306,54 @@ async def create_shift(shift_data: ShiftCreate, admin_user: User = Depends(get_a
     if rest_violation:
         raise HTTPException(status_code=400, detail=rest_violation)
     
-    # Calculate hours
-    hours = calculate_shift_hours(
+    # Calculate minutes
+    minutes = calculate_shift_minutes(
         time_slot.start_time.strftime("%H:%M"),
         time_slot.end_time.strftime("%H:%M")
     )
+    extra_overtime_minutes = hours_to_minutes(shift_data.extra_overtime_hours)
+    
+    # Check rolling average hours and consecutive working days
+    if any(getattr(resource, column) is not None for column in ROLLING_LIMIT_COLUMNS):
+        shift_day = datetime.strptime(shift_data.date, "%Y-%m-%d").date()
+        rolling_violations = RollingLimits.load(db, [resource], shift_day, shift_day).violations(resource, shift_day, minutes)
+        if rolling_violations:
+            raise HTTPException(status_code=400, detail=rolling_violations[0])
     
     # Check weekly hour limits and calculate overtime
-    existing_shifts = db.query(ShiftDB).filter(
+    existing_minutes = db.query(func.coalesce(func.sum(ShiftDB.minutes), 0)).filter(
         ShiftDB.resource_id == shift_data.resource_id,
-        ShiftDB.week_number == shift_data.week_number,
-        ShiftDB.year == shift_data.year
-    ).all()
+        ShiftDB.week_number == shift_week[0],
+        ShiftDB.year == shift_week[1]
+    ).scalar()
     
-    total_hours = sum(float(s.hours) for s in existing_shifts) + hours
+    total_minutes = existing_minutes + minutes
     
     # Calculate automatic overtime (from weekly limit)
-    if total_hours > resource.weekly_hour_limit:
-        automatic_overtime = total_hours - resource.weekly_hour_limit
-    else:
-        automatic_overtime = 0.0
+    automatic_overtime = max(0, total_minutes - resource.weekly_hour_limit * 60)
     
     # Total overtime = automatic + extra (manual)
-    total_overtime = automatic_overtime + (shift_data.extra_overtime_hours or 0.0)
+    total_overtime = automatic_overtime + extra_overtime_minutes
+    
+    # First write of the transaction: 409 if another planner changed the week since the checks were made
+    version = claim_week(db, *shift_week, base_version)
     
     shift = ShiftDB(
         resource_id=shift_data.resource_id,
         time_slot_id=shift_data.time_slot_id,
         date=datetime.strptime(shift_data.date, "%Y-%m-%d").date(),
-        week_number=shift_data.week_number,
-        year=shift_data.year,
-        hours=hours,
-        overtime_hours=total_overtime,
-        extra_overtime_hours=shift_data.extra_overtime_hours or 0.0
+        week_number=shift_week[0],
+        year=shift_week[1],
+        minutes=minutes,
+        overtime_minutes=total_overtime,
+        extra_overtime_minutes=extra_overtime_minutes
     )
     
     db.add(shift)
+    begin_journal_operation(db, admin_user.id, f"Turno assegnato a {resource.name} il {shift_data.date}")
     db.commit()
     db.refresh(shift)
+    response.headers["X-Week-Version"] = str(version)
     
     return Shift(
         id=shift.id,
@@ -814,26 +3362,359 @@ async def create_shift(shift_data: ShiftCreate, admin_user: User = Depends(get_a
         date=shift.date.strftime("%Y-%m-%d"),
         week_number=shift.week_number,
         year=shift.year,
-        hours=float(shift.hours),
-        overtime_hours=float(shift.overtime_hours),
-        extra_overtime_hours=float(shift.extra_overtime_hours),
+        hours=minutes_to_hours(shift.minutes),
+        overtime_hours=minutes_to_hours(shift.overtime_minutes),
+        extra_overtime_hours=minutes_to_hours(shift.extra_overtime_minutes),
         created_at=shift.created_at
     )
 
 @api_router.delete("/shifts/{shift_id}")
-async def delete_shift(shift_id: str, admin_user: User = Depends(get_admin_user), db: Session = Depends(get_db)):
+async def delete_shift(shift_id: str, request: Request, response: Response, admin_user: User = Depends(get_admin_user), db: Session = Depends(get_db)):
     shift = db.query(ShiftDB).filter(ShiftDB.id == shift_id).first()
     if not shift:
         raise HTTPException(status_code=404, detail="Shift not found")
     
+    shift_week = iso_week(shift.date)
+    version = claim_week(db, *shift_week, expected_week_version(request, db, *shift_week))
+    # The shift was read before the version: make sure nobody removed it in between
+    if not db.query(ShiftDB.id).filter(ShiftDB.id == shift_id).first():
+        db.rollback()
+        raise HTTPException(status_code=404, detail="Shift not found")
+    
     db.delete(shift)
+    begin_journal_operation(db, admin_user.id, f"Turno del {shift.date.strftime('%Y-%m-%d')} rimosso")
     db.commit()
+    response.headers["X-Week-Version"] = str(version)
     
     return {"message": "Shift deleted successfully"}
 
+# Schedule Simulation
+MAX_SIMULATION_CHANGES = int(os.environ.get("MAX_SIMULATION_CHANGES", "500"))
+
+def iso_week(day: date) -> tuple:
+    iso_year, iso_week_number, _ = day.isocalendar()
+    return iso_week_number, iso_year
+
+class ScheduleSimulation:
+    """A change set applied to an in-memory copy of the weeks it touches.
+    
+    The copy (plus two days on each side, for rest checks) is read with one query. Weekly
+    minutes and slot staffing are kept up to date as each change is applied, and only the
+    shifts that were added or moved are re-validated at the end, so the cost depends on the
+    size of the change set rather than on the size of the weeks. Rolling limits are loaded
+    once, for the people with limits among those shifts, and patched with the simulated weeks.
+    """
+    def __init__(self, db: Session, changes: List[ScheduleChange]):
+        self.db = db
+        self.changes = changes
+        self.results = [{"index": index, "action": change.action, "applied": False, "error": None, "violations": []}
+                        for index, change in enumerate(changes)]
+    
+    def _parse_date(self, index: int, value: Optional[str]) -> Optional[date]:
+        try:
+            return datetime.strptime(value, "%Y-%m-%d").date()
+        except (TypeError, ValueError):
+            self.results[index]["error"] = "Invalid date"
+            return None
+    
+    def _load(self):
+        db = self.db
+        referenced_ids = [change.shift_id for change in self.changes if change.shift_id]
+        referenced = {shift_id: (resource_id, shift_date) for shift_id, resource_id, shift_date in db.query(
+            ShiftDB.id, ShiftDB.resource_id, ShiftDB.date
+        ).filter(ShiftDB.id.in_(referenced_ids)).all()} if referenced_ids else {}
+        
+        weeks = set()
+        for index, change in enumerate(self.changes):
+            if change.action != "add" and change.shift_id not in referenced:
+                self.results[index]["error"] = "Shift not found"
+                continue
+            if change.action != "add":
+                weeks.add(iso_week(referenced[change.shift_id][1]))
+            if change.action == "add" or change.date:
+                target = self._parse_date(index, change.date)
+                if target:
+                    weeks.add(iso_week(target))
+        
+        windows = []
+        for week_number, year in sorted(weeks, key=lambda week: (week[1], week[0])):
+            monday = date.fromisocalendar(year, week_number, 1)
+            windows.append((monday - timedelta(days=2), monday + timedelta(days=8)))
+        rows = db.query(
+            ShiftDB.id, ShiftDB.resource_id, ShiftDB.time_slot_id, ShiftDB.date, ShiftDB.minutes, ShiftDB.extra_overtime_minutes
+        ).filter(or_(*[ShiftDB.date.between(first, last) for first, last in windows])).all() if windows else []
+        
+        self.weeks = weeks
+        self.archived = {week for week in weeks if week_is_archived(db, *week)}
+        # Loaded state, replaced by the simulated one when checking rolling limits
+        self.loaded = [(resource_id, shift_date, minutes) for _, resource_id, _, shift_date, minutes, _ in rows]
+        self.shifts = {shift_id: {"resource_id": resource_id, "time_slot_id": time_slot_id, "date": shift_date,
+                                  "minutes": minutes, "extra_overtime_minutes": extra_overtime_minutes}
+                       for shift_id, resource_id, time_slot_id, shift_date, minutes, extra_overtime_minutes in rows}
+        self.by_resource_date = {(shift["resource_id"], shift["date"]): shift_id for shift_id, shift in self.shifts.items()}
+        self.week_minutes: Dict[tuple, int] = {}
+        self.week_extra: Dict[tuple, int] = {}
+        self.staffing: Dict[tuple, int] = {}
+        for shift in self.shifts.values():
+            self._count(shift, 1)
+        
+        self.time_slots = {slot.id: slot for slot in db.query(TimeSlotDB).all()}
+        # Only people touched by the change set are validated or reported
+        resource_ids = {resource_id for resource_id, _ in referenced.values()} | {change.resource_id for change in self.changes if change.resource_id}
+        self.resources = {resource.id: resource for resource in db.query(ResourceDB).filter(ResourceDB.id.in_(resource_ids)).all()} if resource_ids else {}
+        self.unavailability = UnavailabilityIndex.load(
+            db, datetime.combine(windows[0][0], time.min), datetime.combine(windows[-1][1] + timedelta(days=1), time.min), list(self.resources)
+        ) if windows else UnavailabilityIndex([])
+    
+    def _count(self, shift: dict, sign: int):
+        week_key = (shift["resource_id"],) + iso_week(shift["date"])
+        self.week_minutes[week_key] = self.week_minutes.get(week_key, 0) + sign * shift["minutes"]
+        self.week_extra[week_key] = self.week_extra.get(week_key, 0) + sign * shift["extra_overtime_minutes"]
+        cell = (shift["date"], shift["time_slot_id"])
+        self.staffing[cell] = self.staffing.get(cell, 0) + sign
+    
+    def _place(self, index: int, shift_id: str, shift: dict) -> bool:
+        if shift["resource_id"] not in self.resources:
+            self.results[index]["error"] = "Resource not found"
+            return False
+        slot = self.time_slots.get(shift["time_slot_id"])
+        if not slot:
+            self.results[index]["error"] = "Time slot not found"
+            return False
+        if iso_week(shift["date"]) in self.archived:
+            self.results[index]["error"] = "La settimana è archiviata e non può essere modificata"
+            return False
+        if (shift["resource_id"], shift["date"]) in self.by_resource_date:
+            self.results[index]["error"] = "La risorsa ha già un turno assegnato in questa data"
+            return False
+        shift["minutes"] = calculate_shift_minutes(slot.start_time.strftime("%H:%M"), slot.end_time.strftime("%H:%M"))
+        self._insert(shift_id, shift)
+        return True
+    
+    def _insert(self, shift_id: str, shift: dict):
+        self.shifts[shift_id] = shift
+        self.by_resource_date[(shift["resource_id"], shift["date"])] = shift_id
+        self._count(shift, 1)
+    
+    def _unplace(self, shift_id: str) -> dict:
+        shift = self.shifts.pop(shift_id)
+        del self.by_resource_date[(shift["resource_id"], shift["date"])]
+        self._count(shift, -1)
+        return shift
+    
+    def _rolling_limits(self, shifts: List[dict]) -> Optional[RollingLimits]:
+        """Rolling-limit state after the change set of the people with limits among `shifts`"""
+        resources = [resource for resource in {self.resources[shift["resource_id"]] for shift in shifts}
+                     if any(getattr(resource, column) is not None for column in ROLLING_LIMIT_COLUMNS)]
+        if not resources:
+            return None
+        days = [shift["date"] for shift in shifts]
+        return RollingLimits.load_changed(self.db, resources, min(days), max(days), removed=self.loaded,
+                                          added=[(shift["resource_id"], shift["date"], shift["minutes"]) for shift in self.shifts.values()])
+    
+    def _violations(self, shift: dict, rolling_limits: Optional[RollingLimits]) -> List[str]:
+        """Checks create_shift would reject, against the final simulated state"""
+        resource = self.resources[shift["resource_id"]]
+        slot = self.time_slots[shift["time_slot_id"]]
+        start, end = shift_window(shift["date"], slot.start_time, slot.end_time)
+        violations = []
+        absence = self.unavailability.find(resource.id, start, end)
+        if absence:
+            violations.append(unavailability_message(absence))
+        for offset in (-2, -1, 1, 2):
+            other_id = self.by_resource_date.get((resource.id, shift["date"] + timedelta(days=offset)))
+            other_slot = self.time_slots.get(self.shifts[other_id]["time_slot_id"]) if other_id else None
+            if not other_slot:
+                continue
+            other_start, other_end = shift_window(self.shifts[other_id]["date"], other_slot.start_time, other_slot.end_time)
+            hours_between = rest_gap_hours(start, end, other_start, other_end)
+            if 0 < hours_between < resource.min_rest_hours:
+                violations.append(rest_violation_message(resource.min_rest_hours, hours_between))
+        if rolling_limits and resource.id in rolling_limits.rows:
+            # The shift is already in the simulated days: check the windows and run through its day as they are
+            violations.extend(rolling_limits.violations(resource, shift["date"], 0))
+        return violations
+    
+    def run(self) -> dict:
+        started = perf_counter()
+        self._load()
+        weekly_before = dict(self.week_minutes), dict(self.week_extra)
+        staffing_before = dict(self.staffing)
+        placed = {}
+        
+        for index, change in enumerate(self.changes):
+            result = self.results[index]
+            if result["error"]:
+                continue
+            if change.action == "add":
+                shift = {"resource_id": change.resource_id, "time_slot_id": change.time_slot_id,
+                         "date": self._parse_date(index, change.date),
+                         "extra_overtime_minutes": hours_to_minutes(change.extra_overtime_hours)}
+                shift_id = f"simulated-{index}"
+                result["applied"] = self._place(index, shift_id, shift)
+            elif change.shift_id not in self.shifts:
+                result["error"] = "Shift already removed by an earlier change"
+            elif change.action == "remove":
+                self._unplace(change.shift_id)
+                result["applied"] = True
+            else:
+                shift_id = change.shift_id
+                original = self._unplace(shift_id)
+                shift = dict(original)
+                shift["resource_id"] = change.resource_id or original["resource_id"]
+                shift["time_slot_id"] = change.time_slot_id or original["time_slot_id"]
+                if change.date:
+                    shift["date"] = self._parse_date(index, change.date)
+                result["applied"] = self._place(index, shift_id, shift)
+                if not result["applied"]:
+                    self._insert(shift_id, original)
+            if result["applied"] and change.action != "remove":
+                result["shift_id"] = shift_id
+                placed[shift_id] = index
+        
+        placed_shifts = [self.shifts[shift_id] for shift_id in placed if shift_id in self.shifts]
+        rolling_limits = self._rolling_limits(placed_shifts) if placed_shifts else None
+        for shift_id, index in placed.items():
+            if shift_id in self.shifts:
+                self.results[index]["violations"] = self._violations(self.shifts[shift_id], rolling_limits)
+        
+        return {
+            "valid": all(result["applied"] and not result["violations"] for result in self.results),
+            "changes": self.results,
+            "weekly": self._weekly_deltas(*weekly_before),
+            "coverage": self._coverage_deltas(staffing_before),
+            "elapsed_ms": round((perf_counter() - started) * 1000, 2)
+        }
+    
+    def _weekly_deltas(self, minutes_before: dict, extra_before: dict) -> list:
+        deltas = []
+        for key in sorted(self.week_minutes):
+            resource_id, week_number, year = key
+            if (week_number, year) not in self.weeks or resource_id not in self.resources:
+                continue
+            if self.week_minutes[key] == minutes_before.get(key, 0) and self.week_extra[key] == extra_before.get(key, 0):
+                continue
+            limit = self.resources[resource_id].weekly_hour_limit * 60
+            overtime_before = max(0, minutes_before.get(key, 0) - limit) + extra_before.get(key, 0)
+            overtime_after = max(0, self.week_minutes[key] - limit) + self.week_extra[key]
+            deltas.append({
+                "resource_id": resource_id,
+                "week_number": week_number,
+                "year": year,
+                "hours_before": minutes_to_hours(minutes_before.get(key, 0)),
+                "hours_after": minutes_to_hours(self.week_minutes[key]),
+                "overtime_before": minutes_to_hours(overtime_before),
+                "overtime_after": minutes_to_hours(overtime_after),
+                "weekly_limit": self.resources[resource_id].weekly_hour_limit
+            })
+        return deltas
+    
+    def _coverage_deltas(self, staffing_before: dict) -> list:
+        changed = sorted(cell for cell, count in self.staffing.items() if count != staffing_before.get(cell, 0))
+        if not changed:
+            return []
+        time_slot_ids = list(self.time_slots)
+        first, last = changed[0][0], changed[-1][0]
+        targets = coverage_target_matrix(self.db, {"start": first, "days": (last - first).days + 1, "time_slot_ids": time_slot_ids})
+        deltas = []
+        for day, slot_id in changed:
+            required = int(targets[(day - first).days, time_slot_ids.index(slot_id)]) if slot_id in self.time_slots else -1
+            before, after = staffing_before.get((day, slot_id), 0), self.staffing[(day, slot_id)]
+            deltas.append({
+                "date": day.strftime("%Y-%m-%d"),
+                "time_slot_id": slot_id,
+                "required": required if required >= 0 else None,
+                "assigned_before": before,
+                "assigned_after": after,
+                "shortfall_before": max(0, required - before) if required >= 0 else 0,
+                "shortfall_after": max(0, required - after) if required >= 0 else 0
+            })
+        return deltas
+
+@api_router.post("/schedule/simulate")
+async def simulate_schedule(request: ScheduleSimulationRequest, admin_user: User = Depends(get_admin_user), db: Session = Depends(get_db)):
+    """Evaluate a change set (add/remove/move) without writing anything"""
+    if len(request.changes) > MAX_SIMULATION_CHANGES:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_SIMULATION_CHANGES} changes per simulation")
+    return ScheduleSimulation(db, request.changes).run()
+
+# Undo / Redo Endpoints
+def journal_operation_to_dict(operation: JournalOperationDB) -> dict:
+    dates = sorted({record[4] for record in operation.changes})
+    return {
+        "id": operation.id,
+        "user_id": operation.user_id,
+        "label": operation.label,
+        "change_count": operation.change_count,
+        "first_date": dates[0] if dates else None,
+        "last_date": dates[-1] if dates else None,
+        "undone": operation.undone,
+        "created_at": operation.created_at
+    }
+
+# Each admin has their own undo/redo stack: only operations they made are undone or redone
+@api_router.get("/schedule/journal")
+async def get_schedule_journal(limit: int = 50, admin_user: User = Depends(get_admin_user), db: Session = Depends(get_db)):
+    operations = db.query(JournalOperationDB).filter(JournalOperationDB.user_id == admin_user.id).order_by(
+        JournalOperationDB.id.desc()
+    ).limit(min(max(limit, 1), JOURNAL_MAX_OPERATIONS)).all()
+    return [journal_operation_to_dict(operation) for operation in operations]
+
+@api_router.post("/schedule/undo")
+async def undo_schedule_operation(request: Request, response: Response, admin_user: User = Depends(get_admin_user), db: Session = Depends(get_db)):
+    """Revert the caller's latest operation still in effect, as one transaction (If-Match: version of its week)"""
+    operation = db.query(JournalOperationDB).filter(
+        JournalOperationDB.user_id == admin_user.id, JournalOperationDB.undone == False
+    ).order_by(JournalOperationDB.id.desc()).first()
+    if not operation:
+        raise HTTPException(status_code=404, detail="Nothing to undo")
+    return replay_journal_operation(db, request, response, operation, undo=True)
+
+@api_router.post("/schedule/redo")
+async def redo_schedule_operation(request: Request, response: Response, admin_user: User = Depends(get_admin_user), db: Session = Depends(get_db)):
+    """Re-apply the caller's most recently undone operation, as one transaction (If-Match: version of its week)"""
+    operation = db.query(JournalOperationDB).filter(
+        JournalOperationDB.user_id == admin_user.id, JournalOperationDB.undone == True
+    ).order_by(JournalOperationDB.id).first()
+    if not operation:
+        raise HTTPException(status_code=404, detail="Nothing to redo")
+    return replay_journal_operation(db, request, response, operation, undo=False)
+
+def replay_journal_operation(db: Session, request: Request, response: Response, operation: JournalOperationDB, undo: bool) -> dict:
+    added = [record for record in operation.changes if record[0] == "+"]
+    removed = [record for record in operation.changes if record[0] == "-"]
+    insert_records, delete_records = (removed, added) if undo else (added, removed)
+    
+    weeks = sorted({iso_week(datetime.strptime(record[4], "%Y-%m-%d").date()) for record in operation.changes}, key=lambda week: (week[1], week[0]))
+    if if_match_version(request) is not None and len(weeks) > 1:
+        raise HTTPException(status_code=400, detail="If-Match requires an operation on a single week")
+    base_versions = [expected_week_version(request, db, *week) for week in weeks]
+    check_journal_records(db, insert_records, delete_records)
+    
+    # First writes: the weeks, compared with the versions the checks were based on
+    versions = [claim_week(db, *week, base_version) for week, base_version in zip(weeks, base_versions)]
+    # Then the operation, so that two concurrent undos cannot both apply it
+    claimed = db.query(JournalOperationDB).filter(
+        JournalOperationDB.id == operation.id, JournalOperationDB.undone == (not undo)
+    ).update({JournalOperationDB.undone: undo}, synchronize_session=False)
+    if not claimed:
+        db.rollback()
+        raise HTTPException(status_code=409, detail="Operation changed concurrently, retry")
+    apply_journal_records(db, insert_records, delete_records)
+    db.commit()
+    db.refresh(operation)
+    if len(versions) == 1:
+        response.headers["X-Week-Version"] = str(versions[0])
+    
+    return {
+        "operation": journal_operation_to_dict(operation),
+        "shifts_added": len(removed if undo else added),
+        "shifts_removed": len(added if undo else removed)
+    }
+
 # Weekly Plans Endpoints
 @api_router.get("/weekly-plans")
-async def get_weekly_plans(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+async def get_weekly_plans(current_user: User = Depends(get_current_user), db: Session = Depends(get_db), etag: str = Depends(versioned_etag("plans"))):
     plans = db.query(WeeklyPlanDB).all()
     return [{
         "id": plan.id,
@@ -846,7 +3727,12 @@ async def get_weekly_plans(current_user: User = Depends(get_current_user), db: S
     } for plan in plans]
 
 @api_router.post("/weekly-plans/publish")
-async def publish_weekly_plan(week_number: int, year: int, admin_user: User = Depends(get_admin_user), db: Session = Depends(get_db)):
+async def publish_weekly_plan(week_number: int, year: int, request: Request, admin_user: User = Depends(get_admin_user), db: Session = Depends(get_db)):
+    # Publishes of the same week are serialised: the plan row and the next snapshot version are read under the write lock
+    db.connection().exec_driver_sql("BEGIN IMMEDIATE")
+    # With If-Match, only publish the version of the week the planner reviewed
+    expected_week_version(request, db, week_number, year)
+    
     # Create or update weekly plan
     existing_plan = db.query(WeeklyPlanDB).filter(
         WeeklyPlanDB.week_number == week_number,
@@ -866,121 +3752,637 @@ async def publish_weekly_plan(week_number: int, year: int, admin_user: User = De
         )
         db.add(plan)
     
+    # Diff against the previously published version of the week
+    previous = get_snapshot(db, week_number, year)
+    shifts = load_week_shifts(db, week_number, year)
+    diff = diff_week_shifts(snapshot_shifts(previous), shifts)
+    counts = diff_counts(diff)
+    
     # Log publication
     publication = PublicationDB(
         week_number=week_number,
         year=year,
         published_by=admin_user.id,
-        changes_log=[f"Weekly plan published by {admin_user.full_name}"]
+        changes_log=[
+            f"Weekly plan published by {admin_user.full_name}: +{counts['added']} -{counts['removed']} ~{counts['moved']}",
+            {"from_version": previous.version if previous else 0, "resources": diff}
+        ]
     )
     db.add(publication)
+    db.flush()
+    
+    # Freeze the week: employees read this snapshot, not the live shifts
+    snapshot = build_week_snapshot(db, week_number, year, shifts, publication.id)
+    
+    # One outbox row whatever the headcount; the dispatcher fans it out to the people in the diff
+    if diff:
+        db.add(NotificationEventDB(kind="publication", publication_id=publication.id, week_number=week_number, year=year))
     
     db.commit()
     
-    return {"message": "Weekly plan published successfully"}
+    return {
+        "message": "Weekly plan published successfully",
+        "snapshot_version": snapshot.version,
+        "shift_count": snapshot.shift_count,
+        "changes": counts
+    }
 
 # Employee Dashboard Endpoints
 @api_router.get("/employee/shifts")
-async def get_employee_shifts(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    # Get only published shifts - TUTTI i turni pubblicati, non solo quelli dell'utente
-    published_plans = db.query(WeeklyPlanDB).filter(WeeklyPlanDB.is_published == True).all()
-    published_weeks = [(plan.week_number, plan.year) for plan in published_plans]
+async def get_employee_shifts(current_user: User = Depends(get_current_user), db: Session = Depends(get_db), etag: str = Depends(versioned_etag("plans"))):
+    # TUTTI i turni pubblicati, letti dagli snapshot congelati alla pubblicazione
+    heads = get_published_snapshot_heads(db)
     
-    shifts = []
-    for week_num, year in published_weeks:
-        # Ottieni TUTTI i turni pubblicati della settimana, non solo quelli dell'utente
-        week_shifts = db.query(ShiftDB).filter(
-            ShiftDB.week_number == week_num,
-            ShiftDB.year == year
-        ).all()
+    payloads = dict(db.query(PublishedSnapshotDB.id, PublishedSnapshotDB.payload).filter(
+        PublishedSnapshotDB.id.in_([head[0] for head in heads])
+    ).all()) if heads else {}
+    
+    # Each snapshot is a JSON array: splice the arrays together without re-parsing them
+    parts = [gzip.decompress(payloads[head[0]])[1:-1] for head in heads]
+    body = b"[" + b",".join(part for part in parts if part) + b"]"
+    
+    return Response(content=body, media_type="application/json", headers=etag_headers(etag))
+
+@api_router.get("/employee/shifts/{week_number}/{year}")
+async def get_employee_week_shifts(week_number: int, year: int, request: Request, current_user: User = Depends(get_current_user), db: Session = Depends(get_db), etag: str = Depends(versioned_etag("plans"))):
+    """Published shifts of a single week, served from its snapshot (stored gzip bytes as they are when gzip is negotiated)"""
+    # Same choice as the ETag: with br negotiated the plain JSON goes through the middleware
+    send_gzip = response_encoding(request.headers.get("accept-encoding", "")) == "gzip"
+    headers = etag_headers(etag)
+    
+    heads = get_published_snapshot_heads(db, week_number, year)
+    if not heads:
+        return Response(content=b"[]", media_type="application/json", headers=headers)
+    
+    payload, version = db.query(PublishedSnapshotDB.payload, PublishedSnapshotDB.version).filter(PublishedSnapshotDB.id == heads[0][0]).one()
+    headers["X-Snapshot-Version"] = str(version)
+    if send_gzip:
+        headers["Content-Encoding"] = "gzip"
+        return Response(content=payload, media_type="application/json", headers=headers)
+    return Response(content=gzip.decompress(payload), media_type="application/json", headers=headers)
+
+@api_router.get("/employee/shifts/{week_number}/{year}/changes")
+async def get_employee_week_changes(week_number: int, year: int, since: int = 0, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+    """Changes between a published version the client already holds and the latest one"""
+    heads = get_published_snapshot_heads(db, week_number, year)
+    if not heads:
+        raise HTTPException(status_code=404, detail="Weekly plan not published")
+    
+    latest = db.query(PublishedSnapshotDB).filter(PublishedSnapshotDB.id == heads[0][0]).first()
+    if since > latest.version or since < 0:
+        raise HTTPException(status_code=404, detail="Snapshot version not found")
+    
+    if since == latest.version:
+        changes = {"added": [], "removed": [], "moved": []}
+    else:
+        base = get_snapshot(db, week_number, year, since) if since > 0 else None
+        if since > 0 and not base:
+            raise HTTPException(status_code=404, detail="Snapshot version not found")
+        old_shifts, new_shifts = snapshot_shifts(base), snapshot_shifts(latest)
         
-        for shift in week_shifts:
-            time_slot = db.query(TimeSlotDB).filter(TimeSlotDB.id == shift.time_slot_id).first()
-            resource = db.query(ResourceDB).filter(ResourceDB.id == shift.resource_id).first()
-            
-            shift_dict = {
-                "id": shift.id,
-                "resource_id": shift.resource_id,
-                "time_slot_id": shift.time_slot_id,
-                "date": shift.date.strftime("%Y-%m-%d"),
-                "week_number": shift.week_number,
-                "year": shift.year,
-                "hours": float(shift.hours),
-                "overtime_hours": float(shift.overtime_hours),
-                "extra_overtime_hours": float(shift.extra_overtime_hours),
-                "created_at": shift.created_at,
-                "resource": {
-                    "id": resource.id,
-                    "name": resource.name,
-                    "email": resource.email
-                } if resource else None,
-                "time_slot": {
-                    "id": time_slot.id,
-                    "name": time_slot.name,
-                    "start_time": time_slot.start_time.strftime("%H:%M"),
-                    "end_time": time_slot.end_time.strftime("%H:%M")
-                } if time_slot else None
-            }
-            shifts.append(shift_dict)
+        # Consecutive versions reuse the diff stored at publish time
+        publication = db.query(PublicationDB).filter(PublicationDB.id == latest.publication_id).first() if latest.publication_id else None
+        stored = publication.changes_log[1] if publication and publication.changes_log and len(publication.changes_log) > 1 else None
+        if stored and stored.get("from_version") == since:
+            diff = stored["resources"]
+        else:
+            diff = diff_week_shifts(old_shifts, new_shifts)
+        changes = expand_week_diff(diff, old_shifts, new_shifts)
     
-    return shifts
+    return {
+        "week_number": week_number,
+        "year": year,
+        "from_version": since,
+        "to_version": latest.version,
+        "content_hash": latest.content_hash,
+        **changes
+    }
+
+# Publish Notifications
+# "smtp", "log" or "" (notifications are queued but nothing is sent)
+MAIL_TRANSPORT = os.environ.get("MAIL_TRANSPORT", "smtp" if os.environ.get("SMTP_HOST") else "")
+MAIL_FROM = os.environ.get("MAIL_FROM", "planshift@localhost")
+NOTIFY_BATCH_SIZE = int(os.environ.get("NOTIFY_BATCH_SIZE", "100"))
+NOTIFY_MAX_ATTEMPTS = int(os.environ.get("NOTIFY_MAX_ATTEMPTS", "5"))
+# Delay before the first retry, doubled after every further failure
+NOTIFY_RETRY_SECONDS = int(os.environ.get("NOTIFY_RETRY_SECONDS", "60"))
+NOTIFY_POLL_SECONDS = float(os.environ.get("NOTIFY_POLL_SECONDS", "5"))
+# A batch claimed by a dispatcher that died is picked up again after this long
+NOTIFY_LEASE_SECONDS = 300
+WEEKDAY_NAMES = ("lun", "mar", "mer", "gio", "ven", "sab", "dom")
+
+class SMTPTransport:
+    """Sends each batch over a single SMTP connection"""
+    def __init__(self):
+        self.host = os.environ.get("SMTP_HOST", "localhost")
+        self.port = int(os.environ.get("SMTP_PORT", "25"))
+        self.username = os.environ.get("SMTP_USERNAME")
+        self.password = os.environ.get("SMTP_PASSWORD")
+        self.starttls = os.environ.get("SMTP_STARTTLS", "").lower() in ("1", "true", "yes")
+    
+    def send(self, messages: List[EmailMessage]) -> List[Optional[str]]:
+        """Error per message (None when accepted); connection failures raise and fail the whole batch"""
+        errors = []
+        with smtplib.SMTP(self.host, self.port, timeout=30) as smtp:
+            if self.starttls:
+                smtp.starttls()
+            if self.username:
+                smtp.login(self.username, self.password or "")
+            for message in messages:
+                try:
+                    smtp.send_message(message)
+                    errors.append(None)
+                except smtplib.SMTPException as e:
+                    errors.append(str(e))
+        return errors
+
+class LogTransport:
+    """Logs messages instead of sending them (development)"""
+    def send(self, messages: List[EmailMessage]) -> List[Optional[str]]:
+        for message in messages:
+            logging.getLogger(__name__).info("📧 %s -> %s", message["Subject"], message["To"])
+        return [None] * len(messages)
+
+MAIL_TRANSPORTS = {"smtp": SMTPTransport, "log": LogTransport}
+
+def get_mail_transport():
+    if not MAIL_TRANSPORT:
+        return None
+    if MAIL_TRANSPORT not in MAIL_TRANSPORTS:
+        raise ValueError(f"Unknown MAIL_TRANSPORT: {MAIL_TRANSPORT}")
+    return MAIL_TRANSPORTS[MAIL_TRANSPORT]()
+
+def publication_message(week_number: int, year: int, name: str, changes: dict, shifts: list) -> tuple:
+    """(subject, body) telling one person that their published week changed"""
+    lines = [
+        f"Ciao {name},",
+        "",
+        f"il piano turni della settimana {week_number}/{year} è stato pubblicato con modifiche che ti riguardano "
+        f"({len(changes.get('added', []))} nuovi, {len(changes.get('removed', []))} rimossi, {len(changes.get('moved', []))} modificati).",
+        "",
+        "I tuoi turni:" if shifts else "Nessun turno assegnato per questa settimana."
+    ]
+    for shift in sorted(shifts, key=lambda shift: shift["date"]):
+        day = datetime.strptime(shift["date"], "%Y-%m-%d").date()
+        slot = shift.get("time_slot") or {}
+        lines.append(f"- {WEEKDAY_NAMES[day.weekday()]} {day.strftime('%d/%m')}: {slot.get('name', '')} {slot.get('start_time', '')}-{slot.get('end_time', '')}".rstrip())
+    return f"Turni settimana {week_number}/{year} aggiornati", "\n".join(lines) + "\n"
+
+def fan_out_notification_events(db: Session) -> int:
+    """Turn pending publish events into one queued notification per person whose shifts changed"""
+    created = 0
+    event_ids = [event_id for (event_id,) in db.query(NotificationEventDB.id).filter(
+        NotificationEventDB.status == "pending"
+    ).order_by(NotificationEventDB.id).limit(20).all()]
+    db.rollback()
+    
+    for event_id in event_ids:
+        # Claim first: the update takes the write lock, so only one dispatcher fans an event out
+        if not db.query(NotificationEventDB).filter(
+            NotificationEventDB.id == event_id, NotificationEventDB.status == "pending"
+        ).update({"status": "done"}, synchronize_session=False):
+            db.rollback()
+            continue
+        
+        event = db.query(NotificationEventDB).filter(NotificationEventDB.id == event_id).one()
+        publication = db.query(PublicationDB).filter(PublicationDB.id == event.publication_id).first()
+        snapshot = db.query(PublishedSnapshotDB).filter(PublishedSnapshotDB.publication_id == event.publication_id).first()
+        log = publication.changes_log if publication and publication.changes_log else []
+        diff = log[1].get("resources", {}) if len(log) > 1 and isinstance(log[1], dict) else {}
+        
+        shifts_by_resource: Dict[str, list] = {}
+        for shift in snapshot_shifts(snapshot):
+            shifts_by_resource.setdefault(shift["resource_id"], []).append(shift)
+        people = {resource_id: (name, email) for resource_id, name, email in db.query(
+            ResourceDB.id, ResourceDB.name, ResourceDB.email
+        ).filter(ResourceDB.id.in_(list(diff))).all()} if diff else {}
+        
+        rows = []
+        now = datetime.utcnow()
+        for resource_id, changes in diff.items():
+            if resource_id not in people:
+                continue
+            name, email = people[resource_id]
+            subject, body = publication_message(event.week_number, event.year, name, changes, shifts_by_resource.get(resource_id, []))
+            rows.append({
+                "event_id": event_id, "resource_id": resource_id, "recipient": email, "subject": subject, "body": body,
+                "status": "pending", "attempts": 0, "next_attempt_at": now, "created_at": now
+            })
+        if rows:
+            db.execute(NotificationDB.__table__.insert(), rows)
+        db.commit()
+        created += len(rows)
+    return created
+
+def deliver_notifications(db: Session, transport) -> dict:
+    """Claim one batch of due notifications, send it and record successes, retries and dead letters"""
+    token = str(uuid.uuid4())
+    now = datetime.utcnow()
+    due = db.query(NotificationDB.id).filter(
+        NotificationDB.status.in_(["pending", "sending"]),
+        NotificationDB.next_attempt_at <= now
+    ).order_by(NotificationDB.id).limit(NOTIFY_BATCH_SIZE)
+    db.query(NotificationDB).filter(NotificationDB.id.in_(due.scalar_subquery())).update({
+        "status": "sending", "claim": token, "next_attempt_at": now + timedelta(seconds=NOTIFY_LEASE_SECONDS)
+    }, synchronize_session=False)
+    db.commit()
+    
+    batch = db.query(NotificationDB).filter(NotificationDB.claim == token, NotificationDB.status == "sending").order_by(NotificationDB.id).all()
+    if not batch:
+        return {"sent": 0, "failed": 0, "dead": 0}
+    
+    messages = []
+    for notification in batch:
+        message = EmailMessage()
+        message["From"] = MAIL_FROM
+        message["To"] = notification.recipient
+        message["Subject"] = notification.subject
+        message.set_content(notification.body)
+        messages.append(message)
+    try:
+        errors = transport.send(messages)
+    except Exception as e:
+        errors = [f"{type(e).__name__}: {e}"] * len(batch)
+    
+    result = {"sent": 0, "failed": 0, "dead": 0}
+    now = datetime.utcnow()
+    for notification, error in zip(batch, errors):
+        notification.claim = None
+        if error is None:
+            notification.status = "sent"
+            notification.sent_at = now
+            result["sent"] += 1
+            continue
+        notification.attempts += 1
+        notification.last_error = error[:1000]
+        if notification.attempts >= NOTIFY_MAX_ATTEMPTS:
+            notification.status = "dead"
+            result["dead"] += 1
+        else:
+            notification.status = "pending"
+            notification.next_attempt_at = now + timedelta(seconds=NOTIFY_RETRY_SECONDS * 2 ** (notification.attempts - 1))
+            result["failed"] += 1
+    db.commit()
+    return result
+
+def dispatch_site_notifications(db: Session, transport) -> dict:
+    """Fan out new events, then send due notifications batch by batch until none are left"""
+    totals = {"created": fan_out_notification_events(db), "sent": 0, "failed": 0, "dead": 0, "batches": 0}
+    started = perf_counter()
+    while True:
+        result = deliver_notifications(db, transport)
+        if not any(result.values()):
+            break
+        totals["batches"] += 1
+        for key, value in result.items():
+            totals[key] += value
+        if result["sent"] == 0:
+            # Nothing got through (e.g. SMTP down): leave the rest for the next poll
+            break
+    totals["elapsed_ms"] = round((perf_counter() - started) * 1000, 1)
+    return totals
+
+def notification_dispatcher():
+    """Background loop delivering the notifications of every site"""
+    transport = get_mail_transport()
+    while True:
+        try:
+            main_db = SessionLocal()
+            try:
+                site_ids = list_site_ids(main_db)
+            finally:
+                main_db.close()
+            for site_id in site_ids:
+                db = get_site_sessionmaker(site_id)()
+                try:
+                    dispatch_site_notifications(db, transport)
+                finally:
+                    db.close()
+        except Exception:
+            logging.getLogger(__name__).exception("Notification dispatcher failed")
+        threading.Event().wait(NOTIFY_POLL_SECONDS)
+
+@api_router.get("/notifications")
+async def get_notifications(status: Optional[str] = None, limit: int = 100, admin_user: User = Depends(get_admin_user), db: Session = Depends(get_db)):
+    """Queue counts by status, plus the latest notifications (e.g. ?status=dead for the dead letters)"""
+    query = db.query(NotificationDB)
+    if status:
+        query = query.filter(NotificationDB.status == status)
+    return {
+        "transport": MAIL_TRANSPORT or None,
+        "pending_events": db.query(func.count(NotificationEventDB.id)).filter(NotificationEventDB.status == "pending").scalar(),
+        "counts": dict(db.query(NotificationDB.status, func.count(NotificationDB.id)).group_by(NotificationDB.status).all()),
+        "notifications": [{
+            "id": notification.id,
+            "event_id": notification.event_id,
+            "resource_id": notification.resource_id,
+            "recipient": notification.recipient,
+            "subject": notification.subject,
+            "status": notification.status,
+            "attempts": notification.attempts,
+            "next_attempt_at": notification.next_attempt_at,
+            "last_error": notification.last_error,
+            "sent_at": notification.sent_at,
+            "created_at": notification.created_at
+        } for notification in query.order_by(NotificationDB.id.desc()).limit(max(1, min(limit, 1000))).all()]
+    }
+
+@api_router.post("/notifications/{notification_id}/retry")
+async def retry_notification(notification_id: int, admin_user: User = Depends(get_admin_user), db: Session = Depends(get_db)):
+    """Put a dead or failed notification back in the queue with a fresh attempt count"""
+    notification = db.query(NotificationDB).filter(NotificationDB.id == notification_id).first()
+    if not notification:
+        raise HTTPException(status_code=404, detail="Notification not found")
+    if notification.status == "sent":
+        raise HTTPException(status_code=400, detail="Notification already sent")
+    notification.status = "pending"
+    notification.attempts = 0
+    notification.next_attempt_at = datetime.utcnow()
+    notification.last_error = None
+    db.commit()
+    return {"id": notification.id, "status": notification.status}
+
+@api_router.post("/notifications/dispatch")
+async def dispatch_notifications(admin_user: User = Depends(get_admin_user), db: Session = Depends(get_db)):
+    """Run one dispatcher pass for this site now instead of waiting for the next poll"""
+    transport = get_mail_transport()
+    if transport is None:
+        raise HTTPException(status_code=400, detail="No mail transport configured (MAIL_TRANSPORT)")
+    return await asyncio.to_thread(dispatch_site_notifications, db, transport)
+
+# Coverage Endpoints
+@api_router.get("/coverage/targets", response_model=List[CoverageTarget])
+async def get_coverage_targets(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+    return [coverage_target_to_model(target) for target in db.query(CoverageTargetDB).order_by(
+        CoverageTargetDB.time_slot_id, CoverageTargetDB.weekday, CoverageTargetDB.date
+    ).all()]
+
+@api_router.put("/coverage/targets", response_model=CoverageTarget)
+async def set_coverage_target(data: CoverageTargetCreate, admin_user: User = Depends(get_admin_user), db: Session = Depends(get_db)):
+    """Create or replace the target of a slot for a weekday or a single date"""
+    if (data.weekday is None) == (data.date is None):
+        raise HTTPException(status_code=400, detail="Specify either weekday or date")
+    if data.weekday is not None and not 0 <= data.weekday <= 6:
+        raise HTTPException(status_code=400, detail="Weekday must be between 0 (Monday) and 6 (Sunday)")
+    if data.required < 0:
+        raise HTTPException(status_code=400, detail="Required people cannot be negative")
+    if not db.query(TimeSlotDB.id).filter(TimeSlotDB.id == data.time_slot_id).first():
+        raise HTTPException(status_code=404, detail="Time slot not found")
+    
+    target_date = datetime.strptime(data.date, "%Y-%m-%d").date() if data.date else None
+    target = db.query(CoverageTargetDB).filter(
+        CoverageTargetDB.time_slot_id == data.time_slot_id,
+        CoverageTargetDB.weekday == data.weekday if data.weekday is not None else CoverageTargetDB.date == target_date
+    ).first()
+    if target:
+        target.required = data.required
+    else:
+        target = CoverageTargetDB(time_slot_id=data.time_slot_id, weekday=data.weekday, date=target_date, required=data.required)
+        db.add(target)
+    db.commit()
+    db.refresh(target)
+    
+    return coverage_target_to_model(target)
+
+@api_router.delete("/coverage/targets/{target_id}")
+async def delete_coverage_target(target_id: str, admin_user: User = Depends(get_admin_user), db: Session = Depends(get_db)):
+    target = db.query(CoverageTargetDB).filter(CoverageTargetDB.id == target_id).first()
+    if not target:
+        raise HTTPException(status_code=404, detail="Coverage target not found")
+    
+    db.delete(target)
+    db.commit()
+    
+    return {"message": "Coverage target deleted successfully"}
+
+def coverage_target_to_model(target: CoverageTargetDB) -> CoverageTarget:
+    return CoverageTarget(
+        id=target.id,
+        time_slot_id=target.time_slot_id,
+        weekday=target.weekday,
+        date=target.date.strftime("%Y-%m-%d") if target.date else None,
+        required=target.required,
+        created_at=target.created_at
+    )
+
+# Longest range accepted by the matrix analytics endpoints
+MAX_MATRIX_RANGE_DAYS = 366
+
+def parse_matrix_range(from_date: str, to_date: str, max_days: int = MAX_MATRIX_RANGE_DAYS) -> tuple:
+    try:
+        start = datetime.strptime(from_date, "%Y-%m-%d").date()
+        end = datetime.strptime(to_date, "%Y-%m-%d").date()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date format")
+    if end < start or (end - start).days >= max_days:
+        raise HTTPException(status_code=400, detail=f"Range must be between 1 and {max_days} days")
+    return start, end
+
+@api_router.get("/coverage/gaps")
+async def get_coverage_gaps(from_date: str, to_date: str, admin_user: User = Depends(get_admin_user), db: Session = Depends(get_db)):
+    """Understaffed and overstaffed day/slot cells of a range (up to a year)"""
+    start, end = parse_matrix_range(from_date, to_date)
+    return await report_cache.get(db, "coverage_gaps", (start, end), lambda session: compute_coverage_gaps(session, start, end))
+
+def compute_coverage_gaps(db: Session, start: date, end: date) -> dict:
+    matrix = load_schedule_matrix(db, start, end)
+    days, slots, resources = matrix["days"], len(matrix["time_slot_ids"]), len(matrix["resource_ids"])
+    
+    # day x slot x resource assignment matrix
+    assigned = np.zeros((days, slots, resources), dtype=bool)
+    assigned[matrix["day"], matrix["slot"], matrix["resource"]] = True
+    
+    staffed = assigned.sum(axis=2, dtype=np.int32)
+    targets = coverage_target_matrix(db, matrix)
+    required = np.maximum(targets, 0)
+    shortfall = np.maximum(required - staffed, 0)
+    # Cells without a target are never overstaffed
+    overstaffing = np.where(targets >= 0, np.maximum(staffed - required, 0), 0)
+    # People without any shift that day, i.e. who could still fill a gap
+    free = resources - assigned.any(axis=1).sum(axis=1)
+    
+    gap_days, gap_slots = np.nonzero((shortfall > 0) | (overstaffing > 0))
+    return {
+        "from_date": start.strftime("%Y-%m-%d"),
+        "to_date": end.strftime("%Y-%m-%d"),
+        "total_shortfall": int(shortfall.sum()),
+        "total_overstaffing": int(overstaffing.sum()),
+        "understaffed_cells": int((shortfall > 0).sum()),
+        "overstaffed_cells": int((overstaffing > 0).sum()),
+        "by_time_slot": [{
+            "time_slot_id": slot_id,
+            "shortfall": int(shortfall[:, index].sum()),
+            "overstaffing": int(overstaffing[:, index].sum())
+        } for index, slot_id in enumerate(matrix["time_slot_ids"])],
+        "gaps": [{
+            "date": (start + timedelta(days=int(day))).strftime("%Y-%m-%d"),
+            "time_slot_id": matrix["time_slot_ids"][slot],
+            "required": int(required[day, slot]),
+            "assigned": int(staffed[day, slot]),
+            "shortfall": int(shortfall[day, slot]),
+            "overstaffing": int(overstaffing[day, slot]),
+            "free_resources": int(free[day])
+        } for day, slot in zip(gap_days.tolist(), gap_slots.tolist())]
+    }
 
 # Reports Endpoints
 @api_router.get("/reports/weekly/{week_number}/{year}")
 async def get_weekly_report(week_number: int, year: int, admin_user: User = Depends(get_admin_user), db: Session = Depends(get_db)):
-    shifts = db.query(ShiftDB).filter(
-        ShiftDB.week_number == week_number,
-        ShiftDB.year == year
-    ).all()
+    return await report_cache.get(db, "weekly", (week_number, year), lambda session: compute_weekly_report(session, week_number, year))
+
+def compute_weekly_report(db: Session, week_number: int, year: int) -> dict:
+    week_filter = (ShiftDB.week_number == week_number, ShiftDB.year == year)
     
-    # Calculate statistics
-    total_shifts = len(shifts)
-    total_hours = sum(float(s.hours) for s in shifts)
-    total_overtime = sum(float(s.overtime_hours) for s in shifts)
+    # Calculate statistics (exact integer sums in SQL)
+    total_shifts, total_minutes, total_overtime = db.query(
+        func.count(ShiftDB.id), func.coalesce(func.sum(ShiftDB.minutes), 0), func.coalesce(func.sum(ShiftDB.overtime_minutes), 0)
+    ).filter(*week_filter).one()
     
     # Resource utilization
-    resource_stats = {}
-    for shift in shifts:
-        resource_id = shift.resource_id
-        if resource_id not in resource_stats:
-            resource = db.query(ResourceDB).filter(ResourceDB.id == resource_id).first()
-            resource_stats[resource_id] = {
-                "name": resource.name,
-                "hours": 0,
-                "overtime": 0,
-                "shifts": 0,
-                "limit": resource.weekly_hour_limit
-            }
-        
-        resource_stats[resource_id]["hours"] += float(shift.hours)
-        resource_stats[resource_id]["overtime"] += float(shift.overtime_hours)
-        resource_stats[resource_id]["shifts"] += 1
+    resource_rows = db.query(
+        ShiftDB.resource_id,
+        ResourceDB.name,
+        ResourceDB.weekly_hour_limit,
+        func.sum(ShiftDB.minutes),
+        func.sum(ShiftDB.overtime_minutes),
+        func.count(ShiftDB.id)
+    ).join(ResourceDB, ResourceDB.id == ShiftDB.resource_id).filter(*week_filter).group_by(ShiftDB.resource_id).all()
+    utilization = {resource_id: [name, limit, minutes, overtime, count] for resource_id, name, limit, minutes, overtime, count in resource_rows}
+    
+    shifts = [{
+        "id": shift.id,
+        "resource_id": shift.resource_id,
+        "time_slot_id": shift.time_slot_id,
+        "date": shift.date.strftime("%Y-%m-%d"),
+        "hours": minutes_to_hours(shift.minutes),
+        "overtime_hours": minutes_to_hours(shift.overtime_minutes)
+    } for shift in db.query(
+        ShiftDB.id, ShiftDB.resource_id, ShiftDB.time_slot_id, ShiftDB.date, ShiftDB.minutes, ShiftDB.overtime_minutes
+    ).filter(*week_filter).all()]
+    
+    # Weeks past the archive horizon live (wholly or partly) in the shift archive
+    archived = load_archived_shifts(db, week=(week_number, year))
+    if archived:
+        resources = {resource_id: (name, limit) for resource_id, name, limit in db.query(
+            ResourceDB.id, ResourceDB.name, ResourceDB.weekly_hour_limit
+        ).filter(ResourceDB.id.in_({shift["resource_id"] for shift in archived})).all()}
+        for shift in archived:
+            total_shifts += 1
+            total_minutes += shift["minutes"] or 0
+            total_overtime += shift["overtime_minutes"] or 0
+            if shift["resource_id"] in resources:
+                entry = utilization.setdefault(shift["resource_id"], [*resources[shift["resource_id"]], 0, 0, 0])
+                entry[2] += shift["minutes"] or 0
+                entry[3] += shift["overtime_minutes"] or 0
+                entry[4] += 1
+            shifts.append({
+                "id": shift["id"],
+                "resource_id": shift["resource_id"],
+                "time_slot_id": shift["time_slot_id"],
+                "date": shift["date"],
+                "hours": minutes_to_hours(shift["minutes"]),
+                "overtime_hours": minutes_to_hours(shift["overtime_minutes"])
+            })
     
     return {
         "week_number": week_number,
         "year": year,
         "total_shifts": total_shifts,
-        "total_hours": total_hours,
-        "total_overtime": total_overtime,
-        "resource_utilization": list(resource_stats.values()),
-        "shifts": [{
-            "id": shift.id,
-            "resource_id": shift.resource_id,
-            "time_slot_id": shift.time_slot_id,
-            "date": shift.date.strftime("%Y-%m-%d"),
-            "hours": float(shift.hours),
-            "overtime_hours": float(shift.overtime_hours)
-        } for shift in shifts]
+        "total_hours": minutes_to_hours(total_minutes),
+        "total_overtime": minutes_to_hours(total_overtime),
+        "resource_utilization": [{
+            "name": name,
+            "hours": minutes_to_hours(minutes),
+            "overtime": minutes_to_hours(overtime),
+            "shifts": count,
+            "limit": limit
+        } for name, limit, minutes, overtime, count in utilization.values()],
+        "shifts": shifts
+    }
+
+@api_router.get("/reports/sites/weekly/{week_number}/{year}")
+async def get_sites_weekly_report(week_number: int, year: int, admin_user: User = Depends(get_admin_user), main_db: Session = Depends(get_main_db)):
+    """Weekly report of every site, computed concurrently on each site database and merged"""
+    site_reports = await fan_out_sites(list_site_ids(main_db), lambda db: compute_weekly_report(db, week_number, year))
+    
+    return {
+        "week_number": week_number,
+        "year": year,
+        "total_shifts": sum(report["total_shifts"] for report in site_reports.values()),
+        "total_hours": round(sum(report["total_hours"] for report in site_reports.values()), 2),
+        "total_overtime": round(sum(report["total_overtime"] for report in site_reports.values()), 2),
+        "sites": [{
+            "site_id": site_id,
+            "total_shifts": report["total_shifts"],
+            "total_hours": report["total_hours"],
+            "total_overtime": report["total_overtime"],
+            "resource_utilization": report["resource_utilization"]
+        } for site_id, report in site_reports.items()]
     }
 
+def compute_range_report(context: JobContext) -> dict:
+    """Weekly totals for every ISO week between from_date and to_date"""
+    start = datetime.strptime(context.params["from_date"], "%Y-%m-%d").date()
+    end = datetime.strptime(context.params["to_date"], "%Y-%m-%d").date()
+    weeks = []
+    day = start - timedelta(days=start.weekday())
+    while day <= end:
+        weeks.append(calculate_week_number(day.strftime("%Y-%m-%d")))
+        day += timedelta(weeks=1)
+    
+    results = []
+    for index, (week_number, year) in enumerate(weeks):
+        context.progress(index, len(weeks), f"Settimana {week_number}/{year}")
+        report = compute_weekly_report(context.db, week_number, year)
+        report.pop("shifts")
+        results.append(report)
+    
+    return {
+        "from_date": context.params["from_date"],
+        "to_date": context.params["to_date"],
+        "total_shifts": sum(report["total_shifts"] for report in results),
+        "total_hours": round(sum(report["total_hours"] for report in results), 2),
+        "total_overtime": round(sum(report["total_overtime"] for report in results), 2),
+        "weeks": results
+    }
+
+JOB_HANDLERS["range_report"] = compute_range_report
+
+@api_router.post("/reports/range")
+async def create_range_report(from_date: str, to_date: str, request: Request, admin_user: User = Depends(get_admin_user)):
+    """Multi-week report computed in the background (202 + job id)"""
+    try:
+        start = datetime.strptime(from_date, "%Y-%m-%d").date()
+        end = datetime.strptime(to_date, "%Y-%m-%d").date()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD")
+    if end < start:
+        raise HTTPException(status_code=400, detail="to_date must not be before from_date")
+    
+    return job_accepted(job_runner.enqueue(
+        "range_report",
+        {"from_date": from_date, "to_date": to_date},
+        site_id=resolve_site_id(request),
+        created_by=admin_user.id
+    ))
+
 @api_router.get("/reports/overview")
 async def get_reports_overview(admin_user: User = Depends(get_admin_user), db: Session = Depends(get_db)):
     """Get comprehensive overview for reports dashboard"""
-    
+    # The overview is relative to today, so the date is part of the cache key
+    today = datetime.now(timezone.utc).date()
+    return await report_cache.get(db, "overview", (today,), lambda session: compute_reports_overview(session))
+
+def compute_reports_overview(db: Session) -> dict:
     # Get current week
     current_date = datetime.now(timezone.utc)
     current_week = current_date.isocalendar()[1]
     current_year = current_date.year
+    start_of_month = current_date.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    monday = (current_date - timedelta(days=current_date.weekday())).date()
+    
+    # Weeks past the archive horizon live (wholly or partly) in the shift archive
+    archived = load_archived_shifts(db, start=min(start_of_month.date(), monday - timedelta(weeks=3)), end=monday + timedelta(days=6))
     
     # Get data for last 4 weeks
     weekly_data = []
@@ -991,84 +4393,121 @@ async def get_reports_overview(admin_user: User = Depends(get_admin_user), db: S
         if week_num <= 0:
             week_num += 52
             year -= 1
-            
-        shifts = db.query(ShiftDB).filter(
+        
+        total_shifts, unique_resources, total_minutes, total_overtime = db.query(
+            func.count(ShiftDB.id),
+            func.count(func.distinct(ShiftDB.resource_id)),
+            func.sum(ShiftDB.minutes),
+            func.sum(ShiftDB.overtime_minutes)
+        ).filter(
             ShiftDB.week_number == week_num,
             ShiftDB.year == year
-        ).all()
+        ).one()
+        week_archived = [shift for shift in archived if (shift["week_number"], shift["year"]) == (week_num, year)]
+        if week_archived:
+            total_shifts += len(week_archived)
+            total_minutes = (total_minutes or 0) + sum(shift["minutes"] or 0 for shift in week_archived)
+            total_overtime = (total_overtime or 0) + sum(shift["overtime_minutes"] or 0 for shift in week_archived)
+            live_resources = {resource_id for (resource_id,) in db.query(ShiftDB.resource_id).filter(
+                ShiftDB.week_number == week_num, ShiftDB.year == year
+            ).distinct().all()}
+            unique_resources = len(live_resources | {shift["resource_id"] for shift in week_archived})
         
         weekly_data.append({
             "week": week_num,
             "year": year,
-            "total_hours": sum(float(s.hours) for s in shifts),
-            "total_overtime": sum(float(s.overtime_hours) for s in shifts),
-            "total_shifts": len(shifts),
-            "unique_resources": len(set(s.resource_id for s in shifts))
+            "total_hours": minutes_to_hours(total_minutes),
+            "total_overtime": minutes_to_hours(total_overtime),
+            "total_shifts": total_shifts,
+            "unique_resources": unique_resources
         })
     
-    # Get start of month for filtering
-    start_of_month = current_date.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    month_archived = [shift for shift in archived if shift["date"] >= start_of_month.date().isoformat()]
     
-    # Get all resources with their stats
+    # Get all resources with their stats for the current month
     resources = db.query(ResourceDB).filter(ResourceDB.is_active == True).all()
+    month_totals = {
+        resource_id: (count, minutes, overtime)
+        for resource_id, count, minutes, overtime in db.query(
+            ShiftDB.resource_id,
+            func.count(ShiftDB.id),
+            func.sum(ShiftDB.minutes),
+            func.sum(ShiftDB.overtime_minutes)
+        ).filter(ShiftDB.date >= start_of_month.date()).group_by(ShiftDB.resource_id).all()
+    }
+    for shift in month_archived:
+        count, minutes, overtime = month_totals.get(shift["resource_id"], (0, 0, 0))
+        month_totals[shift["resource_id"]] = (count + 1, (minutes or 0) + (shift["minutes"] or 0), (overtime or 0) + (shift["overtime_minutes"] or 0))
     resource_performance = []
     
     for resource in resources:
-        # Get shifts for current month
-        shifts = db.query(ShiftDB).filter(
-            ShiftDB.resource_id == resource.id,
-            ShiftDB.date >= start_of_month.date()
-        ).all()
-        
-        total_hours = sum(float(s.hours) for s in shifts)
-        total_overtime = sum(float(s.overtime_hours) for s in shifts)
+        shift_count, total_minutes, total_overtime = month_totals.get(resource.id, (0, 0, 0))
+        total_hours = (total_minutes or 0) / 60
         
         resource_performance.append({
             "id": resource.id,
             "name": resource.name,
             "email": resource.email,
             "total_hours": round(total_hours, 1),
-            "total_overtime": round(total_overtime, 1),
-            "total_shifts": len(shifts),
+            "total_overtime": round((total_overtime or 0) / 60, 1),
+            "total_shifts": shift_count,
             "weekly_limit": resource.weekly_hour_limit,
             "utilization_percentage": round((total_hours / (resource.weekly_hour_limit * 4)) * 100, 1) if total_hours > 0 else 0
         })
     
     # Get time slot usage
     time_slots = db.query(TimeSlotDB).all()
+    slot_totals = {
+        time_slot_id: (count, minutes)
+        for time_slot_id, count, minutes in db.query(
+            ShiftDB.time_slot_id,
+            func.count(ShiftDB.id),
+            func.sum(ShiftDB.minutes)
+        ).filter(ShiftDB.date >= start_of_month.date()).group_by(ShiftDB.time_slot_id).all()
+    }
+    for shift in month_archived:
+        count, minutes = slot_totals.get(shift["time_slot_id"], (0, 0))
+        slot_totals[shift["time_slot_id"]] = (count + 1, (minutes or 0) + (shift["minutes"] or 0))
     time_slot_usage = []
     
     for time_slot in time_slots:
-        shifts = db.query(ShiftDB).filter(
-            ShiftDB.time_slot_id == time_slot.id,
-            ShiftDB.date >= start_of_month.date()
-        ).all()
-        
+        usage_count, total_minutes = slot_totals.get(time_slot.id, (0, 0))
         time_slot_usage.append({
             "name": time_slot.name,
             "start_time": time_slot.start_time.strftime("%H:%M"),
             "end_time": time_slot.end_time.strftime("%H:%M"),
-            "usage_count": len(shifts),
-            "total_hours": sum(float(s.hours) for s in shifts)
+            "usage_count": usage_count,
+            "total_hours": minutes_to_hours(total_minutes)
         })
     
     # Calculate daily distribution for current week
     daily_distribution = []
     days = ['Lunedì', 'Martedì', 'Mercoledì', 'Giovedì', 'Venerdì', 'Sabato', 'Domenica']
+    day_totals = {
+        day_date: (count, minutes, overtime)
+        for day_date, count, minutes, overtime in db.query(
+            ShiftDB.date,
+            func.count(ShiftDB.id),
+            func.sum(ShiftDB.minutes),
+            func.sum(ShiftDB.overtime_minutes)
+        ).filter(ShiftDB.date >= monday, ShiftDB.date <= monday + timedelta(days=6)).group_by(ShiftDB.date).all()
+    }
+    for shift in archived:
+        day_date = date.fromisoformat(shift["date"])
+        if day_date >= monday:
+            count, minutes, overtime = day_totals.get(day_date, (0, 0, 0))
+            day_totals[day_date] = (count + 1, (minutes or 0) + (shift["minutes"] or 0), (overtime or 0) + (shift["overtime_minutes"] or 0))
     
     for i, day in enumerate(days):
-        # Calculate date for each day of current week
-        monday = current_date - timedelta(days=current_date.weekday())
-        day_date = (monday + timedelta(days=i)).date()
-        
-        day_shifts = db.query(ShiftDB).filter(ShiftDB.date == day_date).all()
+        day_date = monday + timedelta(days=i)
+        shift_count, total_minutes, total_overtime = day_totals.get(day_date, (0, 0, 0))
         
         daily_distribution.append({
             "day": day,
             "date": day_date.strftime("%Y-%m-%d"),
-            "shifts": len(day_shifts),
-            "hours": sum(float(s.hours) for s in day_shifts),
-            "overtime": sum(float(s.overtime_hours) for s in day_shifts)
+            "shifts": shift_count,
+            "hours": minutes_to_hours(total_minutes),
+            "overtime": minutes_to_hours(total_overtime)
         })
     
     return {
@@ -1087,7 +4526,10 @@ async def get_reports_overview(admin_user: User = Depends(get_admin_user), db: S
 @api_router.get("/reports/resource/{resource_id}")
 async def get_resource_report(resource_id: str, admin_user: User = Depends(get_admin_user), db: Session = Depends(get_db)):
     """Get detailed report for a specific resource"""
-    
+    today = datetime.now(timezone.utc).date()
+    return await report_cache.get(db, "resource", (resource_id, today), lambda session: compute_resource_report(session, resource_id))
+
+def compute_resource_report(db: Session, resource_id: str) -> dict:
     resource = db.query(ResourceDB).filter(ResourceDB.id == resource_id).first()
     if not resource:
         raise HTTPException(status_code=404, detail="Resource not found")
@@ -1095,38 +4537,50 @@ async def get_resource_report(resource_id: str, admin_user: User = Depends(get_a
     # Get shifts for last 8 weeks
     current_date = datetime.now(timezone.utc)
     eight_weeks_ago = current_date - timedelta(weeks=8)
-    
-    shifts = db.query(ShiftDB).filter(
-        ShiftDB.resource_id == resource_id,
-        ShiftDB.date >= eight_weeks_ago.date()
-    ).all()
+    range_filter = (ShiftDB.resource_id == resource_id, ShiftDB.date >= eight_weeks_ago.date())
     
     # Group by week
-    weekly_breakdown = {}
-    for shift in shifts:
-        week_key = f"{shift.year}-W{shift.week_number:02d}"
-        if week_key not in weekly_breakdown:
-            weekly_breakdown[week_key] = {
-                "week": shift.week_number,
-                "year": shift.year,
-                "hours": 0,
-                "overtime": 0,
-                "shifts": 0
-            }
-        
-        weekly_breakdown[week_key]["hours"] += float(shift.hours)
-        weekly_breakdown[week_key]["overtime"] += float(shift.overtime_hours)
-        weekly_breakdown[week_key]["shifts"] += 1
+    weeks = {(year, week_number): [minutes or 0, overtime or 0, count] for year, week_number, minutes, overtime, count in db.query(
+        ShiftDB.year,
+        ShiftDB.week_number,
+        func.sum(ShiftDB.minutes),
+        func.sum(ShiftDB.overtime_minutes),
+        func.count(ShiftDB.id)
+    ).filter(*range_filter).group_by(ShiftDB.year, ShiftDB.week_number).all()}
     
     # Time slot preference
-    time_slot_stats = {}
-    for shift in shifts:
-        time_slot = db.query(TimeSlotDB).filter(TimeSlotDB.id == shift.time_slot_id).first()
-        if time_slot:
-            slot_name = time_slot.name
-            if slot_name not in time_slot_stats:
-                time_slot_stats[slot_name] = 0
-            time_slot_stats[slot_name] += 1
+    time_slot_stats = dict(db.query(TimeSlotDB.name, func.count(ShiftDB.id)).join(
+        TimeSlotDB, TimeSlotDB.id == ShiftDB.time_slot_id
+    ).filter(*range_filter).group_by(TimeSlotDB.name).all())
+    
+    total_shifts, total_minutes, total_overtime = db.query(
+        func.count(ShiftDB.id), func.sum(ShiftDB.minutes), func.sum(ShiftDB.overtime_minutes)
+    ).filter(*range_filter).one()
+    
+    # Weeks past the archive horizon live (wholly or partly) in the shift archive
+    archived = [shift for shift in load_archived_shifts(db, start=eight_weeks_ago.date(), end=current_date.date())
+                if shift["resource_id"] == resource_id]
+    if archived:
+        slot_names = dict(db.query(TimeSlotDB.id, TimeSlotDB.name).all())
+        total_minutes, total_overtime = total_minutes or 0, total_overtime or 0
+        for shift in archived:
+            entry = weeks.setdefault((shift["year"], shift["week_number"]), [0, 0, 0])
+            entry[0] += shift["minutes"] or 0
+            entry[1] += shift["overtime_minutes"] or 0
+            entry[2] += 1
+            if shift["time_slot_id"] in slot_names:
+                name = slot_names[shift["time_slot_id"]]
+                time_slot_stats[name] = time_slot_stats.get(name, 0) + 1
+            total_shifts += 1
+            total_minutes += shift["minutes"] or 0
+            total_overtime += shift["overtime_minutes"] or 0
+    weekly_breakdown = [{
+        "week": week_number,
+        "year": year,
+        "hours": minutes_to_hours(minutes),
+        "overtime": minutes_to_hours(overtime),
+        "shifts": count
+    } for (year, week_number), (minutes, overtime, count) in sorted(weeks.items())]
     
     return {
         "resource": {
@@ -1136,91 +4590,455 @@ async def get_resource_report(resource_id: str, admin_user: User = Depends(get_a
             "weekly_limit": resource.weekly_hour_limit,
             "min_rest_hours": resource.min_rest_hours
         },
-        "weekly_breakdown": list(weekly_breakdown.values()),
+        "weekly_breakdown": weekly_breakdown,
         "time_slot_preferences": time_slot_stats,
         "totals": {
-            "total_shifts": len(shifts),
-            "total_hours": sum(float(s.hours) for s in shifts),
-            "total_overtime": sum(float(s.overtime_hours) for s in shifts),
-            "average_hours_per_week": round(sum(float(s.hours) for s in shifts) / 8, 1) if shifts else 0
+            "total_shifts": total_shifts,
+            "total_hours": minutes_to_hours(total_minutes),
+            "total_overtime": minutes_to_hours(total_overtime),
+            "average_hours_per_week": round((total_minutes or 0) / 60 / 8, 1) if total_shifts else 0
         }
     }
 
+@api_router.get("/reports/compliance")
+async def get_compliance_report(from_date: str, to_date: str, admin_user: User = Depends(get_admin_user), db: Session = Depends(get_db)):
+    """Rolling average-hours and consecutive-day limits broken over a range (up to a year)"""
+    start, end = parse_matrix_range(from_date, to_date)
+    return await report_cache.get(db, "compliance", (start, end), lambda session: compute_compliance_report(session, start, end))
+
+def compute_compliance_report(db: Session, start: date, end: date) -> dict:
+    # Only active resources with at least one rolling limit set
+    resources = db.query(ResourceDB).filter(
+        ResourceDB.is_active == True,
+        or_(*[getattr(ResourceDB, column).isnot(None) for column in ROLLING_LIMIT_COLUMNS])
+    ).order_by(ResourceDB.name).all()
+    violations = RollingLimits.load(db, resources, start, end).scan(start, end) if resources else []
+    names = {resource.id: resource.name for resource in resources}
+    for violation in violations:
+        violation["name"] = names[violation["resource_id"]]
+    return {
+        "from_date": start.strftime("%Y-%m-%d"),
+        "to_date": end.strftime("%Y-%m-%d"),
+        "resources_checked": len(resources),
+        "violations": violations
+    }
+
+@api_router.get("/reports/fairness")
+async def get_fairness_report(from_date: str, to_date: str, admin_user: User = Depends(get_admin_user), db: Session = Depends(get_db)):
+    """Nights, weekends and consecutive working days of every resource over a range (up to a year)"""
+    start, end = parse_matrix_range(from_date, to_date)
+    return await report_cache.get(db, "fairness", (start, end), lambda session: compute_fairness_report(session, start, end))
+
+def compute_fairness_report(db: Session, start: date, end: date) -> dict:
+    matrix = load_schedule_matrix(db, start, end)
+    time_slot_ids, resource_ids = matrix["time_slot_ids"], matrix["resource_ids"]
+    slots = {slot.id: slot for slot in db.query(TimeSlotDB).filter(TimeSlotDB.id.in_(time_slot_ids)).all()}
+    names = dict(db.query(ResourceDB.id, ResourceDB.name).filter(ResourceDB.id.in_(resource_ids)).all()) if resource_ids else {}
+    
+    codes = slot_code_matrix(matrix)
+    worked = codes >= 0
+    # Lookup tables get an extra trailing False so that the -1 "off" code maps to it
+    night_slots = np.array([slot_id in slots and is_night_slot(slots[slot_id].start_time, slots[slot_id].end_time) for slot_id in time_slot_ids] + [False])
+    weekend_days = (start.weekday() + np.arange(matrix["days"])) % 7 >= 5
+    
+    shifts = worked.sum(axis=1)
+    nights = night_slots[codes].sum(axis=1)
+    weekends = (worked & weekend_days).sum(axis=1)
+    consecutive = longest_runs(worked)
+    by_slot = np.bincount(
+        matrix["resource"] * len(time_slot_ids) + matrix["slot"],
+        minlength=len(resource_ids) * len(time_slot_ids)
+    ).reshape(len(resource_ids), len(time_slot_ids))
+    
+    # Spread among people who worked at least once in the range
+    active = shifts > 0
+    return {
+        "from_date": start.strftime("%Y-%m-%d"),
+        "to_date": end.strftime("%Y-%m-%d"),
+        "night_time_slot_ids": [slot_id for slot_id, night in zip(time_slot_ids, night_slots) if night],
+        "spread": {
+            "shifts": gini_coefficient(shifts[active]),
+            "nights": gini_coefficient(nights[active]),
+            "weekends": gini_coefficient(weekends[active]),
+            "max_consecutive_days": gini_coefficient(consecutive[active]),
+            "by_time_slot": {slot_id: gini_coefficient(by_slot[active, index]) for index, slot_id in enumerate(time_slot_ids)}
+        },
+        "resources": [{
+            "resource_id": resource_id,
+            "name": names.get(resource_id),
+            "shifts": int(shifts[index]),
+            "nights": int(nights[index]),
+            "weekends": int(weekends[index]),
+            "max_consecutive_days": int(consecutive[index]),
+            "by_time_slot": {slot_id: int(by_slot[index, slot]) for slot, slot_id in enumerate(time_slot_ids)}
+        } for index, resource_id in enumerate(resource_ids)]
+    }
+
+# 🔐 CONFIGURA LE PASSWORD QUI (stesso valore del codice di inizializzazione)
+DEFAULT_ADMIN_PASSWORD = "NUOVA_PASSWORD_ADMIN"
+DEFAULT_EMPLOYEE_PASSWORD = "NUOVA_PASSWORD_DIPENDENTI"
+
+def reset_default_passwords(db: Session, context: Optional[JobContext] = None) -> dict:
+    """Reset every user to the default password of their role (commits).
+    
+    Each user gets its own salted hash: they are computed in parallel on the hashing pool before
+    anything is written, then stored with one UPDATE ... FROM json_each per role, so the write
+    lock is held for the two UPDATEs only. Users created meanwhile keep their password.
+    """
+    conn = db.connection()
+    roles = [(UserRole.ADMIN, DEFAULT_ADMIN_PASSWORD, "admin"), (UserRole.EMPLOYEE, DEFAULT_EMPLOYEE_PASSWORD, "dipendenti")]
+    new_hashes = {}
+    for step, (role, password, label) in enumerate(roles):
+        # Plain SELECTs: no transaction is open while hashing, so progress can be written
+        user_ids = [row[0] for row in conn.exec_driver_sql("SELECT id FROM users WHERE role = ?", (role.name,))]
+        new_hashes[role] = list(zip(user_ids, hash_passwords([password] * len(user_ids))))
+        if context:
+            context.progress(step + 1, len(roles) + 1, f"Password {label} calcolate")
+    
+    counts = {}
+    for role, rows in new_hashes.items():
+        counts[role] = conn.exec_driver_sql("""
+            UPDATE users SET password = h.password
+            FROM (SELECT json_extract(value, '$[0]') AS id, json_extract(value, '$[1]') AS password FROM json_each(?)) h
+            WHERE users.id = h.id
+        """, (json.dumps(rows),)).rowcount if rows else 0
+    bump_data_versions(db, ["users"])
+    db.commit()
+    # Only now: progress is written by another connection, which would wait for the lock held above
+    if context:
+        context.progress(len(roles) + 1, len(roles) + 1, "Password aggiornate")
+    
+    return {
+        "message": "Tutte le password sono state aggiornate con successo",
+        "admin_updated": counts[UserRole.ADMIN],
+        "employees_updated": counts[UserRole.EMPLOYEE],
+        "admin_password": DEFAULT_ADMIN_PASSWORD,
+        "employee_password": DEFAULT_EMPLOYEE_PASSWORD
+    }
+
+JOB_HANDLERS["reset_all_passwords"] = lambda context: reset_default_passwords(context.main_db, context)
+
 @api_router.post("/admin/reset-all-passwords")
-async def reset_all_passwords(admin_user: User = Depends(get_admin_user), db: Session = Depends(get_db)):
+async def reset_all_passwords(background: bool = False, admin_user: User = Depends(get_admin_user), db: Session = Depends(get_main_db)):
     """
     🔐 ENDPOINT PER RESETTARE TUTTE LE PASSWORD ALLE DEFAULT
     Utile per aggiornare password esistenti quando cambi i valori nel codice
+    Con ?background=true risponde subito 202 con il job da interrogare su /api/jobs/{id}
     """
-    
-    # 🔐 CONFIGURA LE PASSWORD QUI (stesso valore del codice di inizializzazione)
-    ADMIN_PASSWORD = "NUOVA_PASSWORD_ADMIN"
-    EMPLOYEE_PASSWORD = "NUOVA_PASSWORD_DIPENDENTI"
+    if background:
+        return job_accepted(job_runner.enqueue("reset_all_passwords", created_by=admin_user.id))
     
     try:
-        # Aggiorna password admin
-        admin_users = db.query(UserDB).filter(UserDB.role == UserRole.ADMIN).all()
-        admin_count = 0
-        for user in admin_users:
-            user.password = hash_password(ADMIN_PASSWORD)
-            admin_count += 1
-        
-        # Aggiorna password dipendenti
-        employee_users = db.query(UserDB).filter(UserDB.role == UserRole.EMPLOYEE).all()
-        employee_count = 0
-        for user in employee_users:
-            user.password = hash_password(EMPLOYEE_PASSWORD)
-            employee_count += 1
-        
-        db.commit()
-        
-        return {
-            "message": "Tutte le password sono state aggiornate con successo",
-            "admin_updated": admin_count,
-            "employees_updated": employee_count,
-            "admin_password": ADMIN_PASSWORD,
-            "employee_password": EMPLOYEE_PASSWORD
-        }
-        
+        # Hashing every user takes a while: wait for it off the event loop
+        return await asyncio.to_thread(reset_default_passwords, db)
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=500, detail=f"Errore nell'aggiornamento password: {str(e)}")
 
+@api_router.get("/admin/archive")
+async def get_archive(admin_user: User = Depends(get_admin_user), db: Session = Depends(get_db)):
+    """Archived weeks with their totals and compressed size"""
+    weeks = db.query(
+        ShiftArchiveDB.week_number, ShiftArchiveDB.year, ShiftArchiveDB.first_date, ShiftArchiveDB.last_date,
+        ShiftArchiveDB.shift_count, ShiftArchiveDB.total_minutes, ShiftArchiveDB.total_overtime_minutes,
+        func.length(ShiftArchiveDB.payload), ShiftArchiveDB.archived_at
+    ).order_by(ShiftArchiveDB.year, ShiftArchiveDB.week_number).all()
+    return {
+        "horizon_weeks": ARCHIVE_HORIZON_WEEKS,
+        "cutoff": archive_cutoff(ARCHIVE_HORIZON_WEEKS).strftime("%Y-%m-%d"),
+        "weeks": [{
+            "week_number": week_number,
+            "year": year,
+            "first_date": first_date.strftime("%Y-%m-%d"),
+            "last_date": last_date.strftime("%Y-%m-%d"),
+            "shifts": shift_count,
+            "total_hours": minutes_to_hours(total_minutes),
+            "total_overtime": minutes_to_hours(total_overtime),
+            "compressed_bytes": size,
+            "archived_at": archived_at
+        } for week_number, year, first_date, last_date, shift_count, total_minutes, total_overtime, size, archived_at in weeks]
+    }
+
+@api_router.post("/admin/archive")
+async def archive_shifts(request: Request, horizon_weeks: int = ARCHIVE_HORIZON_WEEKS, background: bool = False,
+                         admin_user: User = Depends(get_admin_user), db: Session = Depends(get_db)):
+    """Move weeks older than the horizon into the shift archive (?background=true -> 202 + job id)"""
+    if horizon_weeks < 1:
+        raise HTTPException(status_code=400, detail="horizon_weeks must be at least 1")
+    if background:
+        return job_accepted(job_runner.enqueue(
+            "archive_weeks",
+            params={"horizon_weeks": horizon_weeks},
+            site_id=resolve_site_id(request),
+            created_by=admin_user.id
+        ))
+    
+    return archive_old_weeks(db, horizon_weeks)
+
+# Backups
+BACKUP_DIR = os.environ.get("BACKUP_DIR", str(Path(DATABASE_FILE).parent / "backups"))
+# Snapshots kept per database; older ones are deleted after each backup
+BACKUP_KEEP = int(os.environ.get("BACKUP_KEEP", "7"))
+# Scheduled backups every N hours (0 = only on demand)
+BACKUP_INTERVAL_HOURS = float(os.environ.get("BACKUP_INTERVAL_HOURS", "0"))
+# Pages copied per backup step; writers only wait for one step at a time
+BACKUP_PAGES_PER_STEP = int(os.environ.get("BACKUP_PAGES_PER_STEP", "256"))
+BACKUP_NAME_PATTERN = re.compile(r"^(?P<site_id>[a-z0-9][a-z0-9_-]*)-(?P<stamp>\d{8}T\d{6}Z)\.db\.gz$")
+
+def site_database_files(main_db: Session) -> Dict[str, str]:
+    """Database file of the main database and of every active site"""
+    files = {DEFAULT_SITE_ID: DATABASE_FILE}
+    for site_id, database_file in main_db.query(SiteDB.id, SiteDB.database_file).filter(SiteDB.is_active == True).all():
+        files.setdefault(site_id, database_file)
+    return files
+
+def copy_database(source_file: str, target_file: str, pages_per_step: int = BACKUP_PAGES_PER_STEP, progress=None) -> dict:
+    """Consistent copy of a live database with the online backup API, a few pages per step.
+    
+    In WAL mode the steps only read from a snapshot held open for the whole copy, so
+    writers keep committing while it runs and the copy never restarts.
+    """
+    started = perf_counter()
+    steps = 0
+    def on_step(status, remaining, total):
+        nonlocal steps
+        steps += 1
+        if progress:
+            progress(total - remaining, total)
+    
+    source = sqlite3.connect(source_file, isolation_level=None)
+    target = sqlite3.connect(target_file)
+    try:
+        # Pin one WAL snapshot for the whole copy: steps read from it instead of restarting on every commit
+        source.execute("BEGIN")
+        source.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+        source.backup(target, pages=pages_per_step, progress=on_step, sleep=0.05)
+        page_count = target.execute("PRAGMA page_count").fetchone()[0]
+        page_size = target.execute("PRAGMA page_size").fetchone()[0]
+    finally:
+        target.close()
+        source.rollback()
+        source.close()
+    return {"pages": page_count, "bytes": page_count * page_size, "steps": steps, "copy_ms": round((perf_counter() - started) * 1000, 1)}
+
+def backup_database(site_id: str, database_file: str, progress=None) -> dict:
+    """Snapshot one database into BACKUP_DIR as <site>-<UTC timestamp>.db.gz and rotate old snapshots"""
+    Path(BACKUP_DIR).mkdir(parents=True, exist_ok=True)
+    name = f"{site_id}-{datetime.utcnow().strftime('%Y%m%dT%H%M%SZ')}.db.gz"
+    path = Path(BACKUP_DIR) / name
+    
+    with tempfile.TemporaryDirectory(dir=BACKUP_DIR) as work_dir:
+        raw_file = str(Path(work_dir) / "copy.db")
+        metrics = copy_database(database_file, raw_file, progress=progress)
+        
+        started = perf_counter()
+        partial = Path(work_dir) / name
+        with open(raw_file, "rb") as raw, gzip.open(partial, "wb", compresslevel=6) as compressed:
+            shutil.copyfileobj(raw, compressed, 1024 * 1024)
+        # Rename only once complete, so a listed snapshot is never half-written
+        os.replace(partial, path)
+        metrics["compress_ms"] = round((perf_counter() - started) * 1000, 1)
+    
+    metrics["compressed_bytes"] = path.stat().st_size
+    metrics["deleted"] = rotate_backups(site_id)
+    return {"site_id": site_id, "name": name, **metrics}
+
+def rotate_backups(site_id: str, keep: int = BACKUP_KEEP) -> List[str]:
+    snapshots = [backup for backup in list_backups() if backup["site_id"] == site_id]
+    deleted = []
+    for backup in snapshots[keep:]:
+        (Path(BACKUP_DIR) / backup["name"]).unlink(missing_ok=True)
+        deleted.append(backup["name"])
+    return deleted
+
+def list_backups() -> List[dict]:
+    """Snapshots in BACKUP_DIR, newest first"""
+    if not Path(BACKUP_DIR).is_dir():
+        return []
+    backups = []
+    for path in Path(BACKUP_DIR).iterdir():
+        match = BACKUP_NAME_PATTERN.match(path.name)
+        if match:
+            backups.append({
+                "name": path.name,
+                "site_id": match["site_id"],
+                "created_at": datetime.strptime(match["stamp"], "%Y%m%dT%H%M%SZ"),
+                "compressed_bytes": path.stat().st_size
+            })
+    return sorted(backups, key=lambda backup: backup["created_at"], reverse=True)
+
+def backup_path(name: str) -> Path:
+    """Path of a listed snapshot; names are matched strictly so no other file can be addressed"""
+    path = Path(BACKUP_DIR) / name
+    if not BACKUP_NAME_PATTERN.match(name) or not path.is_file():
+        raise HTTPException(status_code=404, detail=f"Backup not found: {name}")
+    return path
+
+def verify_backup(path: Path) -> dict:
+    """Decompress a snapshot and check it: integrity check, schema version and row counts"""
+    started = perf_counter()
+    with tempfile.TemporaryDirectory(dir=path.parent) as work_dir:
+        raw_file = str(Path(work_dir) / "verify.db")
+        with gzip.open(path, "rb") as compressed, open(raw_file, "wb") as raw:
+            shutil.copyfileobj(compressed, raw, 1024 * 1024)
+        conn = sqlite3.connect(raw_file)
+        try:
+            integrity = [row[0] for row in conn.execute("PRAGMA integrity_check")]
+            tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+            schema_version = conn.execute("SELECT MAX(version) FROM schema_migrations").fetchone()[0] if "schema_migrations" in tables else None
+            counts = {table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                      for table in ("users", "resources", "time_slots", "shifts", "shift_archive") if table in tables}
+        finally:
+            conn.close()
+        size = Path(raw_file).stat().st_size
+    return {
+        "name": path.name,
+        "ok": integrity == ["ok"],
+        "integrity": integrity[:10],
+        "schema_version": schema_version,
+        "row_counts": counts,
+        "bytes": size,
+        "verify_ms": round((perf_counter() - started) * 1000, 1)
+    }
+
+def restore_backup(path: Path, target_file: str) -> dict:
+    """Verify a snapshot and copy it over target_file with the backup API (run with the server stopped)"""
+    check = verify_backup(path)
+    if not check["ok"]:
+        raise ValueError(f"Backup {path.name} failed the integrity check: {check['integrity']}")
+    
+    started = perf_counter()
+    with tempfile.TemporaryDirectory(dir=path.parent) as work_dir:
+        raw_file = str(Path(work_dir) / "restore.db")
+        with gzip.open(path, "rb") as compressed, open(raw_file, "wb") as raw:
+            shutil.copyfileobj(compressed, raw, 1024 * 1024)
+        metrics = copy_database(raw_file, target_file)
+    return {**check, **metrics, "target": target_file, "restore_ms": round((perf_counter() - started) * 1000, 1)}
+
+def run_backups(main_db: Session, context: Optional[JobContext] = None) -> dict:
+    """Back up the main database and every site database, one after the other"""
+    files = site_database_files(main_db)
+    started = perf_counter()
+    results = []
+    for index, (site_id, database_file) in enumerate(files.items()):
+        if context:
+            context.progress(index, len(files), f"Backup {site_id}")
+        results.append(backup_database(site_id, database_file))
+    return {
+        "backups": results,
+        "bytes": sum(result["bytes"] for result in results),
+        "compressed_bytes": sum(result["compressed_bytes"] for result in results),
+        "elapsed_ms": round((perf_counter() - started) * 1000, 1)
+    }
+
+JOB_HANDLERS["backup"] = lambda context: run_backups(context.main_db, context)
+
+def backup_scheduler():
+    """Queue a backup job whenever the newest main snapshot is older than BACKUP_INTERVAL_HOURS"""
+    interval = timedelta(hours=BACKUP_INTERVAL_HOURS)
+    while True:
+        try:
+            newest = next((backup["created_at"] for backup in list_backups() if backup["site_id"] == DEFAULT_SITE_ID), None)
+            if newest is None or datetime.utcnow() - newest >= interval:
+                # Every worker runs this loop: the conditional insert lets only the first one queue the backup
+                job_runner.enqueue_unique("backup", succeeded_since=datetime.utcnow() - interval)
+        except Exception:
+            logging.getLogger(__name__).exception("Backup scheduler failed")
+        threading.Event().wait(60)
+
+@api_router.get("/admin/backups")
+async def get_backups(admin_user: User = Depends(get_admin_user)):
+    return {
+        "directory": BACKUP_DIR,
+        "keep": BACKUP_KEEP,
+        "interval_hours": BACKUP_INTERVAL_HOURS,
+        "backups": list_backups()
+    }
+
+@api_router.post("/admin/backups")
+async def create_backup(background: bool = False, admin_user: User = Depends(get_admin_user), main_db: Session = Depends(get_main_db)):
+    """Online backup of every database (?background=true -> 202 + job id)"""
+    if background:
+        return job_accepted(job_runner.enqueue("backup", created_by=admin_user.id))
+    
+    return await asyncio.to_thread(run_backups, main_db)
+
+@api_router.post("/admin/backups/{name}/verify")
+async def verify_backup_endpoint(name: str, admin_user: User = Depends(get_admin_user)):
+    return await asyncio.to_thread(verify_backup, backup_path(name))
+
+@api_router.get("/admin/query-plans")
+async def get_query_plans(admin_user: User = Depends(get_admin_user)):
+    """EXPLAIN QUERY PLAN for the hot queries, to spot full table scans"""
+    return explain_hot_queries()
+
+# SQL expression for a random uuid4-formatted id, for rows inserted by INSERT ... SELECT
+SQL_UUID4 = (
+    "lower(hex(randomblob(4)) || '-' || hex(randomblob(2)) || '-4' || substr(hex(randomblob(2)), 2) || '-' || "
+    "substr('89AB', 1 + abs(random()) % 4, 1) || substr(hex(randomblob(2)), 2) || '-' || hex(randomblob(6)))"
+)
+
+def insert_missing_employee_users(main_db: Session, db: Session, site_id: str) -> int:
+    """Employee user for every active resource whose e-mail has no user yet, in one INSERT ... SELECT.
+    
+    Resources may live in another site file, so they are read with one query and handed to the
+    insert as a single JSON parameter. Usernames already taken (same e-mail prefix) are skipped.
+    Every new user gets its own salted hash of the default password, computed on the hashing
+    pool before the insert takes the write lock (blocking: run it off the event loop).
+    """
+    resources = db.connection().exec_driver_sql("SELECT email, name FROM resources WHERE is_active = 1").fetchall()
+    if not resources:
+        return 0
+    conn = main_db.connection()
+    missing = conn.exec_driver_sql("""
+        SELECT json_extract(value, '$[0]'), json_extract(value, '$[1]') FROM json_each(?) r
+        WHERE NOT EXISTS (SELECT 1 FROM users u WHERE u.email = json_extract(r.value, '$[0]'))
+    """, (json.dumps([list(resource) for resource in resources]),)).fetchall()
+    if not missing:
+        return 0
+    hashes = hash_passwords([DEFAULT_EMPLOYEE_PASSWORD] * len(missing))
+    inserted = conn.exec_driver_sql(f"""
+        INSERT OR IGNORE INTO users (id, username, email, password, full_name, role, created_at, is_active, site_id)
+        SELECT {SQL_UUID4}, substr(r.email, 1, instr(r.email || '@', '@') - 1), r.email, r.password, r.name, ?, ?, 1, ?
+        FROM (SELECT json_extract(value, '$[0]') AS email, json_extract(value, '$[1]') AS name,
+                     json_extract(value, '$[2]') AS password FROM json_each(?)) r
+        WHERE NOT EXISTS (SELECT 1 FROM users u WHERE u.email = r.email)
+    """, (
+        UserRole.EMPLOYEE.name, datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S.%f"), site_id,
+        json.dumps([[email, name, hashed] for (email, name), hashed in zip(missing, hashes)])
+    )).rowcount
+    if inserted:
+        bump_data_versions(main_db, ["users"])
+    return inserted
+
 # Initialize default data
 @api_router.post("/admin/init-data")
-async def init_default_data(db: Session = Depends(get_db)):
+async def init_default_data(request: Request, background: bool = False, db: Session = Depends(get_db), main_db: Session = Depends(get_main_db)):
+    site_id = resolve_site_id(request)
+    if background:
+        return job_accepted(job_runner.enqueue("init_default_data", site_id=site_id))
+    
+    # Hashing the passwords of new users takes a while: wait for it off the event loop
+    return await asyncio.to_thread(initialize_default_data, db, main_db, site_id)
+
+def initialize_default_data(db: Session, main_db: Session, site_id: str, context: Optional[JobContext] = None) -> dict:
     # Create default admin user if not exists
-    admin_exists = db.query(UserDB).filter(UserDB.role == UserRole.ADMIN).first()
+    admin_exists = main_db.query(UserDB).filter(UserDB.role == UserRole.ADMIN).first()
     if not admin_exists:
         admin_user = UserDB(
             id="admin-001",
             username="admin",
             email="admin@planshift.com",
-            password=hash_password("NUOVA_PASSWORD_ADMIN"),  # 🔐 CAMBIA QUI LA PASSWORD ADMIN
+            password=hash_password(DEFAULT_ADMIN_PASSWORD),  # 🔐 CAMBIA QUI LA PASSWORD ADMIN
             full_name="Amministratore Sistema",
             role=UserRole.ADMIN
         )
-        db.add(admin_user)
+        main_db.add(admin_user)
     
-    # Create employee users for existing resources
-    resources = db.query(ResourceDB).filter(ResourceDB.is_active == True).all()
-    for resource in resources:
-        # Check if employee user already exists for this resource
-        existing_user = db.query(UserDB).filter(
-            UserDB.email == resource.email,
-            UserDB.role == UserRole.EMPLOYEE
-        ).first()
-        
-        if not existing_user:
-            # Create employee user based on resource
-            employee_user = UserDB(
-                username=resource.email.split('@')[0],  # Use email prefix as username
-                email=resource.email,
-                password=hash_password("NUOVA_PASSWORD_DIPENDENTI"),  # 🔐 CAMBIA QUI LA PASSWORD DIPENDENTI
-                full_name=resource.name,
-                role=UserRole.EMPLOYEE
-            )
-            db.add(employee_user)
+    # Create employee users for existing resources: one INSERT ... SELECT over the site's resources
+    if context:
+        context.progress(0, 1, "Creazione utenti dipendenti")
+    employees_created = insert_missing_employee_users(main_db, db, site_id)
     
     # Create default time slots if not exist
     time_slots_exist = db.query(TimeSlotDB).first()
@@ -1242,8 +5060,42 @@ async def init_default_data(db: Session = Depends(get_db)):
             )
             db.add(slot)
     
+    main_db.commit()
     db.commit()
-    return {"message": "Default data initialized with employee users"}
+    return {"message": "Default data initialized with employee users", "employees_created": employees_created}
+
+JOB_HANDLERS["init_default_data"] = lambda context: initialize_default_data(context.db, context.main_db, context.site_id, context)
+
+# Jobs Endpoints
+@api_router.get("/jobs")
+async def get_jobs(admin_user: User = Depends(get_admin_user), main_db: Session = Depends(get_main_db)):
+    jobs = main_db.query(JobDB).order_by(JobDB.created_at.desc()).limit(50).all()
+    return [job_to_dict(job) for job in jobs]
+
+@api_router.get("/jobs/{job_id}")
+async def get_job(job_id: str, admin_user: User = Depends(get_admin_user), main_db: Session = Depends(get_main_db)):
+    job = main_db.query(JobDB).filter(JobDB.id == job_id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job_to_dict(job)
+
+@api_router.post("/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str, admin_user: User = Depends(get_admin_user), main_db: Session = Depends(get_main_db)):
+    job = main_db.query(JobDB).filter(JobDB.id == job_id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job.status in ("succeeded", "failed", "cancelled"):
+        raise HTTPException(status_code=400, detail=f"Job already {job.status}")
+    
+    # A queued job is cancelled right away, a running one stops at its next progress report
+    cancelled_now = main_db.query(JobDB).filter(JobDB.id == job_id, JobDB.status == "queued").update(
+        {"status": "cancelled", "cancel_requested": True, "finished_at": datetime.utcnow()}
+    )
+    if not cancelled_now:
+        job.cancel_requested = True
+    main_db.commit()
+    main_db.refresh(job)
+    return job_to_dict(job)
 
 # Include router
 app.include_router(api_router)
@@ -1251,12 +5103,42 @@ app.include_router(api_router)
 # Create database tables on startup
 create_db_and_tables()
 
+@app.on_event("startup")
+def start_job_runner():
+    # Start the hashing workers before any background thread exists
+    get_hash_pool().submit(needs_rehash, None)
+    job_runner.recover()
+    if BACKUP_INTERVAL_HOURS > 0:
+        threading.Thread(target=backup_scheduler, name="planshift-backups", daemon=True).start()
+    if MAIL_TRANSPORT:
+        threading.Thread(target=notification_dispatcher, name="planshift-notifications", daemon=True).start()
+
+@app.on_event("shutdown")
+def stop_hash_pool():
+    shutdown_hash_pool()
+
+@app.exception_handler(WeekConflict)
+async def week_conflict_handler(request: Request, exc: WeekConflict):
+    return JSONResponse(status_code=409, content={
+        "detail": "La settimana è stata modificata da un altro utente: ricarica e riprova",
+        "week_number": exc.week_number,
+        "year": exc.year,
+        "version": exc.version
+    }, headers={"X-Week-Version": str(exc.version)})
+
+@app.exception_handler(NotModified)
+async def not_modified_handler(request: Request, exc: NotModified):
+    return Response(status_code=304, headers=etag_headers(exc.etag))
+
+app.add_middleware(CompressionMiddleware, minimum_size=COMPRESSION_MIN_SIZE)
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Week-Version"],
 )
 
 # Configure logging
@@ -1267,5 +5149,42 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 if __name__ == "__main__":
+    import sys
+    
+    # python server.py explain-queries -> prints the query plans, exits 1 on full scans (CI check)
+    if len(sys.argv) > 1 and sys.argv[1] == "explain-queries":
+        plans = explain_hot_queries()
+        for entry in plans:
+            print(f"{'❌' if entry['full_scan'] else '✅'} {entry['query']}")
+            for step in entry["plan"]:
+                print(f"    {step}")
+        sys.exit(1 if any(entry["full_scan"] for entry in plans) else 0)
+    
+    # python server.py backup | verify <file> | restore <file> [target] -> snapshots in BACKUP_DIR
+    if len(sys.argv) > 1 and sys.argv[1] == "backup":
+        main_db = SessionLocal()
+        try:
+            result = run_backups(main_db)
+        finally:
+            main_db.close()
+        for backup in result["backups"]:
+            print(f"✅ {backup['name']}: {backup['bytes']} -> {backup['compressed_bytes']} bytes, "
+                  f"{backup['steps']} steps, copy {backup['copy_ms']} ms, compress {backup['compress_ms']} ms")
+            for name in backup["deleted"]:
+                print(f"    🗑️  {name}")
+        sys.exit(0)
+    
+    if len(sys.argv) > 2 and sys.argv[1] == "verify":
+        result = verify_backup(Path(sys.argv[2]))
+        print(f"{'✅' if result['ok'] else '❌'} {result['name']}: schema {result['schema_version']}, "
+              f"{result['row_counts']}, {result['verify_ms']} ms")
+        sys.exit(0 if result["ok"] else 1)
+    
+    if len(sys.argv) > 2 and sys.argv[1] == "restore":
+        target_file = sys.argv[3] if len(sys.argv) > 3 else DATABASE_FILE
+        result = restore_backup(Path(sys.argv[2]), target_file)
+        print(f"✅ {result['name']} restored into {result['target']} ({result['bytes']} bytes, {result['restore_ms']} ms)")
+        sys.exit(0)
+    
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8001)
\ No newline at end of file
@@ -4,14 +4,25 @@ Script per aggiornare le password nel database SQLite
 Esegui questo script per cambiare le password di utenti esistenti
 """
 
+import json
 import sqlite3
-import hashlib
 import sys
 from pathlib import Path
 
-def hash_password(password: str) -> str:
-    """Hash password usando SHA256"""
-    return hashlib.sha256(password.encode()).hexdigest()
+from passwords import PASSWORD_HASH_WORKERS, hash_passwords
+
+def update_role_passwords(cursor, role: str, password: str) -> int:
+    """Hash scrypt con salt diverso per ogni utente, calcolati in parallelo, e un solo UPDATE per ruolo"""
+    user_ids = [row[0] for row in cursor.execute("SELECT id FROM users WHERE role = ?", (role,))]
+    if not user_ids:
+        return 0
+    hashes = hash_passwords([password] * len(user_ids))
+    cursor.execute("""
+        UPDATE users SET password = h.password
+        FROM (SELECT json_extract(value, '$[0]') AS id, json_extract(value, '$[1]') AS password FROM json_each(?)) h
+        WHERE users.id = h.id
+    """, (json.dumps(list(zip(user_ids, hashes))),))
+    return cursor.rowcount
 
 def update_passwords():
     """Aggiorna le password nel database"""
@@ -32,23 +43,13 @@ def update_passwords():
         conn = sqlite3.connect(db_path)
         cursor = conn.cursor()
         
+        print(f"⏳ Calcolo hash con {PASSWORD_HASH_WORKERS} processi...")
+        
         # Aggiorna password admin
-        admin_hash = hash_password(ADMIN_PASSWORD)
-        cursor.execute("""
-            UPDATE users 
-            SET password = ? 
-            WHERE role = 'ADMIN'
-        """, (admin_hash,))
-        admin_updated = cursor.rowcount
+        admin_updated = update_role_passwords(cursor, 'ADMIN', ADMIN_PASSWORD)
         
         # Aggiorna password dipendenti
-        employee_hash = hash_password(EMPLOYEE_PASSWORD)
-        cursor.execute("""
-            UPDATE users 
-            SET password = ? 
-            WHERE role = 'EMPLOYEE'
-        """, (employee_hash,))
-        employees_updated = cursor.rowcount
+        employees_updated = update_role_passwords(cursor, 'EMPLOYEE', EMPLOYEE_PASSWORD)
         
         # Salva modifiche
         conn.commit()
@@ -536,7 +536,10 @@ const ResourceManagement = () => {
     name: '',
     email: '',
     weekly_hour_limit: 40,
-    min_rest_hours: 12
+    min_rest_hours: 12,
+    max_avg_hours_4_weeks: null,
+    max_avg_hours_17_weeks: null,
+    max_consecutive_days: null
   });
 
   useEffect(() => {
@@ -584,7 +587,10 @@ const ResourceManagement = () => {
       name: '',
       email: '',
       weekly_hour_limit: 40,
-      min_rest_hours: 12
+      min_rest_hours: 12,
+      max_avg_hours_4_weeks: null,
+      max_avg_hours_17_weeks: null,
+      max_consecutive_days: null
     });
     setEditingResource(null);
     setShowForm(false);
@@ -595,7 +601,10 @@ const ResourceManagement = () => {
       name: resource.name,
       email: resource.email,
       weekly_hour_limit: resource.weekly_hour_limit,
-      min_rest_hours: resource.min_rest_hours
+      min_rest_hours: resource.min_rest_hours,
+      max_avg_hours_4_weeks: resource.max_avg_hours_4_weeks ?? null,
+      max_avg_hours_17_weeks: resource.max_avg_hours_17_weeks ?? null,
+      max_consecutive_days: resource.max_consecutive_days ?? null
     });
     setEditingResource(resource);
     setShowForm(true);
@@ -703,6 +712,44 @@ const ResourceManagement = () => {
                   Ore minime che devono passare tra la fine di un turno e l'inizio del successivo
                 </p>
               </div>
+              <div>
+                <label className="form-label">Media Ore Max (4 settimane)</label>
+                <input
+                  type="number"
+                  value={formData.max_avg_hours_4_weeks ?? ''}
+                  onChange={(e) => setFormData({ ...formData, max_avg_hours_4_weeks: e.target.value ? parseInt(e.target.value) : null })}
+                  className="form-input"
+                  min="1"
+                  max="168"
+                  placeholder="Nessun limite"
+                />
+              </div>
+              <div>
+                <label className="form-label">Media Ore Max (17 settimane)</label>
+                <input
+                  type="number"
+                  value={formData.max_avg_hours_17_weeks ?? ''}
+                  onChange={(e) => setFormData({ ...formData, max_avg_hours_17_weeks: e.target.value ? parseInt(e.target.value) : null })}
+                  className="form-input"
+                  min="1"
+                  max="168"
+                  placeholder="Nessun limite"
+                />
+                <p className="text-xs text-slate-500 mt-1">
+                  Media settimanale massima su qualsiasi periodo mobile di 4 o 17 settimane
+                </p>
+              </div>
+              <div>
+                <label className="form-label">Giorni Consecutivi Max</label>
+                <input
+                  type="number"
+                  value={formData.max_consecutive_days ?? ''}
+                  onChange={(e) => setFormData({ ...formData, max_consecutive_days: e.target.value ? parseInt(e.target.value) : null })}
+                  className="form-input"
+                  min="1"
+                  placeholder="Nessun limite"
+                />
+              </div>
             </div>
             <div className="flex gap-2">
               <button type="submit" className="btn btn-primary">
@@ -34,6 +34,7 @@ const AdvancedSchedulingGrid = ({ currentWeek, onWeekChange }) => {
   const [conflicts, setConflicts] = useState([]);
   const [resourceStats, setResourceStats] = useState({});
   const [filterResource, setFilterResource] = useState('');
+  const [searchMatches, setSearchMatches] = useState(new Set());
   const [showConflictsOnly, setShowConflictsOnly] = useState(false);
   const [hoveredCell, setHoveredCell] = useState(null);
 
@@ -311,12 +312,33 @@ const AdvancedSchedulingGrid = ({ currentWeek, onWeekChange }) => {
     toast.success('Pianificazione esportata in JSON');
   };
 
+  // Server-side search also finds accent and apostrophe variants ("dangelo" -> D'Angelo)
+  useEffect(() => {
+    if (!filterResource.trim()) {
+      setSearchMatches(new Set());
+      return;
+    }
+    const timer = setTimeout(async () => {
+      try {
+        const response = await axios.get(`${API}/search`, {
+          params: { q: filterResource, limit: 50 },
+          headers: { Authorization: `Bearer ${token}` }
+        });
+        setSearchMatches(new Set(response.data.resources.map(resource => resource.id)));
+      } catch (error) {
+        setSearchMatches(new Set());
+      }
+    }, 200);
+    return () => clearTimeout(timer);
+  }, [filterResource, token]);
+
   // Filter resources based on search
   const filteredResources = useMemo(() => {
     let filtered = resources;
     
     if (filterResource) {
       filtered = filtered.filter(resource => 
+        searchMatches.has(resource.id) ||
         resource.name.toLowerCase().includes(filterResource.toLowerCase()) ||
         resource.email.toLowerCase().includes(filterResource.toLowerCase())
       );
@@ -332,7 +354,7 @@ const AdvancedSchedulingGrid = ({ currentWeek, onWeekChange }) => {
     }
     
     return filtered;
-  }, [resources, filterResource, showConflictsOnly, conflicts]);
+  }, [resources, filterResource, searchMatches, showConflictsOnly, conflicts]);
 
   const getCellStyles = (shift, hasConflict, dateInfo) => {
     let baseClasses = "border border-slate-300 p-1 text-center cursor-pointer transition-all duration-200 ";
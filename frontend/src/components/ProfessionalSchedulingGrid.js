@@ -27,6 +27,8 @@ const ProfessionalSchedulingGrid = ({ currentWeek, onWeekChange }) => {
   const [timeSlots, setTimeSlots] = useState([]);
   const [shifts, setShifts] = useState([]);
   const [loading, setLoading] = useState(true);
+  // Version of the week the grid shows: sent as If-Match so edits based on a stale grid get 409
+  const [weekVersion, setWeekVersion] = useState(0);
   const [weekDates, setWeekDates] = useState([]);
   const [selectedCell, setSelectedCell] = useState(null);
   const [showAddModal, setShowAddModal] = useState(false);
@@ -142,17 +144,36 @@ const ProfessionalSchedulingGrid = ({ currentWeek, onWeekChange }) => {
   const fetchAllData = async () => {
     setLoading(true);
     try {
-      const [resourcesRes, timeSlotsRes, shiftsRes] = await Promise.all([
-        axios.get(`${API}/resources`, { headers: { Authorization: `Bearer ${token}` } }),
-        axios.get(`${API}/timeslots`, { headers: { Authorization: `Bearer ${token}` } }),
-        axios.get(`${API}/shifts?week=${currentWeek.week}&year=${currentWeek.year}`, {
-          headers: { Authorization: `Bearer ${token}` }
-        })
-      ]);
-
-      setResources(resourcesRes.data);
-      setTimeSlots(timeSlotsRes.data.sort((a, b) => a.start_time.localeCompare(b.start_time)));
-      setShifts(shiftsRes.data);
+      // One bundle (resources, slots, resource x day matrix) instead of three requests
+      const { data } = await axios.get(`${API}/grid/${currentWeek.year}/${currentWeek.week}`, {
+        headers: { Authorization: `Bearer ${token}` }
+      });
+
+      // Expand the compact matrix into the shift objects the grid works with
+      const bundleShifts = [];
+      data.resources.forEach((resource, row) => {
+        data.shifts[row].forEach((cell, day) => {
+          if (!cell || data.matrix[row][day] < 0) return;
+          const [id, hours, overtime_hours, extra_overtime_hours] = cell;
+          bundleShifts.push({
+            id,
+            resource_id: resource.id,
+            time_slot_id: data.time_slots[data.matrix[row][day]].id,
+            date: data.days[day],
+            week_number: data.week_number,
+            year: data.year,
+            hours,
+            overtime_hours,
+            extra_overtime_hours,
+            resource: { id: resource.id, name: resource.name, email: resource.email }
+          });
+        });
+      });
+
+      setResources(data.resources);
+      setTimeSlots(data.time_slots);
+      setShifts(bundleShifts);
+      setWeekVersion(data.version);
     } catch (error) {
       console.error('Failed to fetch data:', error);
       toast.error('Errore nel caricamento dei dati: ' + (error.response?.data?.detail || error.message));
@@ -166,6 +187,12 @@ const ProfessionalSchedulingGrid = ({ currentWeek, onWeekChange }) => {
     return shifts.filter(s => s.date === date && s.time_slot_id === timeSlotId);
   }, [shifts]);
 
+  // Availability of a resource on a date ("available", "partial" or "unavailable")
+  const getAvailability = (resource, date) => {
+    const dayIndex = weekDates.findIndex(d => d.date === date);
+    return resource.availability?.[dayIndex] || 'available';
+  };
+
   // Get color for time slot
   const getTimeSlotColor = (timeSlotId) => {
     return timeSlotColors[timeSlotId] || '#f1f5f9'; // default to slate-100
@@ -209,8 +236,9 @@ const ProfessionalSchedulingGrid = ({ currentWeek, onWeekChange }) => {
         year: currentWeek.year,
         extra_overtime_hours: extraOvertimeHours || 0
       }, {
-        headers: { Authorization: `Bearer ${token}` }
+        headers: { Authorization: `Bearer ${token}`, 'If-Match': `"${weekVersion}"` }
       });
+      setWeekVersion(parseInt(response.headers['x-week-version'], 10));
 
       const resource = resources.find(r => r.id === selectedResource);
       const timeSlot = timeSlots.find(ts => ts.id === selectedCell.timeSlotId);
@@ -231,20 +259,27 @@ const ProfessionalSchedulingGrid = ({ currentWeek, onWeekChange }) => {
     } catch (error) {
       console.error('Failed to create shift:', error);
       toast.error(error.response?.data?.detail || 'Errore nell\'assegnazione del turno');
+      if (error.response?.status === 409) fetchAllData();
     }
   };
 
   const removeShift = async (shiftId) => {
     try {
-      await axios.delete(`${API}/shifts/${shiftId}`, {
-        headers: { Authorization: `Bearer ${token}` }
+      const response = await axios.delete(`${API}/shifts/${shiftId}`, {
+        headers: { Authorization: `Bearer ${token}`, 'If-Match': `"${weekVersion}"` }
       });
+      setWeekVersion(parseInt(response.headers['x-week-version'], 10));
 
       setShifts(prev => prev.filter(s => s.id !== shiftId));
       toast.success('Turno rimosso');
     } catch (error) {
       console.error('Failed to delete shift:', error);
-      toast.error('Errore nella rimozione del turno');
+      if (error.response?.status === 409) {
+        toast.error(error.response.data.detail);
+        fetchAllData();
+      } else {
+        toast.error('Errore nella rimozione del turno');
+      }
     }
   };
 
@@ -497,11 +532,21 @@ const ProfessionalSchedulingGrid = ({ currentWeek, onWeekChange }) => {
                 className="form-select w-full"
               >
                 <option value="">Seleziona una risorsa...</option>
-                {resources.map(resource => (
-                  <option key={resource.id} value={resource.id}>
-                    {resource.name} ({resource.email})
-                  </option>
-                ))}
+                {resources.map(resource => {
+                  const availability = getAvailability(resource, selectedCell?.date);
+                  return (
+                    <option
+                      key={resource.id}
+                      value={resource.id}
+                      disabled={availability === 'unavailable'}
+                      className={availability === 'available' ? '' : 'text-slate-400'}
+                    >
+                      {`${resource.name} (${resource.email})${
+                        availability === 'unavailable' ? ' - assente' : availability === 'partial' ? ' - assente in parte' : ''
+                      }`}
+                    </option>
+                  );
+                })}
               </select>
             </div>
             
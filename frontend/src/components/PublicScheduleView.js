@@ -116,25 +116,16 @@ const PublicScheduleView = () => {
     if (showLoading) setLoading(true);
     
     try {
-      // Get all published shifts for all users (admin view) or just employee shifts
+      // Get all published shifts for all users (admin view) or the published snapshot of the week
       const endpoint = user?.role === 'ADMIN' 
         ? `shifts?week=${currentWeek.week}&year=${currentWeek.year}`
-        : `employee/shifts`;
+        : `employee/shifts/${currentWeek.week}/${currentWeek.year}`;
         
       const response = await axios.get(`${API}/${endpoint}`, {
         headers: { Authorization: `Bearer ${token}` }
       });
       
-      let shiftsData = response.data;
-      
-      // Filter by current week if employee (employee endpoint returns all published shifts)
-      if (user?.role === 'EMPLOYEE') {
-        shiftsData = shiftsData.filter(shift => 
-          shift.week_number === currentWeek.week && shift.year === currentWeek.year
-        );
-      }
-      
-      setShifts(shiftsData);
+      setShifts(response.data);
       setLastUpdated(new Date());
     } catch (error) {
       console.error('Failed to fetch published shifts:', error);
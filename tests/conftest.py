@@ -0,0 +1,186 @@
+"""
+Shared fixtures: the real backend served by uvicorn (one or several worker processes)
+on a throwaway database, driven over HTTP with the standard library only, and the
+server module imported in-process for tests of its internals.
+"""
+
+import importlib
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from datetime import date, datetime, time as clock, timedelta
+from pathlib import Path
+
+import pytest
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+ADMIN_CREDENTIALS = {"username": "admin", "password": "NUOVA_PASSWORD_ADMIN"}
+# Cheap scrypt cost so logins do not dominate the timings
+TEST_ENV = {"PASSWORD_SCRYPT_N": "1024", "PASSWORD_HASH_WORKERS": "1", "BACKUP_INTERVAL_HOURS": "0", "MAIL_TRANSPORT": ""}
+# Size of the site the performance budgets are measured on
+LARGE_SITE_RESOURCES = 1000
+LARGE_SITE_YEAR = 2024
+LARGE_SITE_SLOTS = [("ts-001", clock(6), clock(14)), ("ts-002", clock(8), clock(16)), ("ts-003", clock(14), clock(22)),
+                    ("ts-004", clock(16), clock(23, 59)), ("ts-005", clock(22), clock(6))]
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+class ApiResponse:
+    def __init__(self, status: int, headers, body: bytes):
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+    def json(self):
+        return json.loads(self.body)
+
+class LiveServer:
+    """uvicorn server:app with `workers` processes; every request opens a new connection, so
+    consecutive requests are spread over the workers by the kernel"""
+    def __init__(self, directory: Path, workers: int, env: dict):
+        directory.mkdir(parents=True, exist_ok=True)
+        self.workers = workers
+        self.database_file = directory / "planshift.db"
+        self.port = free_port()
+        self.base_url = f"http://127.0.0.1:{self.port}/api"
+        self.log = open(directory / "server.log", "w")
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "server:app", "--port", str(self.port), "--workers", str(workers), "--log-level", "warning"],
+            cwd=BACKEND_DIR, stdout=self.log, stderr=subprocess.STDOUT,
+            env={**os.environ, **TEST_ENV, "DATABASE_FILE": str(self.database_file), **env}
+        )
+        self._wait_ready()
+
+    def _wait_ready(self, timeout: float = 60):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"server exited with {self.process.returncode}, see {self.log.name}")
+            try:
+                self.request("GET", "/timeslots")
+                # Give the other workers time to finish their startup too
+                time.sleep(0.5 * self.workers)
+                return
+            except OSError:
+                time.sleep(0.2)
+        raise RuntimeError("server did not start")
+
+    def request(self, method: str, path: str, body=None, token: str = None, headers: dict = None) -> ApiResponse:
+        request = urllib.request.Request(self.base_url + path, method=method, data=json.dumps(body).encode() if body is not None else None)
+        request.add_header("Content-Type", "application/json")
+        if token:
+            request.add_header("Authorization", f"Bearer {token}")
+        for name, value in (headers or {}).items():
+            request.add_header(name, value)
+        try:
+            with urllib.request.urlopen(request, timeout=120) as response:
+                return ApiResponse(response.status, response.headers, response.read())
+        except urllib.error.HTTPError as e:
+            return ApiResponse(e.code, e.headers, e.read())
+
+    def admin_token(self) -> str:
+        """Default data (admin user, time slots) and an admin token"""
+        assert self.request("POST", "/admin/init-data").status == 200
+        response = self.request("POST", "/auth/login", ADMIN_CREDENTIALS)
+        assert response.status == 200, response.body
+        return response.json()["token"]
+
+    def stop(self):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+        self.log.close()
+
+@pytest.fixture
+def live_server(tmp_path):
+    """Factory: live_server(workers=4, **env) starts a server on its own database"""
+    servers = []
+
+    def start(workers: int = 1, **env) -> LiveServer:
+        server = LiveServer(tmp_path / f"server{len(servers)}", workers, env)
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.stop()
+
+@pytest.fixture(scope="session")
+def backend(tmp_path_factory):
+    """The server module imported in this process, on a throwaway database"""
+    os.environ.update(TEST_ENV)
+    os.environ["DATABASE_FILE"] = str(tmp_path_factory.mktemp("backend") / "planshift.db")
+    sys.path.insert(0, str(BACKEND_DIR))
+    return importlib.import_module("server")
+
+@pytest.fixture(scope="session")
+def large_site(backend, tmp_path_factory):
+    """Sessionmaker of a site database with LARGE_SITE_RESOURCES people working five days a week,
+    on a slot rotating weekly, through LARGE_SITE_YEAR; one in ten is absent for two weeks"""
+    engine = backend.create_sqlite_engine(str(tmp_path_factory.mktemp("large_site") / "site.db"))
+    backend.run_migrations(engine)
+    sessionmaker = backend.sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    session = sessionmaker()
+    for slot_id, start, end in LARGE_SITE_SLOTS:
+        session.add(backend.TimeSlotDB(id=slot_id, name=slot_id, start_time=start, end_time=end))
+        for weekday in range(7):
+            session.add(backend.CoverageTargetDB(time_slot_id=slot_id, weekday=weekday, required=150))
+    session.commit()
+
+    first = date(LARGE_SITE_YEAR, 1, 1)
+    days = [first + timedelta(days=offset) for offset in range((date(LARGE_SITE_YEAR, 12, 31) - first).days + 1)]
+    minutes = [backend.calculate_shift_minutes(start.strftime("%H:%M"), end.strftime("%H:%M")) for _, start, end in LARGE_SITE_SLOTS]
+    created = datetime(LARGE_SITE_YEAR - 1, 12, 1).strftime("%Y-%m-%d %H:%M:%S.%f")
+    resources, shifts, absences = [], [], []
+    for index in range(LARGE_SITE_RESOURCES):
+        resource_id = f"r{index:04d}"
+        resources.append((resource_id, f"Persona {index}", f"persona{index}@x.it", created))
+        for offset, day in enumerate(days):
+            if (offset + index) % 7 < 5:
+                slot = (index + offset // 7) % len(LARGE_SITE_SLOTS)
+                week_number, year = backend.iso_week(day)
+                shifts.append((f"{resource_id}-{offset}", resource_id, LARGE_SITE_SLOTS[slot][0], day.isoformat(), week_number, year, minutes[slot], created))
+        if index % 10 == 0:
+            start = datetime.combine(first + timedelta(days=index % 300), clock.min)
+            absences.append((f"{resource_id}-absence", resource_id, start.strftime("%Y-%m-%d %H:%M:%S.%f"),
+                             (start + timedelta(days=14)).strftime("%Y-%m-%d %H:%M:%S.%f"), "VACATION", created))
+    conn = session.connection()
+    conn.exec_driver_sql(
+        "INSERT INTO resources (id, name, email, weekly_hour_limit, min_rest_hours, is_active, created_at) VALUES (?, ?, ?, 40, 12, 1, ?)", resources
+    )
+    conn.exec_driver_sql(
+        "INSERT INTO shifts (id, resource_id, time_slot_id, date, week_number, year, minutes, overtime_minutes, extra_overtime_minutes, created_at) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, 0, 0, ?)", shifts
+    )
+    conn.exec_driver_sql(
+        "INSERT INTO unavailabilities (id, resource_id, start_at, end_at, reason, created_at) VALUES (?, ?, ?, ?, ?, ?)", absences
+    )
+    session.commit()
+    conn = session.connection()
+    conn.exec_driver_sql("ANALYZE")
+    session.close()
+    yield sessionmaker
+    engine.dispose()
+
+@pytest.fixture
+def best_time():
+    """best_time(function, runs=5): fastest of several timed calls in seconds, plus the last result"""
+    def measure(function, runs: int = 5):
+        timings, result = [], None
+        for _ in range(runs):
+            started = time.perf_counter()
+            result = function()
+            timings.append(time.perf_counter() - started)
+        return min(timings), result
+    return measure
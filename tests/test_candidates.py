@@ -0,0 +1,71 @@
+"""
+Candidates for one shift among 1000 resources with a year of shifts: everyone is either
+ranked or excluded for a reason, and the search stays within an interactive budget, with
+and without rolling limits set.
+"""
+
+from datetime import date
+
+import pytest
+
+from .conftest import LARGE_SITE_RESOURCES
+
+BUDGET_SECONDS = 0.05
+SHIFT_DATE = date(2024, 6, 12)
+
+def find_candidates(backend, session):
+    time_slot = session.query(backend.TimeSlotDB).filter(backend.TimeSlotDB.id == "ts-002").one()
+    return backend.find_shift_candidates(session, SHIFT_DATE, time_slot)
+
+def test_candidates_within_budget(backend, large_site, best_time):
+    session = large_site()
+    try:
+        elapsed, result = best_time(lambda: find_candidates(backend, session))
+        working = session.connection().exec_driver_sql("SELECT COUNT(*) FROM shifts WHERE date = ?", (SHIFT_DATE.isoformat(),)).scalar()
+    finally:
+        session.close()
+
+    assert result["excluded"]["already_assigned"] == working
+    assert len(result["candidates"]) + sum(result["excluded"].values()) == LARGE_SITE_RESOURCES
+    assert result["excluded"]["rolling_limits"] == 0
+    hours = [candidate["remaining_weekly_hours"] for candidate in result["candidates"]]
+    assert hours == sorted(hours, reverse=True)
+    assert elapsed < BUDGET_SECONDS, f"candidates took {elapsed * 1000:.1f}ms"
+
+@pytest.fixture
+def limited_site(large_site):
+    """The large site with every rolling limit set on everyone, at most five days in a row for half of them (restored afterwards)"""
+    session = large_site()
+    session.connection().exec_driver_sql(
+        "UPDATE resources SET max_avg_hours_4_weeks = 44, max_avg_hours_17_weeks = 44, "
+        "max_consecutive_days = CASE WHEN rowid % 2 = 0 THEN 5 ELSE 6 END"
+    )
+    session.commit()
+    yield session
+    session.connection().exec_driver_sql("UPDATE resources SET max_avg_hours_4_weeks = NULL, max_avg_hours_17_weeks = NULL, max_consecutive_days = NULL")
+    session.commit()
+    session.close()
+
+def test_candidates_with_rolling_limits_within_budget(backend, limited_site, best_time):
+    elapsed, result = best_time(lambda: find_candidates(backend, limited_site))
+
+    # Everyone works five days a week: a day off next to the run is a sixth day in a row
+    assert result["excluded"]["rolling_limits"] > 0 and result["candidates"]
+    assert len(result["candidates"]) + sum(result["excluded"].values()) == LARGE_SITE_RESOURCES
+    assert elapsed < BUDGET_SECONDS, f"candidates with rolling limits took {elapsed * 1000:.1f}ms"
+
+    # A shift on the candidate's other day off joins two runs: seen at once, not served from a stale load
+    time_slot = limited_site.query(backend.TimeSlotDB).filter(backend.TimeSlotDB.id == "ts-002").one()
+    candidate = result["candidates"][0]["resource_id"]
+    worked = {day for (day,) in limited_site.query(backend.ShiftDB.date).filter(backend.ShiftDB.resource_id == candidate)}
+    day = next(day for day in (date(2024, 6, 11), date(2024, 6, 13)) if day not in worked)
+    week_number, year = backend.iso_week(day)
+    limited_site.add(backend.ShiftDB(resource_id=candidate, time_slot_id="ts-002", date=day, week_number=week_number, year=year, minutes=480))
+    limited_site.commit()
+    try:
+        after = backend.find_shift_candidates(limited_site, SHIFT_DATE, time_slot)
+        assert candidate not in {entry["resource_id"] for entry in after["candidates"]}
+        assert after["excluded"]["rolling_limits"] == result["excluded"]["rolling_limits"] + 1
+    finally:
+        limited_site.query(backend.ShiftDB).filter(backend.ShiftDB.resource_id == candidate, backend.ShiftDB.date == day).delete()
+        limited_site.commit()
@@ -0,0 +1,51 @@
+"""
+Conditional GETs on versioned endpoints: one validator per content coding, Vary on every
+200 and 304, and a new ETag once the data behind the response changes.
+"""
+
+import gzip
+
+import pytest
+
+@pytest.fixture
+def server(live_server):
+    server = live_server()
+    server.token = server.admin_token()
+    # Enough resources for a body the middleware compresses
+    for i in range(30):
+        server.request("POST", "/resources", {"name": f"Persona {i}", "email": f"persona{i}@x.it"}, token=server.token)
+    return server
+
+def get(server, path: str, **headers):
+    return server.request("GET", path, token=server.token, headers=headers)
+
+@pytest.mark.parametrize("path", ["/resources", "/timeslots"])
+def test_each_encoding_has_its_own_etag(server, path):
+    identity = get(server, path, **{"Accept-Encoding": "identity"})
+    compressed = get(server, path, **{"Accept-Encoding": "gzip"})
+
+    assert identity.headers["ETag"] != compressed.headers["ETag"]
+    assert compressed.headers["ETag"].endswith('-gzip"')
+    for response in (identity, compressed):
+        assert response.headers["Vary"] == "Accept-Encoding"
+    if compressed.headers.get("Content-Encoding") == "gzip":
+        assert gzip.decompress(compressed.body) == identity.body
+
+    for encoding, response in (("identity", identity), ("gzip", compressed)):
+        not_modified = get(server, path, **{"Accept-Encoding": encoding, "If-None-Match": response.headers["ETag"]})
+        assert not_modified.status == 304
+        assert not_modified.headers["ETag"] == response.headers["ETag"]
+        assert not_modified.headers["Vary"] == "Accept-Encoding"
+
+    # A validator of one encoding never revalidates the other
+    assert get(server, path, **{"Accept-Encoding": "gzip", "If-None-Match": identity.headers["ETag"]}).status == 200
+    assert get(server, path, **{"Accept-Encoding": "identity", "If-None-Match": compressed.headers["ETag"]}).status == 200
+
+def test_writes_change_the_etag(server):
+    before = get(server, "/resources", **{"Accept-Encoding": "gzip"})
+    server.request("POST", "/resources", {"name": "Nuova", "email": "nuova@x.it"}, token=server.token)
+
+    after = get(server, "/resources", **{"Accept-Encoding": "gzip", "If-None-Match": before.headers["ETag"]})
+
+    assert after.status == 200
+    assert after.headers["ETag"] != before.headers["ETag"]
@@ -0,0 +1,27 @@
+"""
+Coverage gaps over a full year for 1000 resources: totals match a plain count of the shifts,
+and the computation stays well under a second.
+"""
+
+from collections import Counter
+from datetime import date
+
+from .conftest import LARGE_SITE_RESOURCES, LARGE_SITE_SLOTS, LARGE_SITE_YEAR
+
+BUDGET_SECONDS = 1.0
+
+def test_year_of_coverage_gaps_within_budget(backend, large_site, best_time):
+    session = large_site()
+    try:
+        elapsed, gaps = best_time(lambda: backend.compute_coverage_gaps(session, date(LARGE_SITE_YEAR, 1, 1), date(LARGE_SITE_YEAR, 12, 31)), runs=3)
+        staffed = Counter(session.connection().exec_driver_sql("SELECT date, time_slot_id FROM shifts").fetchall())
+    finally:
+        session.close()
+
+    cells = 366 * len(LARGE_SITE_SLOTS)
+    assert len(staffed) == cells
+    assert sum(staffed.values()) > LARGE_SITE_RESOURCES * 250
+    assert gaps["total_shortfall"] == sum(max(0, 150 - count) for count in staffed.values())
+    assert gaps["total_overstaffing"] == sum(max(0, count - 150) for count in staffed.values())
+    assert gaps["understaffed_cells"] + gaps["overstaffed_cells"] == len(gaps["gaps"])
+    assert elapsed < BUDGET_SECONDS, f"coverage gaps for a year took {elapsed:.3f}s"
@@ -0,0 +1,78 @@
+"""
+Week grid bundle: one row per active resource (or resource with a shift that week), slot
+indexes per day, the week version, archived weeks read like live ones, and reads repeated
+when a commit lands while they run.
+"""
+
+from datetime import date, datetime, time, timedelta
+
+import pytest
+
+WEEK, YEAR = 11, 2025
+MONDAY = date.fromisocalendar(YEAR, WEEK, 1)
+
+@pytest.fixture
+def db(backend):
+    """Anna works Monday morning and Wednesday afternoon, is away on Friday; Bruno (inactive) works Tuesday"""
+    session = backend.SessionLocal()
+    for model in (backend.ShiftArchiveDB, backend.ShiftDB, backend.UnavailabilityDB, backend.TimeSlotDB, backend.ResourceDB):
+        session.query(model).delete()
+    session.connection().exec_driver_sql("DELETE FROM week_versions")
+    session.add(backend.TimeSlotDB(id="ts-002", name="Mattino", start_time=time(8), end_time=time(16)))
+    session.add(backend.TimeSlotDB(id="ts-003", name="Pomeriggio", start_time=time(14), end_time=time(22)))
+    session.add(backend.ResourceDB(id="anna", name="Anna", email="a@x.it", weekly_hour_limit=40))
+    session.add(backend.ResourceDB(id="bruno", name="Bruno", email="b@x.it", weekly_hour_limit=40, is_active=False))
+    session.add(backend.ResourceDB(id="carla", name="Carla", email="c@x.it", weekly_hour_limit=40, is_active=False))
+    for resource_id, offset, slot_id in (("anna", 0, "ts-002"), ("anna", 2, "ts-003"), ("bruno", 1, "ts-002")):
+        session.add(backend.ShiftDB(id=f"{resource_id}-{offset}", resource_id=resource_id, time_slot_id=slot_id,
+                                    date=MONDAY + timedelta(days=offset), week_number=WEEK, year=YEAR, minutes=480, overtime_minutes=60))
+    session.add(backend.UnavailabilityDB(resource_id="anna", start_at=datetime.combine(MONDAY + timedelta(days=4), time.min),
+                                         end_at=datetime.combine(MONDAY + timedelta(days=5), time.min)))
+    session.commit()
+    backend.bump_week_versions(session, [(WEEK, YEAR)])
+    session.commit()
+    yield session
+    session.close()
+
+def build(backend, db) -> dict:
+    return backend.build_grid_bundle(db, WEEK, YEAR, MONDAY)
+
+def test_bundle_shape(backend, db):
+    bundle = build(backend, db)
+
+    assert bundle["days"] == [(MONDAY + timedelta(days=offset)).isoformat() for offset in range(7)]
+    assert [slot["id"] for slot in bundle["time_slots"]] == ["ts-002", "ts-003"]
+    # Carla is inactive without shifts this week
+    assert [resource["id"] for resource in bundle["resources"]] == ["anna", "bruno"]
+    assert bundle["matrix"] == [[0, -1, 1, -1, -1, -1, -1], [-1, 0, -1, -1, -1, -1, -1]]
+    assert bundle["shift_fields"] == ["id", "hours", "overtime_hours", "extra_overtime_hours"]
+    assert bundle["shifts"][0][0] == ["anna-0", 8.0, 1.0, 0.0]
+    assert bundle["shifts"][0][1] is None
+    anna = bundle["resources"][0]
+    assert (anna["shifts"], anna["hours"], anna["overtime_hours"]) == (2, 16.0, 2.0)
+    assert anna["availability"] == ["available"] * 4 + ["unavailable"] + ["available"] * 2
+    assert bundle["version"] == backend.week_version(db, WEEK, YEAR) == 1
+
+def test_archived_week_reads_like_a_live_one(backend, db):
+    live = build(backend, db)
+
+    assert backend.archive_week(db, WEEK, YEAR) == 3
+    archived = build(backend, db)
+
+    assert archived["version"] == live["version"] + 1
+    assert {key: value for key, value in archived.items() if key != "version"} == \
+        {key: value for key, value in live.items() if key != "version"}
+
+def test_reads_repeat_when_a_commit_lands_in_between(backend, db, monkeypatch):
+    # The data versions move on between the first pair of checks only
+    calls = []
+    versions = iter([(1,), (2,), (2,), (2,)])
+    def get_data_versions(session, *scopes):
+        calls.append(scopes)
+        return next(versions)
+    monkeypatch.setattr(backend, "get_data_versions", get_data_versions)
+
+    bundle = build(backend, db)
+
+    assert len(calls) == 4
+    assert [resource["id"] for resource in bundle["resources"]] == ["anna", "bruno"]
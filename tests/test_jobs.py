@@ -0,0 +1,63 @@
+"""
+Background job runner: a kind at its concurrency limit leaves its jobs queued instead of
+holding pool threads, so jobs of other kinds still start.
+"""
+
+import threading
+import time
+
+import pytest
+
+@pytest.fixture
+def runner(backend, monkeypatch):
+    """Two-thread runner with a "slow" kind limited to one job at a time, held until released"""
+    release = threading.Event()
+    monkeypatch.setitem(backend.JOB_CONCURRENCY, "slow", 1)
+    monkeypatch.setitem(backend.JOB_HANDLERS, "slow", lambda context: release.wait(30) and "slow done")
+    monkeypatch.setitem(backend.JOB_HANDLERS, "quick", lambda context: "quick done")
+    runner = backend.JobRunner(2)
+    runner.release = release
+    yield runner
+    release.set()
+    runner._executor.shutdown(wait=True)
+
+def status(backend, job_id: str) -> str:
+    session = backend.SessionLocal()
+    try:
+        return session.query(backend.JobDB.status).filter(backend.JobDB.id == job_id).scalar()
+    finally:
+        session.close()
+
+def wait_for(backend, job_id: str, expected: str, timeout: float = 10) -> str:
+    deadline = time.monotonic() + timeout
+    while (current := status(backend, job_id)) != expected and time.monotonic() < deadline:
+        time.sleep(0.05)
+    return current
+
+def test_limited_kind_does_not_hold_the_pool(backend, runner):
+    first = runner.enqueue("slow").id
+    assert wait_for(backend, first, "running") == "running"
+    second = runner.enqueue("slow").id
+    quick = runner.enqueue("quick").id
+
+    # The second slow job is parked, so the free thread runs the quick one
+    assert wait_for(backend, quick, "succeeded") == "succeeded"
+    assert status(backend, second) == "queued"
+
+    runner.release.set()
+    assert wait_for(backend, first, "succeeded") == "succeeded"
+    assert wait_for(backend, second, "succeeded") == "succeeded"
+
+def test_parked_job_cancelled_before_its_turn_does_not_block_the_next(backend, runner):
+    first = runner.enqueue("slow").id
+    assert wait_for(backend, first, "running") == "running"
+    cancelled, last = runner.enqueue("slow").id, runner.enqueue("slow").id
+
+    session = backend.SessionLocal()
+    session.query(backend.JobDB).filter(backend.JobDB.id == cancelled).update({"status": "cancelled", "cancel_requested": True})
+    session.commit()
+    session.close()
+    runner.release.set()
+
+    assert wait_for(backend, last, "succeeded") == "succeeded"
+    assert status(backend, cancelled) == "cancelled"
@@ -0,0 +1,42 @@
+"""
+100 concurrent logins at the production scrypt cost: every one succeeds, and since the key
+derivation runs on the hashing pool the event loop keeps answering other requests meanwhile.
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .conftest import ADMIN_CREDENTIALS
+
+LOGINS = 100
+# A request waiting behind the key derivations would take seconds
+MAX_PROBE_SECONDS = 0.5
+
+def test_concurrent_logins_keep_the_server_responsive(live_server):
+    server = live_server(PASSWORD_SCRYPT_N="16384")
+    server.admin_token()
+
+    done = threading.Event()
+    probes = []
+    def probe():
+        while not done.is_set():
+            started = time.perf_counter()
+            server.request("GET", "/timeslots")
+            probes.append(time.perf_counter() - started)
+            time.sleep(0.02)
+
+    prober = threading.Thread(target=probe)
+    prober.start()
+    try:
+        with ThreadPoolExecutor(LOGINS) as pool:
+            responses = list(pool.map(lambda _: server.request("POST", "/auth/login", ADMIN_CREDENTIALS), range(LOGINS)))
+    finally:
+        done.set()
+        prober.join()
+
+    assert [response.status for response in responses] == [200] * LOGINS
+    assert all(response.json()["token"] for response in responses)
+    assert server.request("POST", "/auth/login", {**ADMIN_CREDENTIALS, "password": "sbagliata"}).status == 401
+    assert len(probes) >= 10
+    assert max(probes) < MAX_PROBE_SECONDS, f"slowest probe {max(probes):.3f}s over {len(probes)} probes"
@@ -0,0 +1,68 @@
+"""
+Migrations applied to a database created before versioned migrations existed: the DECIMAL hour
+columns of shifts become integer minutes (migration 003) and a second run applies nothing.
+"""
+
+import pytest
+from sqlalchemy import create_engine
+
+# shifts as created before migration 003
+BASELINE_SHIFTS = """
+    CREATE TABLE shifts (
+        id VARCHAR(36) NOT NULL PRIMARY KEY,
+        resource_id VARCHAR(36) NOT NULL,
+        time_slot_id VARCHAR(36) NOT NULL,
+        date DATE NOT NULL,
+        week_number INTEGER NOT NULL,
+        year INTEGER NOT NULL,
+        hours DECIMAL(4, 2) NOT NULL,
+        overtime_hours DECIMAL(4, 2),
+        extra_overtime_hours DECIMAL(4, 2),
+        created_at DATETIME
+    )
+"""
+BASELINE_ROWS = [
+    # id, hours, overtime_hours, extra_overtime_hours -> minutes, overtime_minutes, extra_overtime_minutes
+    ("s-full", 8.0, 0.0, 0.0, (480, 0, 0)),
+    ("s-half", 7.5, 1.5, 0.25, (450, 90, 15)),
+    ("s-rounded", 7.99, 1.33, None, (479, 80, 0)),
+    ("s-null", 6.0, None, None, (360, 0, 0)),
+]
+
+@pytest.fixture
+def baseline(backend, tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'baseline.db'}")
+    with engine.begin() as conn:
+        conn.exec_driver_sql(BASELINE_SHIFTS)
+        conn.exec_driver_sql("CREATE INDEX idx_shifts_resource_date ON shifts (resource_id, date)")
+        for shift_id, hours, overtime, extra, _ in BASELINE_ROWS:
+            conn.exec_driver_sql(
+                "INSERT INTO shifts (id, resource_id, time_slot_id, date, week_number, year, hours, overtime_hours, extra_overtime_hours, created_at) "
+                "VALUES (?, ?, 'ts-002', '2024-09-16', 38, 2024, ?, ?, ?, '2024-09-01 10:00:00')",
+                (shift_id, f"r-{shift_id}", hours, overtime, extra)
+            )
+    yield engine
+    engine.dispose()
+
+def test_hour_columns_become_integer_minutes(backend, baseline):
+    assert backend.run_migrations(baseline) == [version for version, _, _ in backend.MIGRATIONS]
+
+    with baseline.connect() as conn:
+        columns = {row[1]: row[2] for row in conn.exec_driver_sql("PRAGMA table_info(shifts)")}
+        rows = {row[0]: tuple(row[1:]) for row in conn.exec_driver_sql(
+            "SELECT id, minutes, overtime_minutes, extra_overtime_minutes FROM shifts"
+        )}
+        indexes = {row[1] for row in conn.exec_driver_sql("PRAGMA index_list(shifts)")}
+        leftovers = conn.exec_driver_sql("SELECT name FROM sqlite_master WHERE name = 'shifts_decimal'").fetchall()
+
+    assert "hours" not in columns and columns["minutes"] == "INTEGER"
+    assert rows == {shift_id: expected for shift_id, _, _, _, expected in BASELINE_ROWS}
+    # The baseline resource/date index ends up replaced by its covering version (migration 018)
+    assert {"idx_shifts_resource_date_minutes", "idx_shifts_resource_week_year", "idx_shifts_time_slot_date"} <= indexes
+    assert "idx_shifts_resource_date" not in indexes
+    assert leftovers == []
+
+def test_second_run_applies_nothing(backend, baseline):
+    backend.run_migrations(baseline)
+
+    assert backend.run_migrations(baseline) == []
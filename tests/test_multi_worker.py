@@ -0,0 +1,66 @@
+"""
+Multi-worker deployment: in-process caches (principals, time slots, resources) must never serve
+data older than a write committed by another worker, and N workers should not serve fewer
+requests than one.
+"""
+
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+WORKERS = 4
+
+def test_writes_are_visible_to_every_worker(live_server):
+    server = live_server(workers=WORKERS)
+    token = server.admin_token()
+
+    stale_reads = 0
+    for i in range(20):
+        # Warm the caches of whichever workers answer, then write through another request
+        assert server.request("GET", "/resources", token=token).status == 200
+        assert server.request("GET", "/resources?week=11&year=2025", token=token).status == 200
+        resource = server.request("POST", "/resources", {"name": f"R{i}", "email": f"r{i}@x.it"}, token=token).json()
+        renamed = server.request("PUT", f"/resources/{resource['id']}", {"name": f"R{i}-renamed", "email": f"r{i}@x.it"}, token=token)
+        assert renamed.status == 200
+        for path in ("/resources", "/resources?week=11&year=2025"):
+            for _ in range(3):
+                names = {entry["name"] for entry in server.request("GET", path, token=token).json()}
+                stale_reads += f"R{i}-renamed" not in names
+
+    for i in range(10):
+        assert server.request("GET", "/timeslots", token=token).status == 200
+        renamed = server.request("PUT", "/timeslots/ts-001", {"name": f"Mattino Presto {i}", "start_time": "06:00", "end_time": "14:00"}, token=token)
+        assert renamed.status == 200, renamed.body
+        for _ in range(3):
+            names = {slot["name"] for slot in server.request("GET", "/timeslots", token=token).json()}
+            stale_reads += f"Mattino Presto {i}" not in names
+
+    assert stale_reads == 0
+
+def throughput(server, token: str, requests: int = 600, clients: int = 16) -> float:
+    def get(_):
+        return server.request("GET", "/timeslots", token=token).status
+
+    server.request("GET", "/timeslots", token=token)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(clients) as pool:
+        statuses = list(pool.map(get, range(requests)))
+    elapsed = time.perf_counter() - started
+    assert statuses == [200] * requests
+    return requests / elapsed
+
+def test_throughput_one_vs_many_workers(live_server):
+    single = live_server(workers=1)
+    single_rps = throughput(single, single.admin_token())
+    single.stop()
+
+    multi = live_server(workers=WORKERS)
+    multi_rps = throughput(multi, multi.admin_token())
+
+    print(f"\nGET /timeslots: 1 worker {single_rps:.0f} req/s, {WORKERS} workers {multi_rps:.0f} req/s "
+          f"({multi_rps / single_rps:.2f}x on {os.cpu_count()} CPUs)")
+    if (os.cpu_count() or 1) < WORKERS:
+        pytest.skip(f"speed-up needs at least {WORKERS} CPUs (measured {multi_rps / single_rps:.2f}x)")
+    assert multi_rps > single_rps
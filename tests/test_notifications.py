@@ -0,0 +1,187 @@
+"""
+Publish notifications delivered through SMTPTransport to a local SMTP sink: batching over one
+connection, per-recipient failures retried with backoff, dead letters, and the lease that
+lets another dispatcher pick up a batch abandoned by one that died.
+"""
+
+import asyncio
+import socketserver
+import threading
+from datetime import date, datetime, time, timedelta
+from email import message_from_bytes
+
+import pytest
+from starlette.requests import Request
+
+WEEK, YEAR = 11, 2025
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    """Minimal SMTP server on 127.0.0.1 keeping every accepted message; RCPT to `reject` gets 550"""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), SMTPSinkHandler)
+        self.messages = []
+        self.connections = 0
+        self.reject = set()
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+class SMTPSinkHandler(socketserver.StreamRequestHandler):
+    def reply(self, line: str):
+        self.wfile.write(line.encode() + b"\r\n")
+
+    def handle(self):
+        self.server.connections += 1
+        self.reply("220 sink ESMTP")
+        recipients = []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode().strip()
+            verb = command[:4].upper()
+            if verb in ("EHLO", "HELO"):
+                self.reply("250 sink")
+            elif verb in ("MAIL", "RSET"):
+                recipients = []
+                self.reply("250 OK")
+            elif verb == "RCPT":
+                address = command.split(":", 1)[1].strip().strip("<>")
+                if address in self.server.reject:
+                    self.reply("550 No such user")
+                else:
+                    recipients.append(address)
+                    self.reply("250 OK")
+            elif verb == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                data = b""
+                for data_line in iter(self.rfile.readline, b""):
+                    if data_line == b".\r\n":
+                        break
+                    data += data_line[1:] if data_line.startswith(b"..") else data_line
+                self.server.messages.append((recipients, message_from_bytes(data)))
+                self.reply("250 OK")
+            elif verb == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 Command not implemented")
+
+@pytest.fixture
+def sink(monkeypatch):
+    server = SMTPSink()
+    monkeypatch.setenv("SMTP_HOST", "127.0.0.1")
+    monkeypatch.setenv("SMTP_PORT", str(server.port))
+    yield server
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def db(backend):
+    """Site session on an emptied schedule: three resources, two of them working in WEEK"""
+    session = backend.SessionLocal()
+    for model in (backend.NotificationDB, backend.NotificationEventDB, backend.PublishedSnapshotDB, backend.PublicationDB,
+                  backend.WeeklyPlanDB, backend.ShiftDB, backend.TimeSlotDB, backend.ResourceDB, backend.UserDB):
+        session.query(model).delete()
+    session.add(backend.UserDB(id="admin-001", username="admin", email="admin@x.it", password="-", full_name="Admin", role=backend.UserRole.ADMIN))
+    session.add(backend.TimeSlotDB(id="ts-002", name="Mattino", start_time=time(8), end_time=time(16)))
+    for index in range(3):
+        session.add(backend.ResourceDB(id=f"r{index}", name=f"Persona {index}", email=f"p{index}@x.it"))
+    for index in range(2):
+        session.add(backend.ShiftDB(resource_id=f"r{index}", time_slot_id="ts-002", date=date.fromisocalendar(YEAR, WEEK, 1),
+                                    week_number=WEEK, year=YEAR, minutes=480))
+    session.commit()
+    yield session
+    session.close()
+
+def publish(backend, db):
+    admin = backend.User(id="admin-001", username="admin", email="admin@x.it", full_name="Admin",
+                         role=backend.UserRole.ADMIN, created_at=datetime.utcnow(), is_active=True)
+    request = Request({"type": "http", "method": "POST", "path": "/", "headers": []})
+    return asyncio.run(backend.publish_weekly_plan(WEEK, YEAR, request, admin_user=admin, db=db))
+
+def make_due(backend, db):
+    db.query(backend.NotificationDB).filter(backend.NotificationDB.status.in_(["pending", "sending"])).update(
+        {"next_attempt_at": datetime.utcnow() - timedelta(seconds=1)}, synchronize_session=False
+    )
+    db.commit()
+
+def test_publish_sends_one_message_per_changed_person_over_one_connection(backend, db, sink):
+    assert publish(backend, db)["changes"]["added"] == 2
+
+    totals = backend.dispatch_site_notifications(db, backend.SMTPTransport())
+
+    assert totals["created"] == 2 and totals["sent"] == 2 and totals["batches"] == 1
+    assert sink.connections == 1
+    assert sorted(recipients[0] for recipients, _ in sink.messages) == ["p0@x.it", "p1@x.it"]
+    _, message = sink.messages[0]
+    assert message["Subject"] == f"Turni settimana {WEEK}/{YEAR} aggiornati"
+    assert "I tuoi turni:" in message.get_payload(decode=True).decode()
+    assert {status for (status,) in db.query(backend.NotificationDB.status)} == {"sent"}
+
+    # Publishing again without changes notifies nobody
+    publish(backend, db)
+    assert backend.dispatch_site_notifications(db, backend.SMTPTransport())["created"] == 0
+
+def test_refused_recipient_is_retried_with_backoff_then_dead_lettered(backend, db, sink):
+    sink.reject.add("p1@x.it")
+    publish(backend, db)
+    transport = backend.SMTPTransport()
+
+    first = backend.dispatch_site_notifications(db, transport)
+    assert first["sent"] == 1 and first["failed"] == 1
+    refused = db.query(backend.NotificationDB).filter(backend.NotificationDB.recipient == "p1@x.it").one()
+    assert refused.status == "pending" and refused.attempts == 1 and "No such user" in refused.last_error
+    delay = (refused.next_attempt_at - datetime.utcnow()).total_seconds()
+    assert backend.NOTIFY_RETRY_SECONDS - 5 < delay <= backend.NOTIFY_RETRY_SECONDS
+
+    # Not due yet: nothing is sent
+    assert backend.deliver_notifications(db, transport) == {"sent": 0, "failed": 0, "dead": 0}
+
+    for attempt in range(2, backend.NOTIFY_MAX_ATTEMPTS + 1):
+        make_due(backend, db)
+        result = backend.deliver_notifications(db, transport)
+        db.refresh(refused)
+        assert refused.attempts == attempt
+        if attempt < backend.NOTIFY_MAX_ATTEMPTS:
+            # The delay doubles after every failure
+            delay = (refused.next_attempt_at - datetime.utcnow()).total_seconds()
+            assert delay > backend.NOTIFY_RETRY_SECONDS * 2 ** (attempt - 1) - 5
+            assert result["failed"] == 1
+    assert result["dead"] == 1 and refused.status == "dead"
+    assert len(sink.messages) == 1
+
+def test_unreachable_server_fails_the_whole_batch(backend, db, sink):
+    publish(backend, db)
+    transport = backend.SMTPTransport()
+    transport.port = sink.port
+    sink.shutdown()
+    sink.server_close()
+
+    result = backend.dispatch_site_notifications(db, transport)
+
+    assert result["sent"] == 0 and result["failed"] == 2
+    notifications = db.query(backend.NotificationDB).all()
+    assert all(n.status == "pending" and n.attempts == 1 and "ConnectionRefusedError" in n.last_error for n in notifications)
+
+def test_batch_of_a_dead_dispatcher_is_reclaimed_after_its_lease(backend, db, sink):
+    publish(backend, db)
+    backend.fan_out_notification_events(db)
+    # Another dispatcher claimed the batch and died before sending it
+    db.query(backend.NotificationDB).update({
+        "status": "sending", "claim": "dead-dispatcher",
+        "next_attempt_at": datetime.utcnow() + timedelta(seconds=backend.NOTIFY_LEASE_SECONDS)
+    }, synchronize_session=False)
+    db.commit()
+    transport = backend.SMTPTransport()
+
+    assert backend.deliver_notifications(db, transport)["sent"] == 0
+
+    make_due(backend, db)
+    assert backend.deliver_notifications(db, transport)["sent"] == 2
+    assert len(sink.messages) == 2
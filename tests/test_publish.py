@@ -0,0 +1,102 @@
+"""
+Publishing freezes a week into a snapshot: employees read the snapshot, so edits made after a
+publish stay invisible to them until the week is published again.
+"""
+
+import gzip
+from datetime import date, timedelta
+
+import pytest
+
+WEEK, YEAR = 11, 2025
+DAYS = [(date.fromisocalendar(YEAR, WEEK, 1) + timedelta(days=offset)).isoformat() for offset in range(7)]
+
+@pytest.fixture
+def server(live_server):
+    server = live_server()
+    server.token = server.admin_token()
+    server.resources = [server.request("POST", "/resources", {"name": f"R{i}", "email": f"r{i}@x.it"}, token=server.token).json()["id"]
+                        for i in range(3)]
+    return server
+
+def add_shift(server, resource_id: str, day: str, time_slot_id: str = "ts-002") -> dict:
+    body = {"resource_id": resource_id, "time_slot_id": time_slot_id, "date": day, "week_number": WEEK, "year": YEAR}
+    response = server.request("POST", "/shifts", body, token=server.token)
+    assert response.status == 200, response.body
+    return response.json()
+
+def publish(server) -> dict:
+    response = server.request("POST", f"/weekly-plans/publish?week_number={WEEK}&year={YEAR}", token=server.token)
+    assert response.status == 200, response.body
+    return response.json()
+
+def employee_week(server, **headers):
+    return server.request("GET", f"/employee/shifts/{WEEK}/{YEAR}", token=server.token, headers=headers)
+
+def test_employees_see_the_published_snapshot_not_later_edits(server):
+    first, second, _ = server.resources
+    add_shift(server, first, DAYS[0])
+    assert employee_week(server).json() == []
+
+    published = publish(server)
+    assert published["snapshot_version"] == 1 and published["shift_count"] == 1
+    assert published["changes"] == {"added": 1, "removed": 0, "moved": 0}
+
+    # An edit after the publish is live for planners only
+    add_shift(server, second, DAYS[1])
+    response = employee_week(server)
+    assert response.headers["X-Snapshot-Version"] == "1"
+    assert [(shift["resource_id"], shift["date"]) for shift in response.json()] == [(first, DAYS[0])]
+    assert len(server.request("GET", "/employee/shifts", token=server.token).json()) == 1
+
+    assert publish(server)["snapshot_version"] == 2
+    response = employee_week(server)
+    assert response.headers["X-Snapshot-Version"] == "2"
+    assert {(shift["resource_id"], shift["date"]) for shift in response.json()} == {(first, DAYS[0]), (second, DAYS[1])}
+
+def test_gzip_and_identity_have_their_own_validators(server):
+    add_shift(server, server.resources[0], DAYS[0])
+    publish(server)
+
+    identity = employee_week(server, **{"Accept-Encoding": "identity"})
+    compressed = employee_week(server, **{"Accept-Encoding": "gzip"})
+    refused = employee_week(server, **{"Accept-Encoding": "gzip;q=0"})
+
+    assert compressed.headers["Content-Encoding"] == "gzip"
+    assert gzip.decompress(compressed.body) == identity.body == refused.body
+    assert refused.headers.get("Content-Encoding") is None
+    assert compressed.headers["ETag"] != identity.headers["ETag"] == refused.headers["ETag"]
+    for response in (identity, compressed):
+        assert "Accept-Encoding" in response.headers["Vary"]
+
+    not_modified = employee_week(server, **{"Accept-Encoding": "gzip", "If-None-Match": compressed.headers["ETag"]})
+    assert not_modified.status == 304 and "Accept-Encoding" in not_modified.headers["Vary"]
+    # The identity validator does not match the gzip representation
+    assert employee_week(server, **{"Accept-Encoding": "gzip", "If-None-Match": identity.headers["ETag"]}).status == 200
+
+def test_changes_after_a_republish(server):
+    first, second, third = server.resources
+    dropped = add_shift(server, first, DAYS[0])
+    kept = add_shift(server, second, DAYS[0])
+    rescheduled = add_shift(server, third, DAYS[1])
+    publish(server)
+
+    assert server.request("DELETE", f"/shifts/{dropped['id']}", token=server.token).status == 200
+    assert server.request("DELETE", f"/shifts/{rescheduled['id']}", token=server.token).status == 200
+    afternoon = add_shift(server, third, DAYS[1], "ts-003")
+    added = add_shift(server, first, DAYS[2])
+    assert publish(server)["changes"] == {"added": 1, "removed": 1, "moved": 1}
+
+    changes = server.request("GET", f"/employee/shifts/{WEEK}/{YEAR}/changes?since=1", token=server.token).json()
+    assert (changes["from_version"], changes["to_version"]) == (1, 2)
+    assert [shift["id"] for shift in changes["added"]] == [added["id"]]
+    assert [shift["id"] for shift in changes["removed"]] == [dropped["id"]]
+    assert [(move["previous_id"], move["shift"]["id"], move["shift"]["time_slot_id"]) for move in changes["moved"]] == \
+        [(rescheduled["id"], afternoon["id"], "ts-003")]
+
+    # From scratch every shift of the latest version is new; the latest version has no changes
+    from_scratch = server.request("GET", f"/employee/shifts/{WEEK}/{YEAR}/changes?since=0", token=server.token).json()
+    assert {shift["id"] for shift in from_scratch["added"]} == {kept["id"], afternoon["id"], added["id"]}
+    latest = server.request("GET", f"/employee/shifts/{WEEK}/{YEAR}/changes?since=2", token=server.token).json()
+    assert latest["added"] == latest["removed"] == latest["moved"] == []
+    assert server.request("GET", f"/employee/shifts/{WEEK}/{YEAR}/changes?since=3", token=server.token).status == 404
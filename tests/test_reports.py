@@ -0,0 +1,43 @@
+"""
+Reports read archived weeks too: the overview and the resource report are the same before
+and after the weeks they cover move into the shift archive.
+"""
+
+from datetime import datetime, time, timedelta, timezone
+
+import pytest
+
+@pytest.fixture
+def db(backend):
+    """One resource working the first three days of the current week and of two weeks ago"""
+    session = backend.SessionLocal()
+    for model in (backend.ShiftArchiveDB, backend.ShiftDB, backend.TimeSlotDB, backend.ResourceDB):
+        session.query(model).delete()
+    session.add(backend.TimeSlotDB(id="ts-002", name="Mattino", start_time=time(8), end_time=time(16)))
+    session.add(backend.ResourceDB(id="anna", name="Anna", email="a@x.it", weekly_hour_limit=40))
+    # Reports are relative to the UTC date
+    today = datetime.now(timezone.utc).date()
+    monday = today - timedelta(days=today.weekday())
+    for first in (monday - timedelta(weeks=2), monday):
+        for offset in range(3):
+            day = first + timedelta(days=offset)
+            week_number, year = backend.iso_week(day)
+            session.add(backend.ShiftDB(resource_id="anna", time_slot_id="ts-002", date=day, week_number=week_number, year=year,
+                                        minutes=480, overtime_minutes=30))
+    session.commit()
+    yield session
+    session.close()
+
+def test_reports_include_archived_weeks(backend, db):
+    overview = backend.compute_reports_overview(db)
+    resource = backend.compute_resource_report(db, "anna")
+
+    assert backend.archive_old_weeks(db, 1)["archived_shifts"] == 3
+    assert db.query(backend.ShiftDB).count() == 3
+
+    assert backend.compute_reports_overview(db) == overview
+    assert backend.compute_resource_report(db, "anna") == resource
+    assert resource["totals"]["total_shifts"] == 6
+    assert sum(week["shifts"] for week in resource["weekly_breakdown"]) == 6
+    assert resource["time_slot_preferences"] == {"Mattino": 6}
+    assert sum(week["total_shifts"] for week in overview["weekly_trends"]) == 6
@@ -0,0 +1,57 @@
+"""
+Schedule over a date range: spans of up to a quarter, one row per active resource, and day
+totals that add up to the shifts in the range.
+"""
+
+from collections import Counter
+from datetime import date
+
+import pytest
+
+from .conftest import LARGE_SITE_RESOURCES
+
+@pytest.fixture
+def server(live_server):
+    server = live_server()
+    server.token = server.admin_token()
+    return server
+
+RANGES = [
+    # from, to, status: 92 days at most, in order, valid dates
+    ("2025-01-01", "2025-01-01", 200),
+    ("2025-01-01", "2025-04-02", 200),
+    ("2025-01-01", "2025-04-03", 400),
+    ("2025-01-02", "2025-01-01", 400),
+    ("2025-01-01", "2025-02-30", 400),
+]
+
+def test_range_limits(server):
+    for start, end, status in RANGES:
+        response = server.request("GET", f"/schedule/range?from={start}&to={end}", token=server.token)
+
+        assert response.status == status, (start, end, response.body)
+        if status == 200:
+            body = response.json()
+            assert (body["days"][0], body["days"][-1]) == (start, end)
+            assert len(body["daily_totals"]) == len(body["days"])
+
+def test_quarter_totals(backend, large_site):
+    start, end = date(2024, 4, 1), date(2024, 6, 30)
+    session = large_site()
+    try:
+        result = backend.compute_schedule_range(session, start, end)
+        rows = session.connection().exec_driver_sql(
+            "SELECT resource_id, date, minutes FROM shifts WHERE date >= ? AND date <= ?", (start.isoformat(), end.isoformat())
+        ).fetchall()
+    finally:
+        session.close()
+
+    per_day = Counter(day for _, day, _ in rows)
+    per_resource = Counter(resource_id for resource_id, _, _ in rows)
+    assert len(result["days"]) == 91
+    assert len(result["resources"]) == LARGE_SITE_RESOURCES
+    assert result["total_shifts"] == len(rows)
+    assert result["total_hours"] == round(sum(minutes for _, _, minutes in rows) / 60, 2)
+    assert [total["shifts"] for total in result["daily_totals"]] == [per_day[day] for day in result["days"]]
+    for entry in result["resources"]:
+        assert entry["shifts"] == per_resource[entry["id"]] == sum(cell is not None for cell in entry["cells"])
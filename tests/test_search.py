@@ -0,0 +1,27 @@
+"""
+Resource search among 1000 people: prefix matches on every word, accent-insensitive, and
+under a millisecond for a query that narrows down to a few people (every name here starts
+with "Persona", so that word alone matches the whole site).
+"""
+
+import pytest
+
+BUDGET_SECONDS = 0.001
+
+@pytest.mark.parametrize("text, expected", [
+    ("12", {f"Persona {n}" for n in [12, *range(120, 130)]}),
+    ("999", {"Persona 999"}),
+    ("PERSONA99@", {f"Persona {n}" for n in [99, *range(990, 1000)]}),
+    ("pèrsona999", {"Persona 999"}),
+])
+def test_search_within_budget(backend, large_site, best_time, text, expected):
+    session = large_site()
+    try:
+        match = backend.fts_prefix_query(text)
+        elapsed, resources = best_time(lambda: backend.search_resources(session, match, backend.SEARCH_MAX_RESULTS), runs=20)
+    finally:
+        session.close()
+
+    names = {resource["name"] for resource in resources}
+    assert names == expected
+    assert elapsed < BUDGET_SECONDS, f"searching {text!r} took {elapsed * 1000:.3f}ms"
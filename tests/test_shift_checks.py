@@ -0,0 +1,72 @@
+"""
+Shift candidates and schedule simulations apply the same checks as create_shift: rolling
+limits (here the consecutive-day cap) and archived weeks.
+"""
+
+import asyncio
+import gzip
+import json
+from datetime import date, time
+
+import pytest
+from fastapi import HTTPException
+
+WEEK, YEAR = 11, 2025
+
+@pytest.fixture
+def db(backend):
+    """Emptied schedule: "capped" works Mon-Wed of WEEK with at most 3 consecutive days, "free" has no limits"""
+    session = backend.SessionLocal()
+    for model in (backend.ShiftArchiveDB, backend.ShiftDB, backend.TimeSlotDB, backend.ResourceDB):
+        session.query(model).delete()
+    session.add(backend.TimeSlotDB(id="ts-002", name="Mattino", start_time=time(8), end_time=time(16)))
+    session.add(backend.ResourceDB(id="capped", name="Capped", email="c@x.it", weekly_hour_limit=60, max_consecutive_days=3))
+    session.add(backend.ResourceDB(id="free", name="Free", email="f@x.it", weekly_hour_limit=60))
+    for weekday in range(1, 4):
+        session.add(backend.ShiftDB(resource_id="capped", time_slot_id="ts-002", date=date.fromisocalendar(YEAR, WEEK, weekday),
+                                    week_number=WEEK, year=YEAR, minutes=480))
+    session.commit()
+    yield session
+    session.close()
+
+def day(weekday: int, week: int = WEEK) -> date:
+    return date.fromisocalendar(YEAR, week, weekday)
+
+def simulate(backend, db, *changes):
+    return backend.ScheduleSimulation(db, [backend.ScheduleChange(**change) for change in changes]).run()
+
+def test_candidates_exclude_resources_over_a_rolling_limit(backend, db):
+    slot = db.get(backend.TimeSlotDB, "ts-002")
+
+    thursday = backend.find_shift_candidates(db, day(4), slot)
+    assert [candidate["resource_id"] for candidate in thursday["candidates"]] == ["free"]
+    assert thursday["excluded"]["rolling_limits"] == 1
+
+    # A free day breaks the run
+    friday = backend.find_shift_candidates(db, day(5), slot)
+    assert sorted(candidate["resource_id"] for candidate in friday["candidates"]) == ["capped", "free"]
+
+def test_simulation_checks_rolling_limits_on_the_simulated_state(backend, db):
+    add = {"action": "add", "resource_id": "capped", "time_slot_id": "ts-002"}
+
+    result = simulate(backend, db, {**add, "date": day(5).isoformat()}, {**add, "date": day(4).isoformat()})
+    assert not result["valid"]
+    assert all("giorni lavorativi consecutivi" in change["violations"][0] for change in result["changes"])
+
+    # Removing Tuesday in the same change set leaves runs of one and two days
+    tuesday = db.query(backend.ShiftDB.id).filter(backend.ShiftDB.date == day(2)).scalar()
+    result = simulate(backend, db, {"action": "remove", "shift_id": tuesday}, {**add, "date": day(4).isoformat()})
+    assert result["valid"]
+
+def test_archived_weeks_are_rejected(backend, db):
+    db.add(backend.ShiftArchiveDB(week_number=WEEK + 1, year=YEAR, first_date=day(1, WEEK + 1), last_date=day(7, WEEK + 1),
+                                  shift_count=0, total_minutes=0, total_overtime_minutes=0, payload=gzip.compress(json.dumps([]).encode())))
+    db.commit()
+
+    result = simulate(backend, db, {"action": "add", "resource_id": "free", "time_slot_id": "ts-002", "date": day(2, WEEK + 1).isoformat()})
+    assert not result["changes"][0]["applied"]
+    assert result["changes"][0]["error"] == "La settimana è archiviata e non può essere modificata"
+
+    with pytest.raises(HTTPException) as rejected:
+        asyncio.run(backend.get_shift_candidates(day(2, WEEK + 1).isoformat(), "ts-002", admin_user=None, db=db))
+    assert rejected.value.status_code == 400
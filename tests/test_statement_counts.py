@@ -0,0 +1,75 @@
+"""
+Bulk maintenance runs a fixed number of SQL statements: provisioning employee users, resetting
+passwords, changing the status of many resources and deleting a resource with a year of
+shifts cost the same on a site of 10 people as on one of 10,000.
+"""
+
+import asyncio
+from datetime import date, timedelta
+
+from sqlalchemy import event
+
+SIZES = (10, 10_000)
+
+class StatementCounter:
+    def __init__(self, engine):
+        self.count = 0
+        event.listen(engine, "before_cursor_execute", self._count)
+
+    def _count(self, *args):
+        self.count += 1
+
+    def measure(self, function):
+        before = self.count
+        function()
+        return self.count - before
+
+def measure_site(backend, tmp_path, size: int) -> dict:
+    engine = backend.create_sqlite_engine(str(tmp_path / f"site-{size}.db"))
+    backend.run_migrations(engine)
+    # The target resource has a shift every day for as many days as the site has people (up to a year)
+    days = [date(2025, 1, 1) + timedelta(days=offset) for offset in range(min(size, 365))]
+    with engine.begin() as conn:
+        conn.exec_driver_sql(
+            "INSERT INTO resources (id, name, email, weekly_hour_limit, min_rest_hours, is_active) VALUES (?, ?, ?, 40, 11, 1)",
+            [(f"r{index}", f"Persona {index}", f"persona{index}@x.it") for index in range(size)]
+        )
+        conn.exec_driver_sql("INSERT INTO time_slots (id, name, start_time, end_time) VALUES ('ts-002', 'Mattino', '08:00:00', '16:00:00')")
+        conn.exec_driver_sql(
+            "INSERT INTO shifts (id, resource_id, time_slot_id, date, week_number, year, minutes, overtime_minutes, extra_overtime_minutes) "
+            "VALUES (?, 'r0', 'ts-002', ?, ?, ?, 480, 0, 0)",
+            [(f"s{day}", day.isoformat(), *backend.iso_week(day)) for day in days]
+        )
+
+    counter = StatementCounter(engine)
+    sessionmaker = backend.sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    main_db, db = sessionmaker(), sessionmaker()
+    resource_ids = [f"r{index}" for index in range(size)]
+    try:
+        def provision():
+            assert backend.insert_missing_employee_users(main_db, db, "main") == size
+            main_db.commit()
+
+        counts = {
+            "provision": counter.measure(provision),
+            "reset_passwords": counter.measure(lambda: backend.reset_default_passwords(main_db)),
+            "deactivate": counter.measure(lambda: asyncio.run(backend.update_resources_status(
+                backend.ResourceStatusUpdate(resource_ids=resource_ids, is_active=False), admin_user=None, db=db
+            ))),
+            "delete_resource": counter.measure(lambda: asyncio.run(backend.delete_resource("r0", admin_user=None, db=db))),
+        }
+        assert db.connection().exec_driver_sql("SELECT COUNT(*) FROM resources WHERE is_active = 1").scalar() == 0
+        assert db.connection().exec_driver_sql("SELECT COUNT(*) FROM shifts").scalar() == 0
+    finally:
+        main_db.close()
+        db.close()
+        engine.dispose()
+    return counts
+
+def test_statement_counts_do_not_grow_with_the_site(backend, tmp_path, monkeypatch):
+    # 20,000 scrypt hashes would dominate the run and are not what is measured here
+    monkeypatch.setattr(backend, "hash_passwords", lambda passwords: [f"hash-{index}" for index in range(len(passwords))])
+    small, large = (measure_site(backend, tmp_path, size) for size in SIZES)
+
+    assert large == small
+    assert all(count <= 10 for count in large.values()), large
@@ -0,0 +1,93 @@
+"""
+Undo and redo of schedule edits: each admin walks their own stack, replays honour If-Match on
+the week they touch, and shifts put back go through the checks of a new shift.
+"""
+
+from datetime import date, timedelta
+
+import pytest
+
+WEEK, YEAR = 11, 2025
+DAYS = [(date.fromisocalendar(YEAR, WEEK, 1) + timedelta(days=offset)).isoformat() for offset in range(7)]
+
+@pytest.fixture
+def server(live_server):
+    server = live_server()
+    server.token = server.admin_token()
+    server.resource = server.request("POST", "/resources", {"name": "Anna", "email": "anna@x.it"}, token=server.token).json()["id"]
+    return server
+
+def add_shift(server, day: str = DAYS[0]) -> dict:
+    body = {"resource_id": server.resource, "time_slot_id": "ts-002", "date": day, "week_number": WEEK, "year": YEAR}
+    response = server.request("POST", "/shifts", body, token=server.token)
+    assert response.status == 200, response.body
+    return response.json()
+
+def shift_ids(server) -> list:
+    return [shift["id"] for shift in server.request("GET", f"/shifts?week={WEEK}&year={YEAR}", token=server.token).json()]
+
+def test_undo_and_redo_round_trip(server):
+    created = add_shift(server)
+    assert server.request("DELETE", f"/shifts/{created['id']}", token=server.token).status == 200
+
+    undone = server.request("POST", "/schedule/undo", token=server.token)
+    assert undone.status == 200, undone.body
+    assert shift_ids(server) == [created["id"]]
+    assert undone.headers["X-Week-Version"]
+
+    assert server.request("POST", "/schedule/undo", token=server.token).status == 200
+    assert shift_ids(server) == []
+
+    assert server.request("POST", "/schedule/redo", token=server.token).status == 200
+    assert shift_ids(server) == [created["id"]]
+    assert server.request("POST", "/schedule/redo", token=server.token).status == 200
+    assert shift_ids(server) == []
+    assert server.request("POST", "/schedule/redo", token=server.token).status == 404
+
+def test_undo_after_the_resource_is_gone(server):
+    created = add_shift(server)
+    assert server.request("DELETE", f"/shifts/{created['id']}", token=server.token).status == 200
+    assert server.request("DELETE", f"/resources/{server.resource}", token=server.token).status == 200
+
+    response = server.request("POST", "/schedule/undo", token=server.token)
+
+    assert response.status == 409
+    assert "non più esistente" in response.json()["detail"]
+    # Refused, so still the next operation to undo
+    assert not any(operation["undone"] for operation in server.request("GET", "/schedule/journal", token=server.token).json())
+
+def test_each_admin_has_their_own_stack(server):
+    add_shift(server)
+    other = server.request("POST", "/auth/register", {
+        "username": "planner", "email": "planner@x.it", "password": "Planner-2025!", "role": "ADMIN", "full_name": "Planner"
+    })
+    assert other.status == 200, other.body
+    other_token = other.json()["token"]
+
+    assert server.request("POST", "/schedule/undo", token=other_token).status == 404
+    assert server.request("GET", "/schedule/journal", token=other_token).json() == []
+    assert len(shift_ids(server)) == 1
+
+def test_undo_honours_if_match(server):
+    created = add_shift(server)
+    deleted = server.request("DELETE", f"/shifts/{created['id']}", token=server.token)
+    version = int(deleted.headers["X-Week-Version"])
+
+    stale = server.request("POST", "/schedule/undo", token=server.token, headers={"If-Match": f'"{version - 1}"'})
+    assert stale.status == 409
+    assert stale.headers["X-Week-Version"] == str(version)
+
+    current = server.request("POST", "/schedule/undo", token=server.token, headers={"If-Match": f'"{version}"'})
+    assert current.status == 200, current.body
+    assert current.headers["X-Week-Version"] == str(version + 1)
+
+def test_undo_refuses_a_shift_over_a_new_absence(server):
+    created = add_shift(server)
+    assert server.request("DELETE", f"/shifts/{created['id']}", token=server.token).status == 200
+    absence = {"resource_id": server.resource, "start_date": DAYS[0], "end_date": DAYS[0], "reason": "VACATION"}
+    assert server.request("POST", "/unavailability", absence, token=server.token).status == 200
+
+    response = server.request("POST", "/schedule/undo", token=server.token)
+
+    assert response.status == 409
+    assert shift_ids(server) == []
@@ -0,0 +1,108 @@
+"""
+Parallel writers on one week, spread over several worker processes: claim_week must serialise
+them so that every accepted shift was checked against the state it was written on, stale
+If-Match versions get 409, and no writer ever sees a 5xx.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+import pytest
+
+WORKERS = 4
+WEEK, YEAR = 11, 2025
+DAYS = [(date.fromisocalendar(YEAR, WEEK, 1) + timedelta(days=offset)).isoformat() for offset in range(7)]
+
+@pytest.fixture
+def server(live_server):
+    server = live_server(workers=WORKERS)
+    server.token = server.admin_token()
+    return server
+
+def add_resources(server, count: int, **fields) -> list:
+    return [server.request("POST", "/resources", {"name": f"R{i}", "email": f"r{i}@x.it", **fields}, token=server.token).json()["id"]
+            for i in range(count)]
+
+def post_shift(server, resource_id: str, day: str, version=None):
+    body = {"resource_id": resource_id, "time_slot_id": "ts-002", "date": day, "week_number": WEEK, "year": YEAR}
+    return server.request("POST", "/shifts", body, token=server.token, headers={"If-Match": f'"{version}"'} if version is not None else None)
+
+def week_version(server) -> int:
+    return int(server.request("GET", f"/shifts?week={WEEK}&year={YEAR}", token=server.token).headers["X-Week-Version"])
+
+def week_shifts(server, resource_id: str) -> list:
+    shifts = server.request("GET", f"/shifts?week={WEEK}&year={YEAR}", token=server.token).json()
+    return [shift for shift in shifts if shift["resource_id"] == resource_id]
+
+def parallel(function, arguments, threads: int = 16) -> list:
+    with ThreadPoolExecutor(threads) as pool:
+        return list(pool.map(function, arguments))
+
+def test_one_writer_wins_the_same_cell(server):
+    [resource_id] = add_resources(server, 1)
+
+    statuses = [response.status for response in parallel(lambda _: post_shift(server, resource_id, DAYS[0]), range(16))]
+
+    assert max(statuses) < 500
+    assert statuses.count(200) == 1
+    assert len(week_shifts(server, resource_id)) == 1
+
+def test_parallel_shifts_of_one_person_get_sequential_overtime(server):
+    # 8h shifts against a 16h week: the k-th accepted shift carries max(0, 8k - 16) hours of overtime
+    [resource_id] = add_resources(server, 1, weekly_hour_limit=16)
+
+    def write_day(day: str) -> int:
+        # Losing a race to another writer is a 409 even without If-Match: retry on the new version
+        while True:
+            response = post_shift(server, resource_id, day)
+            if response.status != 409:
+                return response.status
+
+    statuses = parallel(write_day, DAYS * 3)
+
+    # One writer per day gets it, the others find the day taken
+    assert sorted(statuses) == [200] * len(DAYS) + [400] * len(DAYS) * 2
+    shifts = week_shifts(server, resource_id)
+    assert sorted(shift["overtime_hours"] for shift in shifts) == [max(0, 8 * k - 16) for k in range(1, len(DAYS) + 1)]
+
+def test_same_if_match_admits_one_writer(server):
+    resource_ids = add_resources(server, 16)
+    version = week_version(server)
+
+    statuses = [response.status for response in parallel(lambda resource_id: post_shift(server, resource_id, DAYS[2], version), resource_ids)]
+
+    assert sorted(statuses) == [200] + [409] * (len(resource_ids) - 1)
+    assert week_version(server) == version + 1
+
+def test_writers_retrying_on_conflict_all_succeed(server):
+    resource_ids = add_resources(server, 16)
+
+    def write_until_accepted(resource_id: str) -> int:
+        while True:
+            response = post_shift(server, resource_id, DAYS[4], week_version(server))
+            if response.status != 409:
+                return response.status
+
+    start = week_version(server)
+    assert parallel(write_until_accepted, resource_ids) == [200] * len(resource_ids)
+    assert week_version(server) == start + len(resource_ids)
+
+def test_delete_with_a_stale_version_conflicts(server):
+    [resource_id, other_id] = add_resources(server, 2)
+    version = week_version(server)
+    created = post_shift(server, resource_id, DAYS[0], version)
+    assert created.status == 200 and int(created.headers["X-Week-Version"]) == version + 1
+    assert post_shift(server, other_id, DAYS[0], version + 1).status == 200
+
+    stale = server.request("DELETE", f"/shifts/{created.json()['id']}", token=server.token, headers={"If-Match": f'"{version + 1}"'})
+
+    assert stale.status == 409
+    assert stale.headers["X-Week-Version"] == str(version + 2)
+    assert len(week_shifts(server, resource_id)) == 1
+
+def test_week_must_match_the_date(server):
+    [resource_id] = add_resources(server, 1)
+    body = {"resource_id": resource_id, "time_slot_id": "ts-002", "date": DAYS[0], "week_number": WEEK + 1, "year": YEAR}
+
+    assert server.request("POST", "/shifts", body, token=server.token).status == 400
+    assert week_shifts(server, resource_id) == []